@@ -1,6 +1,13 @@
 from operator import is_
 from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
+from .forms import ProductImportForm
 from .models import Category, Tag, Product, ProductDetail, Review, ProductReaction
+from .signals import products_bulk_updated
+from . import exporter, images, importer, search
+from .facets import PRICE_RANGES, price_range_q
 from django.utils.html import mark_safe
 
 # Register your models here.
@@ -11,29 +18,30 @@ class PriceRangeFilter(admin.SimpleListFilter):
     parameter_name = 'price_range'
 
     def lookups(self, request, model_admin):
-        return (
-            ('low', 'До 1000 руб.'),
-            ('medium', '1000-5000 руб.'),
-            ('high', '5000-10000 руб.'),
-            ('expensive', 'Свыше 10000 руб.'),
-        )
+        return tuple((value, label) for value, label, *_ in PRICE_RANGES)
 
     def queryset(self, request, queryset):
-        if self.value() == 'low':
-            return queryset.filter(price__lt=1000)
-        if self.value() == 'medium':
-            return queryset.filter(price__gte=1000, price__lt=5000)
-        if self.value() == 'high':
-            return queryset.filter(price__gte=5000, price__lt=10000)
-        if self.value() == 'expensive':
-            return queryset.filter(price__gte=10000)
+        if self.value():
+            condition = price_range_q(self.value())
+            if condition is not None:
+                return queryset.filter(condition)
+
+# Действия выгрузки выбранных объектов в файл (CSV/JSONL/XLSX), отдаётся потоково
+def export_actions(dataset):
+    def make_action(file_format):
+        def action(modeladmin, request, queryset):
+            return exporter.streaming_response(dataset, file_format, queryset)
+        action.__name__ = f'export_{file_format}'
+        return admin.action(description=f'Выгрузить выбранные в {file_format.upper()}')(action)
+    return [make_action(file_format) for file_format in exporter.FORMATS]
+
 
 # Регистрация моделей в админке
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    fields = ['name', 'slug', 'description']
+    fields = ['name', 'slug', 'description', 'menu_title', 'menu_position']
     prepopulated_fields = {'slug': ('name',)}
-    list_display = ('id', 'name')
+    list_display = ('id', 'name', 'menu_position')
     list_display_links = ('id', 'name')
 
 @admin.register(Tag)
@@ -64,10 +72,41 @@ class ProductAdmin(admin.ModelAdmin):
     ordering = ['-created_at', 'name']
     list_filter = ('category__name', 'is_published', PriceRangeFilter)
     list_per_page = 10
-    actions = ('set_published', 'set_draft')
+    actions = ('set_published', 'set_draft', *export_actions('products'))
     search_fields = ('name__startswith', 'category__name')
     filter_horizontal = ['tags']
 
+    # Импорт товаров из файла CSV/JSONL (кнопка на странице списка)
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='catalog_product_import'),
+            *super().get_urls(),
+        ]
+
+    def import_view(self, request):
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        result = None
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            result = importer.import_file(form.cleaned_data['file'], form.cleaned_data['format'])
+            self.message_user(request, f'Импорт завершён. {result}',
+                              messages.WARNING if result.error_count else messages.SUCCESS)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Импорт товаров',
+            'form': form,
+            'result': result,
+        }
+        return TemplateResponse(request, 'admin/catalog/product/import_products.html', context)
+
+    # Полнотекстовый поиск по индексу вместо поиска по началу названия
+    def get_search_results(self, request, queryset, search_term):
+        if search_term and search.is_available() and search.build_match_query(search_term):
+            return queryset.filter(pk__in=search.matching_ids_sql(search_term)), False
+        return super().get_search_results(request, queryset, search_term)
+
     # Методы для отображения в админке
     @admin.display(description='Длина названия')
     def name_length(self, obj):
@@ -80,18 +119,22 @@ class ProductAdmin(admin.ModelAdmin):
     @admin.display(description='Изображение товара')
     def image_preview(self, obj):
         if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" style="max-width: 100px; max-height: 100px;" />')
+            return mark_safe(f'<img src="{images.thumbnail_url(obj.image)}" style="max-width: 100px; max-height: 100px;" />')
         return 'Нет изображения товара'
 
     # Методы для действий в админке
     @admin.action(description='Опубликовать выбранные товары')
     def set_published(self, request, queryset):
+        product_ids = list(queryset.values_list('pk', flat=True))
         count = queryset.update(is_published=Product.Status.PUBLISHED)
+        products_bulk_updated.send(sender=Product, product_ids=product_ids)
         self.message_user(request, f'Опубликовано {count} товара(ов).')
     
     @admin.action(description='Снять с публикации выбранные товары')
     def set_draft(self, request, queryset):
+        product_ids = list(queryset.values_list('pk', flat=True))
         count = queryset.update(is_published=Product.Status.DRAFT)
+        products_bulk_updated.send(sender=Product, product_ids=product_ids)
         self.message_user(request, f'Снято с публикации {count} товара(ов)!', messages.WARNING)
 
 
@@ -115,6 +158,7 @@ class ReviewAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
     list_per_page = 20
     ordering = ['-created_at']
+    actions = export_actions('reviews')
     
     @admin.display(description='Текст отзыва')
     def text_preview(self, obj):
@@ -130,6 +174,7 @@ class ProductReactionAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
     list_per_page = 30
     ordering = ['-created_at']
+    actions = export_actions('reactions')
     
     @admin.display(description='Реакция')
     def reaction_type_display(self, obj):
@@ -1,7 +1,13 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
 
 
 class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalog'
     verbose_name = 'Каталог товаров'
+
+    def ready(self):
+        from . import reaction_buffer, signals  # noqa: F401
+
+        request_started.connect(reaction_buffer.start_on_request, dispatch_uid='catalog.reaction_buffer')
@@ -0,0 +1,267 @@
+"""
+Замеры производительности горячих страниц сайта (команда run_benchmarks).
+
+Сценарии (SCENARIOS) выполняются тестовым клиентом Django на текущей БД,
+обычно заполненной генератором catalog/dataset.py:
+  - index          - главная страница (IndexView)
+  - catalog        - первая страница каталога (CatalogView)
+  - catalog_deep   - глубокая страница каталога по курсору (?cursor=...)
+  - category       - самая большая категория (CategoryView)
+  - tag            - самый популярный тег (TagView)
+  - product        - самые популярные товары по лайкам, по очереди (ProductView)
+  - login          - вход по форме (LoginView, включая проверку пароля)
+
+Списки и товар запрашиваются от имени dataset.BENCHMARK_USER: авторизованным
+пользователям страницы собираются заново, без кэша страниц. С anonymous=True
+списки запрашиваются анонимно и отдаются из кэша страниц (catalog/page_cache.py).
+
+Для каждого сценария после прогрева измеряется время ответа (p50, p95,
+среднее), затем отдельными запросами - количество SQL-запросов и пиковый
+объём памяти, выделенной при обработке запроса (tracemalloc замедляет
+выполнение, поэтому на время не влияет). Результаты сохраняются в JSON,
+compare() сравнивает два прогона.
+"""
+
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from homepage.models import Collection
+from users.models import User
+
+from . import dataset
+from .models import Category, Product, ProductReaction, Review, Tag
+from .pagination import KeysetPaginator
+from .views import CatalogView
+
+# Адрес клиента не из INTERNAL_IPS: панель отладки не подключается и не искажает замеры
+CLIENT_ADDRESS = '192.0.2.1'
+
+# Сценарий: имя, метод, адреса (запрашиваются по очереди), данные формы,
+# от имени пользователя (иначе анонимно), ожидаемый статус ответа
+Scenario = namedtuple('Scenario', 'name method paths data authenticated status')
+
+SCENARIOS = ('index', 'catalog', 'catalog_deep', 'category', 'tag', 'product', 'login')
+
+# Показатели для сравнения прогонов: (ключ, заголовок)
+METRICS = (
+    ('p50_ms', 'p50, мс'),
+    ('p95_ms', 'p95, мс'),
+    ('queries', 'Запросов'),
+    ('peak_memory_kb', 'Память, КБ'),
+)
+
+
+class BenchmarkError(Exception):
+    """Сценарий нельзя выполнить (нет данных) или страница ответила ошибкой"""
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else 0
+
+
+def client_host():
+    """Имя хоста из ALLOWED_HOSTS, которое примет проверка заголовка Host"""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'testserver'
+
+
+def make_client(user=None):
+    client = Client(SERVER_NAME=client_host(), REMOTE_ADDR=CLIENT_ADDRESS)
+    if user is not None:
+        client.force_login(user)
+    return client
+
+
+# Сценарии
+def _deep_catalog_path(page_number):
+    """Адрес страницы каталога page_number: курсор строится по последнему товару предыдущей страницы"""
+    if page_number < 2:
+        return reverse('catalog')
+    per_page = CatalogView.paginate_by
+    paginator = KeysetPaginator(Product.published.all(), per_page, ordering=CatalogView.keyset_ordering)
+    offset = (page_number - 1) * per_page
+    last = Product.published.order_by(*CatalogView.keyset_ordering)[offset - 1:offset].first()
+    if last is None:
+        raise BenchmarkError(f'В каталоге меньше {page_number} страниц')
+    return f'{reverse("catalog")}?cursor={paginator.encode_cursor(last, "n")}'
+
+
+def build_scenarios(names=SCENARIOS, anonymous=False, deep_page=50, products=10):
+    """Сценарии с адресами, выбранными по текущим данным"""
+    published = Q(products__is_published=True)
+    builders = {
+        'index': lambda: [reverse('homepage')],
+        'catalog': lambda: [reverse('catalog')],
+        'catalog_deep': lambda: [_deep_catalog_path(deep_page)],
+        'category': lambda: [reverse('category', kwargs={'category_slug': slug}) for slug in
+                             Category.objects.annotate(total=Count('products', filter=published))
+                             .order_by('-total').values_list('slug', flat=True)[:1]],
+        'tag': lambda: [reverse('tag', kwargs={'tag_slug': slug}) for slug in
+                        Tag.objects.annotate(total=Count('products', filter=published))
+                        .order_by('-total').values_list('slug', flat=True)[:1]],
+        'product': lambda: [reverse('product', kwargs={'product_slug': slug}) for slug in
+                            Product.published.order_by('-likes_count').values_list('slug', flat=True)[:products]],
+        'login': lambda: [reverse('users:login')],
+    }
+
+    scenarios = []
+    for name in names:
+        paths = builders[name]()
+        if not paths:
+            raise BenchmarkError(f'Нет данных для сценария {name}, выполните generate_dataset')
+        if name == 'login':
+            scenarios.append(Scenario(name, 'post', paths,
+                                      {'username': dataset.BENCHMARK_USER, 'password': dataset.PASSWORD},
+                                      authenticated=False, status=302))
+        else:
+            scenarios.append(Scenario(name, 'get', paths, None,
+                                      authenticated=name == 'product' or not anonymous, status=200))
+    return scenarios
+
+
+# Замеры
+class _QueryCounter:
+    """
+    Обёртка выполнения SQL, считающая запросы (CaptureQueriesContext не
+    подходит: сигнал request_started очищает connection.queries)
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _request(client, scenario, number):
+    if not scenario.authenticated:
+        # Каждый анонимный запрос - новый посетитель без сессии
+        client.cookies.clear()
+    path = scenario.paths[number % len(scenario.paths)]
+    response = getattr(client, scenario.method)(path, scenario.data)
+    if response.status_code != scenario.status:
+        raise BenchmarkError(f'{scenario.name}: {path} ответил {response.status_code}, '
+                             f'ожидался {scenario.status}')
+    return response
+
+
+def measure(scenario, user, iterations=30, warmup=3):
+    """Замер одного сценария; возвращает словарь показателей"""
+    client = make_client(user if scenario.authenticated else None)
+    # Прогрев заполняет кэши данных и открывает соединение с БД
+    for number in range(warmup):
+        _request(client, scenario, number)
+
+    timings = []
+    for number in range(iterations):
+        started = time.perf_counter()
+        _request(client, scenario, number)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    queries = _QueryCounter()
+    with connection.execute_wrapper(queries):
+        _request(client, scenario, 0)
+
+    tracemalloc.start()
+    try:
+        _request(client, scenario, 0)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'path': scenario.paths[0],
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'min_ms': round(min(timings), 2),
+        'max_ms': round(max(timings), 2),
+        'queries': queries.count,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def dataset_summary():
+    return {
+        'categories': Category.objects.count(),
+        'tags': Tag.objects.count(),
+        'products': Product.objects.count(),
+        'published_products': Product.published.count(),
+        'users': User.objects.count(),
+        'reviews': Review.objects.count(),
+        'reactions': ProductReaction.objects.count(),
+        'collections': Collection.objects.count(),
+    }
+
+
+def run(names=SCENARIOS, iterations=30, warmup=3, anonymous=False, deep_page=50, progress=None):
+    """Выполняет сценарии и возвращает отчёт (сериализуемый в JSON)"""
+    user = User.objects.filter(username=dataset.BENCHMARK_USER).first()
+    if user is None:
+        raise BenchmarkError(f'Пользователь {dataset.BENCHMARK_USER} не найден, выполните generate_dataset')
+
+    report = {
+        'created_at': timezone.now().isoformat(),
+        'settings': {'iterations': iterations, 'warmup': warmup, 'anonymous': anonymous, 'deep_page': deep_page},
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'async_views': getattr(settings, 'ASYNC_VIEWS', False),
+        },
+        'dataset': dataset_summary(),
+        'scenarios': {},
+    }
+    for scenario in build_scenarios(names, anonymous=anonymous, deep_page=deep_page):
+        report['scenarios'][scenario.name] = result = measure(scenario, user, iterations, warmup)
+        if progress is not None:
+            progress(scenario.name, result)
+    return report
+
+
+# Хранение и сравнение
+def save(report, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def compare(baseline, report):
+    """
+    Изменения показателей общих сценариев двух отчётов:
+    {сценарий: {показатель: (было, стало, изменение в процентах или None)}}
+    """
+    changes = {}
+    for name, result in report['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        changes[name] = {}
+        for metric, _ in METRICS:
+            old, new = previous.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else None
+            changes[name][metric] = (old, new, change)
+    return changes
@@ -0,0 +1,106 @@
+"""
+Версионированный кэш приложения "catalog".
+
+Ключи кэшированных данных включают номер версии пространства имён.
+Чтобы сбросить все данные пространства, достаточно увеличить версию -
+старые записи просто перестают читаться и вытесняются по таймауту.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from monitoring import metrics, prometheus
+
+from .models import Category, Tag
+
+SIDEBAR = 'catalog:sidebar'
+MENU = 'catalog:menu'
+FACETS = 'catalog:facets'
+
+# Время жизни кэшированных данных (версии хранятся бессрочно)
+DATA_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(namespace):
+    return f'version:{namespace}'
+
+
+def get_version(namespace):
+    """Текущая версия пространства имён"""
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), 1, timeout=None)
+        version = cache.get(_version_key(namespace), 1)
+    return version
+
+
+def get_versions(*namespaces):
+    """Версии нескольких пространств имён одним обращением к кэшу"""
+    keys = [_version_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    return tuple(found.get(key) or get_version(namespace) for key, namespace in zip(keys, namespaces))
+
+
+async def aget_version(namespace):
+    """Асинхронный вариант get_version()"""
+    version = await cache.aget(_version_key(namespace))
+    if version is None:
+        await cache.aadd(_version_key(namespace), 1, timeout=None)
+        version = await cache.aget(_version_key(namespace), 1)
+    return version
+
+
+async def aget_versions(*namespaces):
+    """Асинхронный вариант get_versions()"""
+    keys = [_version_key(namespace) for namespace in namespaces]
+    found = await cache.aget_many(keys)
+    return tuple([found.get(key) or await aget_version(namespace) for key, namespace in zip(keys, namespaces)])
+
+
+def bump_version(*namespaces):
+    """
+    Увеличивает версию пространств имён, делая их кэш недействительным.
+    Возвращает новую версию последнего пространства.
+    """
+    version = None
+    for namespace in namespaces:
+        try:
+            version = cache.incr(_version_key(namespace))
+        except ValueError:
+            cache.add(_version_key(namespace), 2, timeout=None)
+            version = cache.get(_version_key(namespace), 2)
+    return version
+
+
+def get_or_set(namespace, name, loader, timeout=DATA_TIMEOUT):
+    """Возвращает данные текущей версии пространства, вычисляя их loader() при промахе"""
+    key = f'{namespace}:{name}:v{get_version(namespace)}'
+    data = cache.get(key)
+    if data is None:
+        prometheus.CACHE_REQUESTS.inc(cache=namespace, result='miss')
+        # Промах бывает раз на версию пространства, в бюджет представления не входит
+        with metrics.outside_budget():
+            data = loader()
+        cache.set(key, data, timeout)
+    else:
+        prometheus.CACHE_REQUESTS.inc(cache=namespace, result='hit')
+    return data
+
+
+# Данные боковых панелей каталога
+def _published_count():
+    return Count('products', filter=Q(products__is_published=True))
+
+
+def get_sidebar_categories():
+    """Категории с количеством опубликованных товаров (атрибут total)"""
+    return get_or_set(SIDEBAR, 'categories', lambda: list(
+        Category.objects.annotate(total=_published_count()).order_by('pk')
+    ))
+
+
+def get_sidebar_tags():
+    """Теги с количеством опубликованных товаров (атрибут total)"""
+    return get_or_set(SIDEBAR, 'tags', lambda: list(
+        Tag.objects.annotate(total=_published_count()).order_by('pk')
+    ))
@@ -0,0 +1,76 @@
+"""
+Денормализованные счётчики товара: лайки, дизлайки, отзывы и рейтинг.
+
+Все изменения выполняются одним UPDATE с F-выражениями, поэтому
+параллельные запросы не затирают значения друг друга. Средняя оценка
+пересчитывается в том же UPDATE из старых значений суммы и количества.
+"""
+
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf
+
+from .models import Product, ProductReaction, Review
+
+REACTION_FIELDS = {
+    ProductReaction.ReactionType.LIKE: 'likes_count',
+    ProductReaction.ReactionType.DISLIKE: 'dislikes_count',
+}
+
+
+def _rating_avg(rating_delta, count_delta):
+    return Coalesce(
+        Cast(F('rating_sum') + rating_delta, FloatField())
+        / NullIf(F('reviews_count') + count_delta, 0),
+        Value(0.0),
+    )
+
+
+def change_reactions(product_id, deltas):
+    """Изменяет счётчики реакций товара; deltas - словарь {тип реакции: изменение}"""
+    updates = {
+        REACTION_FIELDS[reaction_type]: Greatest(F(REACTION_FIELDS[reaction_type]) + delta, 0)
+        for reaction_type, delta in deltas.items() if delta
+    }
+    if updates:
+        Product.objects.filter(pk=product_id).update(**updates)
+
+
+def change_reviews(product_id, count=0, rating=0):
+    """Изменяет количество отзывов и сумму оценок товара, пересчитывая среднюю оценку"""
+    if not count and not rating:
+        return
+    Product.objects.filter(pk=product_id).update(
+        reviews_count=Greatest(F('reviews_count') + count, 0),
+        rating_sum=Greatest(F('rating_sum') + rating, 0),
+        rating_avg=_rating_avg(rating, count),
+    )
+
+
+def recount(queryset=None):
+    """
+    Пересчитывает все счётчики для товаров из queryset (по умолчанию - для всех)
+    одним UPDATE с подзапросами. Используется для исправления рассинхронизации.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+
+    def aggregate(model, expression, **filters):
+        return Coalesce(Subquery(
+            model.objects.filter(product=OuterRef('pk'), **filters)
+            .order_by().values('product').annotate(value=expression).values('value')
+        ), Value(0))
+
+    rating_sum = aggregate(Review, Sum('rating'))
+    reviews_count = aggregate(Review, Count('pk'))
+    return queryset.order_by().update(
+        likes_count=aggregate(ProductReaction, Count('pk'),
+                              reaction_type=ProductReaction.ReactionType.LIKE),
+        dislikes_count=aggregate(ProductReaction, Count('pk'),
+                                 reaction_type=ProductReaction.ReactionType.DISLIKE),
+        reviews_count=reviews_count,
+        rating_sum=rating_sum,
+        rating_avg=Coalesce(
+            Cast(rating_sum, FloatField()) / NullIf(reviews_count, 0),
+            Value(0.0),
+        ),
+    )
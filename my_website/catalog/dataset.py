@@ -0,0 +1,239 @@
+"""
+Генератор синтетического каталога для замеров производительности (команда
+generate_dataset, catalog/benchmarks.py).
+
+Создаёт категории, теги, товары с ProductDetail, пользователей, отзывы,
+реакции и коллекции главной страницы пачками bulk_create, поэтому сотни
+тысяч строк появляются за секунды. Популярность распределена по закону Ципфа:
+у немногих товаров и тегов большая часть отзывов и реакций, как на живом
+сайте. Все объекты получают slug и имена с префиксом PREFIX, по нему
+clear() удаляет прошлый набор. Генерация детерминирована при одинаковом seed.
+
+bulk_create не вызывает сигналы, поэтому после вставки счётчики товаров
+пересчитываются (catalog/counters.py), фасетный и поисковый индексы
+перестраиваются, а версии кэша данных и страниц увеличиваются.
+
+Пароль всех пользователей - PASSWORD (хэш вычисляется один раз). Пользователь
+с именем BENCHMARK_USER получает право просмотра страниц товаров.
+"""
+
+import itertools
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission
+from django.db import transaction
+from django.utils import timezone
+
+from homepage.models import Collection
+from users.models import User
+
+from . import cache, counters, facets, page_cache, search
+from .models import Category, Product, ProductDetail, ProductReaction, Review, Tag
+
+PREFIX = 'bench'
+PASSWORD = 'benchmark'
+BENCHMARK_USER = f'{PREFIX}-user-0'
+
+# Количество объектов по умолчанию
+DEFAULTS = {
+    'categories': 20,
+    'tags': 200,
+    'products': 20000,
+    'users': 2000,
+    'reviews': 50000,
+    'reactions': 100000,
+    'collections': 12,
+}
+
+BATCH_SIZE = 2000
+
+COLORS = ('Чёрный', 'Белый', 'Синий', 'Красный', 'Зелёный', 'Бежевый', 'Серый')
+SIZES = ('XS', 'S', 'M', 'L', 'XL', 'XXL')
+MATERIALS = ('Хлопок', 'Лён', 'Шерсть', 'Полиэстер', 'Вискоза', 'Кожа')
+MANUFACTURERS = ('Северная фабрика', 'Текстиль-Юг', 'Модный дом', 'Ателье №5', 'Урал-Стиль')
+COUNTRIES = ('Россия', 'Беларусь', 'Турция', 'Китай', 'Италия')
+WORDS = ('удобный', 'лёгкий', 'тёплый', 'классический', 'повседневный', 'праздничный',
+         'плотный', 'мягкий', 'прочный', 'стильный', 'практичный', 'износостойкий')
+REVIEW_TEXTS = ('Отличный товар, рекомендую', 'Соответствует описанию', 'Качество среднее',
+                'Размер немного маломерит', 'Быстрая доставка, всё понравилось', 'Не подошёл цвет')
+
+
+def _zipf_weights(count, exponent=1.0):
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def _pairs(rng, product_ids, user_ids, total):
+    """Уникальные пары (товар, пользователь); популярные товары выпадают чаще"""
+    total = min(total, len(product_ids) * len(user_ids))
+    weights = _zipf_weights(len(product_ids), exponent=0.8)
+    pairs = set()
+    while len(pairs) < total:
+        size = total - len(pairs)
+        products = rng.choices(product_ids, cum_weights=weights, k=size)
+        pairs.update(zip(products, rng.choices(user_ids, k=size)))
+    return pairs
+
+
+def _bulk_create(model, objects, batch_size, progress):
+    created = 0
+    for start in range(0, len(objects), batch_size):
+        model.objects.bulk_create(objects[start:start + batch_size], batch_size=batch_size)
+        created += len(objects[start:start + batch_size])
+        progress(f'{model._meta.verbose_name_plural}: {created}')
+    return created
+
+
+def _restore_dates(model, objects, fields, batch_size):
+    """
+    bulk_create проставляет auto_now_add/auto_now текущим временем; исходные
+    даты (разнесённые по прошлому году) возвращаются bulk_update.
+    """
+    for start in range(0, len(objects), batch_size):
+        model.objects.bulk_update(objects[start:start + batch_size], fields)
+
+
+def exists():
+    """Создан ли набор данных (его slug и имена пользователей заняты)"""
+    prefix = f'{PREFIX}-'
+    return (Category.objects.filter(slug__startswith=prefix).exists()
+            or User.objects.filter(username__startswith=prefix).exists())
+
+
+def clear(progress=print):
+    """Удаляет объекты, созданные generate()"""
+    prefix = f'{PREFIX}-'
+    with transaction.atomic():
+        for model, lookup in ((Product, 'slug'), (Collection, 'slug'), (Category, 'slug'),
+                              (Tag, 'slug'), (User, 'username')):
+            deleted, _ = model.objects.filter(**{f'{lookup}__startswith': prefix}).delete()
+            progress(f'Удалено ({model._meta.verbose_name_plural}): {deleted}')
+
+
+def generate(counts=None, seed=0, batch_size=BATCH_SIZE, progress=print):
+    """
+    Создаёт синтетический набор данных; counts - количество объектов по
+    ключам DEFAULTS. Возвращает словарь с количеством созданных объектов.
+    """
+    counts = {**DEFAULTS, **(counts or {})}
+    rng = random.Random(seed)
+    now = timezone.now()
+    year = timedelta(days=365).total_seconds()
+
+    def past():
+        return now - timedelta(seconds=rng.uniform(0, year))
+
+    result = {}
+    with transaction.atomic():
+        categories = [
+            Category(name=f'Категория {number}', slug=f'{PREFIX}-category-{number}',
+                     description=f'Синтетическая категория {number}')
+            for number in range(counts['categories'])
+        ]
+        result['categories'] = _bulk_create(Category, categories, batch_size, progress)
+        category_ids = list(Category.objects.filter(slug__startswith=f'{PREFIX}-category-')
+                            .values_list('pk', flat=True))
+
+        tags = [Tag(name=f'Тег {number}', slug=f'{PREFIX}-tag-{number}') for number in range(counts['tags'])]
+        result['tags'] = _bulk_create(Tag, tags, batch_size, progress)
+        tag_ids = list(Tag.objects.filter(slug__startswith=f'{PREFIX}-tag-').order_by('pk')
+                       .values_list('pk', flat=True))
+
+        # Товары: 95% опубликованы, даты создания разнесены по прошлому году
+        category_weights = _zipf_weights(len(category_ids), exponent=0.7)
+        products, dates = [], []
+        for number in range(counts['products']):
+            words = rng.sample(WORDS, 3)
+            products.append(Product(
+                name=f'{words[0].capitalize()} товар {number}', slug=f'{PREFIX}-product-{number}',
+                description=' '.join(words) + f'. Описание синтетического товара {number}.',
+                price=Decimal(rng.randrange(30, 3000) * 10),
+                category_id=rng.choices(category_ids, cum_weights=category_weights)[0] if category_ids else None,
+                is_published=rng.random() < 0.95,
+            ))
+            dates.append(past())
+        result['products'] = _bulk_create(Product, products, batch_size, progress)
+        products = list(Product.objects.filter(slug__startswith=f'{PREFIX}-product-').order_by('pk'))
+        for product, created_at in zip(products, dates):
+            product.created_at = product.updated_at = created_at
+        _restore_dates(Product, products, ['created_at', 'updated_at'], batch_size)
+        product_ids = [product.pk for product in products]
+
+        details = [
+            ProductDetail(
+                product_id=pk, size=rng.choice(SIZES), material=rng.choice(MATERIALS),
+                color=rng.choice(COLORS), weight=Decimal(rng.randrange(10, 300)) / 100,
+                care_instructions='Деликатная стирка при 30 °C', manufacturer=rng.choice(MANUFACTURERS),
+                country_origin=rng.choice(COUNTRIES), production_year=rng.randrange(2018, now.year + 1),
+                warranty_period='14 дней', sku=f'SKU-{pk:08d}',
+            )
+            for pk in product_ids
+        ]
+        _bulk_create(ProductDetail, details, batch_size, progress)
+
+        # Теги: от 1 до 5 на товар, популярные теги встречаются чаще
+        if tag_ids:
+            through = Product.tags.through
+            tag_weights = _zipf_weights(len(tag_ids))
+            links = [
+                through(product_id=pk, tag_id=tag_id)
+                for pk in product_ids
+                for tag_id in set(rng.choices(tag_ids, cum_weights=tag_weights, k=rng.randint(1, 5)))
+            ]
+            _bulk_create(through, links, batch_size, progress)
+
+        password = make_password(PASSWORD)
+        users = [
+            User(username=f'{PREFIX}-user-{number}', email=f'{PREFIX}-user-{number}@example.com',
+                 password=password, first_name=f'Покупатель {number}', date_joined=past())
+            for number in range(counts['users'])
+        ]
+        result['users'] = _bulk_create(User, users, batch_size, progress)
+        user_ids = list(User.objects.filter(username__startswith=f'{PREFIX}-user-').values_list('pk', flat=True))
+        benchmark_user = User.objects.filter(username=BENCHMARK_USER).first()
+        if benchmark_user is not None:
+            benchmark_user.user_permissions.add(Permission.objects.get(
+                content_type__app_label='catalog', codename='view_product'))
+
+        # Перемешивание товаров: популярность не связана с датой создания
+        popular = product_ids[:]
+        rng.shuffle(popular)
+        if popular and user_ids:
+            reviews = []
+            for product_id, user_id in _pairs(rng, popular, user_ids, counts['reviews']):
+                review = Review(product_id=product_id, user_id=user_id, rating=rng.choices(
+                    range(1, 6), weights=(1, 1, 2, 4, 6))[0], text=rng.choice(REVIEW_TEXTS))
+                reviews.append(review)
+            result['reviews'] = _bulk_create(Review, reviews, batch_size, progress)
+
+            reactions = [
+                ProductReaction(product_id=product_id, user_id=user_id, reaction_type=(
+                    ProductReaction.ReactionType.LIKE if rng.random() < 0.8 else ProductReaction.ReactionType.DISLIKE))
+                for product_id, user_id in _pairs(rng, popular, user_ids, counts['reactions'])
+            ]
+            result['reactions'] = _bulk_create(ProductReaction, reactions, batch_size, progress)
+
+        collections = [
+            Collection(title=f'Коллекция {number}', slug=f'{PREFIX}-collection-{number}',
+                       content=f'Подборка синтетических товаров {number}', is_published=True)
+            for number in range(counts['collections'])
+        ]
+        result['collections'] = _bulk_create(Collection, collections, batch_size, progress)
+
+        for start in range(0, len(product_ids), batch_size):
+            counters.recount(Product.objects.filter(pk__in=product_ids[start:start + batch_size]))
+        progress('Счётчики товаров пересчитаны')
+
+    facets.rebuild_index(batch_size=batch_size)
+    progress('Фасетный индекс перестроен')
+    if search.is_available():
+        with transaction.atomic():
+            search.create_index()
+            search.rebuild_index()
+        progress('Поисковый индекс перестроен')
+
+    cache.bump_version(cache.SIDEBAR, cache.MENU, cache.FACETS)
+    page_cache.invalidate(page_cache.CATALOG_PAGES, page_cache.HOME_PAGES)
+    return result
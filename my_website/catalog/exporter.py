@@ -0,0 +1,247 @@
+"""
+Потоковая выгрузка каталога в CSV, JSON Lines и XLSX (действия в админке и
+команда export_catalog).
+
+Наборы данных (DATASETS):
+  - products  - товары с категорией, тегами и полями ProductDetail в одной
+                строке; колонки совпадают с колонками импорта (catalog/importer.py),
+                поэтому выгрузку можно загрузить обратно;
+  - reviews   - отзывы;
+  - reactions - лайки и дизлайки.
+
+Строки читаются из БД порциями iterator(chunk_size=CHUNK_SIZE) (на PostgreSQL -
+серверным курсором), теги товаров подгружаются одним запросом на порцию.
+Файл формируется генератором байтов, который отдаётся в StreamingHttpResponse
+или пишется в файл, поэтому первые байты уходят клиенту сразу, а расход
+памяти не зависит от количества строк.
+
+XLSX собирается без сторонних библиотек: это ZIP-архив с XML-файлами,
+который пишется потоково (zipfile умеет писать в поток без перемотки), строки
+листа - inline-строки без общей таблицы строк.
+"""
+
+import csv
+import json
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .importer import DETAIL_FIELDS
+from .models import Product, ProductDetail, ProductReaction, Review, Tag
+
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+# Наборы данных
+def _product_rows(queryset):
+    queryset = (queryset.select_related('category', 'detail')
+                .prefetch_related(Prefetch('tags', queryset=Tag.objects.only('name')))
+                .order_by('pk'))
+    for product in queryset.iterator(chunk_size=CHUNK_SIZE):
+        try:
+            detail = product.detail
+        except ProductDetail.DoesNotExist:
+            detail = None
+        category = product.category
+        yield [
+            product.pk, product.name, product.slug, product.description, product.price,
+            int(product.is_published),
+            category.name if category else '', category.slug if category else '',
+            ', '.join(tag.name for tag in product.tags.all()),
+            *(getattr(detail, name) if detail else None for name in DETAIL_FIELDS),
+            product.likes_count, product.dislikes_count, product.reviews_count, product.rating_avg,
+            product.created_at, product.updated_at,
+        ]
+
+
+def _values_rows(fields):
+    def rows(queryset):
+        yield from queryset.order_by('pk').values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    return rows
+
+
+# Набор данных: (модель, колонки, функция строк из queryset модели)
+DATASETS = {
+    'products': (
+        Product,
+        ['id', 'name', 'slug', 'description', 'price', 'is_published', 'category', 'category_slug',
+         'tags', *DETAIL_FIELDS, 'likes_count', 'dislikes_count', 'reviews_count', 'rating_avg',
+         'created_at', 'updated_at'],
+        _product_rows,
+    ),
+    'reviews': (
+        Review,
+        ['id', 'product_slug', 'product', 'user', 'rating', 'text', 'created_at', 'updated_at'],
+        _values_rows(['pk', 'product__slug', 'product__name', 'user__username', 'rating', 'text',
+                      'created_at', 'updated_at']),
+    ),
+    'reactions': (
+        ProductReaction,
+        ['id', 'product_slug', 'product', 'user', 'reaction_type', 'created_at'],
+        _values_rows(['pk', 'product__slug', 'product__name', 'user__username', 'reaction_type',
+                      'created_at']),
+    ),
+}
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+    return str(value)
+
+
+# Форматы
+class _Buffer:
+    """Файл, в который пишет csv/zipfile; записанное забирается генератором"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = ''.join(self.parts) if self.parts and isinstance(self.parts[0], str) else b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _csv(columns, rows):
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    # BOM - чтобы Excel открывал файл в UTF-8
+    yield '\ufeff'.encode()
+    writer.writerow(columns)
+    for number, row in enumerate(rows, 1):
+        writer.writerow([_text(value) for value in row])
+        if number % 100 == 0:
+            yield buffer.take().encode()
+    yield buffer.take().encode()
+
+
+def _jsonl_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return _text(value)
+    return value
+
+
+def _jsonl(columns, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, map(_jsonl_value, row))), ensure_ascii=False))
+        if len(lines) == 100:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+# Управляющие символы недопустимы в XML
+_XML_ILLEGAL = dict.fromkeys(code for code in range(32) if code not in (9, 10, 13))
+
+
+def _xlsx_cell(value):
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_text(value).translate(_XML_ILLEGAL))}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def _xlsx(columns, rows):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        yield buffer.take()
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData>' + _xlsx_row(columns).encode()
+            )
+            for number, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row).encode())
+                if number % 500 == 0:
+                    # Сжатые данные попадают в буфер по мере заполнения блоков deflate
+                    yield buffer.take()
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.take()
+
+
+WRITERS = {'csv': _csv, 'jsonl': _jsonl, 'xlsx': _xlsx}
+
+
+# Выгрузка
+def export(dataset, file_format, queryset=None):
+    """Генератор байтов файла выгрузки набора данных dataset в формате file_format"""
+    model, columns, rows = DATASETS[dataset]
+    if queryset is None:
+        queryset = model.objects.all()
+    return (chunk for chunk in WRITERS[file_format](columns, rows(queryset)) if chunk)
+
+
+def streaming_response(dataset, file_format, queryset=None):
+    content_type, extension = FORMATS[file_format]
+    filename = f'{dataset}-{timezone.localtime():%Y%m%d-%H%M%S}.{extension}'
+    response = StreamingHttpResponse(export(dataset, file_format, queryset), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,427 @@
+"""
+Фасетная фильтрация каталога.
+
+Для каждого значения фасета (ценовой диапазон, категория, тег, характеристики
+из ProductDetail) хранится битовая карта ID товаров (модель FacetBitmap).
+Количество товаров для значения фасета - это число единичных битов в
+пересечении его карты с картой опубликованных товаров и картами уже выбранных
+фильтров, поэтому подсчёт не требует GROUP BY по каждому фасету.
+
+Карты обновляются инкрементально после сохранения товаров (сигналы, после
+коммита транзакции) и полностью пересобираются командой rebuild_facet_index.
+Для инкрементального обновления значения каждого товара хранятся в
+ProductFacetKeys: читаются и пишутся только карты его старых и новых значений.
+
+Загруженный индекс кэшируется в памяти процесса до смены версии
+пространства catalog.cache.FACETS. Вместе с новой версией в кэш пишется
+список изменённых карт, и процессы перечитывают только их; полная загрузка -
+если список недоступен (пересборка индекса, вытеснение из кэша, отставание
+больше MAX_CHANGE_LOG версий).
+"""
+
+import threading
+from decimal import Decimal
+
+from django.core.cache import cache as default_cache
+from django.db import transaction
+from django.db.models import Q
+
+from monitoring import metrics
+
+from . import cache
+from .models import FacetBitmap, Product, ProductFacetKeys
+
+# Ценовые диапазоны: (значение, название, от, до)
+PRICE_RANGES = (
+    ('low', 'До 1000 руб.', None, 1000),
+    ('medium', '1000-5000 руб.', 1000, 5000),
+    ('high', '5000-10000 руб.', 5000, 10000),
+    ('expensive', 'Свыше 10000 руб.', 10000, None),
+)
+
+# Фасеты по полям ProductDetail
+ATTRIBUTE_FACETS = {
+    'size': 'Размер',
+    'color': 'Цвет',
+    'material': 'Материал',
+    'country_origin': 'Страна производства',
+    'manufacturer': 'Производитель',
+}
+
+FACET_TITLES = {
+    'price': 'Цена',
+    'category': 'Категория',
+    'tag': 'Теги',
+    **ATTRIBUTE_FACETS,
+}
+
+# Служебная карта опубликованных товаров
+PUBLISHED = ('_status', 'published')
+
+CHUNK_SIZE = 500
+# Сколько версий индекса процесс догоняет по спискам изменений
+MAX_CHANGE_LOG = 100
+
+
+def price_range(price):
+    for value, _, low, high in PRICE_RANGES:
+        if (low is None or price >= low) and (high is None or price < high):
+            return value
+    return None
+
+
+def price_range_q(value, prefix=''):
+    """Условие фильтрации queryset по ценовому диапазону"""
+    for name, _, low, high in PRICE_RANGES:
+        if name == value:
+            condition = Q()
+            if low is not None:
+                condition &= Q(**{f'{prefix}price__gte': low})
+            if high is not None:
+                condition &= Q(**{f'{prefix}price__lt': high})
+            return condition
+    return None
+
+
+# Построение индекса
+def product_facet_keys(product_ids):
+    """Возвращает {ID товара: множество пар (фасет, значение)}"""
+    keys = {}
+    fields = ['pk', 'is_published', 'price', 'category_id',
+              *(f'detail__{name}' for name in ATTRIBUTE_FACETS)]
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), CHUNK_SIZE):
+        chunk = product_ids[start:start + CHUNK_SIZE]
+        for pk, is_published, price, category_id, *attributes in (
+                Product.objects.filter(pk__in=chunk).values_list(*fields)):
+            keys[pk] = _row_keys(is_published, price, category_id, attributes)
+        for product_id, tag_id in Product.tags.through.objects.filter(
+                product_id__in=chunk).values_list('product_id', 'tag_id'):
+            keys[product_id].add(('tag', str(tag_id)))
+    return keys
+
+
+def _row_keys(is_published, price, category_id, attributes):
+    keys = set()
+    bucket = price_range(Decimal(price))
+    if bucket:
+        keys.add(('price', bucket))
+    if is_published:
+        keys.add(PUBLISHED)
+    if category_id:
+        keys.add(('category', str(category_id)))
+    for name, value in zip(ATTRIBUTE_FACETS, attributes):
+        value = (value or '').strip()
+        if value:
+            keys.add((name, value[:255]))
+    return keys
+
+
+def _to_int(data):
+    return int.from_bytes(bytes(data or b''), 'little')
+
+
+def _to_bytes(bitmap):
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+
+
+def _rows(keys):
+    """Строки FacetBitmap для значений keys: {(фасет, значение): FacetBitmap}"""
+    keys = list(keys)
+    rows = {}
+    for start in range(0, len(keys), CHUNK_SIZE):
+        by_facet = {}
+        for facet, value in keys[start:start + CHUNK_SIZE]:
+            by_facet.setdefault(facet, []).append(value)
+        condition = Q()
+        for facet, values in by_facet.items():
+            condition |= Q(facet=facet, value__in=values)
+        for row in FacetBitmap.objects.filter(condition):
+            rows[(row.facet, row.value)] = row
+    return rows
+
+
+def _stored_keys(product_ids):
+    """Значения фасетов товаров, записанные в индекс: {ID товара: множество пар}"""
+    product_ids = list(product_ids)
+    stored = {}
+    for start in range(0, len(product_ids), CHUNK_SIZE):
+        for product_id, keys in ProductFacetKeys.objects.filter(
+                product_id__in=product_ids[start:start + CHUNK_SIZE]).values_list('product_id', 'keys'):
+            stored[product_id] = {tuple(key) for key in keys}
+    return stored
+
+
+def _keys_list(keys):
+    return sorted([facet, value] for facet, value in keys)
+
+
+def publish_changes(keys):
+    """
+    Сменяет версию индекса; процессы перечитают только карты keys.
+    Пустой keys - версия сменилась без изменения карт (например, названий).
+    """
+    version = cache.bump_version(cache.FACETS)
+    default_cache.set(f'{cache.FACETS}:changes:v{version}', list(keys), cache.DATA_TIMEOUT)
+
+
+def update_products(product_ids):
+    """Инкрементально обновляет карты для указанных товаров (удалённые - убираются)"""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    keys = product_facet_keys(product_ids)
+
+    with transaction.atomic():
+        stored = _stored_keys(product_ids)
+        rows = _rows(set().union(*keys.values(), *stored.values()))
+        bitmaps = {key: _to_int(row.bitmap) for key, row in rows.items()}
+        changed = set()
+        for product_id in product_ids:
+            bit = 1 << product_id
+            new_keys = keys.get(product_id, set())
+            for key in stored.get(product_id, set()) - new_keys:
+                bitmap = bitmaps.get(key, 0)
+                if bitmap & bit:
+                    bitmaps[key] = bitmap & ~bit
+                    changed.add(key)
+            for key in new_keys:
+                bitmap = bitmaps.get(key, 0)
+                if not bitmap & bit:
+                    bitmaps[key] = bitmap | bit
+                    changed.add(key)
+
+        to_update, to_create, to_delete = [], [], []
+        for key in changed:
+            row = rows.get(key)
+            if row is None:
+                to_create.append(FacetBitmap(facet=key[0], value=key[1], bitmap=_to_bytes(bitmaps[key])))
+            elif bitmaps[key]:
+                row.bitmap = _to_bytes(bitmaps[key])
+                to_update.append(row)
+            else:
+                to_delete.append(row.pk)
+        FacetBitmap.objects.bulk_create(to_create)
+        FacetBitmap.objects.bulk_update(to_update, ['bitmap'], batch_size=CHUNK_SIZE)
+        FacetBitmap.objects.filter(pk__in=to_delete).delete()
+
+        ProductFacetKeys.objects.bulk_create(
+            [ProductFacetKeys(product_id=product_id, keys=_keys_list(new_keys))
+             for product_id, new_keys in keys.items() if new_keys != stored.get(product_id)],
+            update_conflicts=True, unique_fields=['product_id'], update_fields=['keys'], batch_size=CHUNK_SIZE,
+        )
+        ProductFacetKeys.objects.filter(product_id__in=[product_id for product_id in stored
+                                                        if product_id not in keys]).delete()
+
+    if changed:
+        publish_changes(changed)
+
+
+def remove_value(facet, value):
+    """Удаляет значение фасета (например, при удалении тега или категории)"""
+    if FacetBitmap.objects.filter(facet=facet, value=str(value)).delete()[0]:
+        # В ProductFacetKeys значение остаётся: снятие отсутствующего бита ничего не меняет
+        publish_changes([(facet, str(value))])
+
+
+def rebuild_index(batch_size=5000):
+    """Полностью пересобирает фасетный индекс"""
+    bitmaps = {}
+    product_keys = []
+    last_pk = 0
+    while True:
+        product_ids = list(Product.objects.filter(pk__gt=last_pk).order_by('pk')
+                           .values_list('pk', flat=True)[:batch_size])
+        if not product_ids:
+            break
+        for product_id, keys in product_facet_keys(product_ids).items():
+            bit = 1 << product_id
+            for key in keys:
+                bitmaps[key] = bitmaps.get(key, 0) | bit
+            product_keys.append(ProductFacetKeys(product_id=product_id, keys=_keys_list(keys)))
+        last_pk = product_ids[-1]
+
+    with transaction.atomic():
+        FacetBitmap.objects.all().delete()
+        FacetBitmap.objects.bulk_create(
+            [FacetBitmap(facet=facet, value=value, bitmap=_to_bytes(bitmap))
+             for (facet, value), bitmap in bitmaps.items()],
+            batch_size=CHUNK_SIZE,
+        )
+        ProductFacetKeys.objects.all().delete()
+        ProductFacetKeys.objects.bulk_create(product_keys, batch_size=CHUNK_SIZE)
+    # Без списка изменений: процессы загрузят индекс целиком
+    cache.bump_version(cache.FACETS)
+    return len(bitmaps)
+
+
+# Отложенное обновление: несколько сигналов одного сохранения (товар,
+# характеристики, теги) объединяются в одно обновление после коммита
+_pending = threading.local()
+
+
+def schedule_update(product_ids):
+    pending = getattr(_pending, 'ids', None)
+    if pending is None:
+        pending = _pending.ids = set()
+    pending.update(product_ids)
+    # Первый сработавший обработчик обновит все накопленные товары, остальные ничего не сделают
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    product_ids = getattr(_pending, 'ids', None)
+    _pending.ids = None
+    if product_ids:
+        update_products(product_ids)
+
+
+# Чтение индекса
+_snapshot = {'version': None, 'bitmaps': {}}
+
+
+def _changes_since(loaded, version):
+    """Значения, карты которых менялись после версии loaded, или None (нужна полная загрузка)"""
+    if loaded is None or not loaded < version <= loaded + MAX_CHANGE_LOG:
+        return None
+    keys = [f'{cache.FACETS}:changes:v{number}' for number in range(loaded + 1, version + 1)]
+    found = default_cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return {tuple(key) for changes in found.values() for key in changes}
+
+
+def get_bitmaps():
+    """Карты всех значений фасетов {(фасет, значение): int}, кэш в памяти процесса"""
+    version = cache.get_version(cache.FACETS)
+    if _snapshot['version'] != version:
+        # Загрузка бывает раз на версию индекса, в бюджет представления не входит
+        with metrics.outside_budget():
+            changed = _changes_since(_snapshot['version'], version)
+            if changed is None:
+                bitmaps = {
+                    (facet, value): _to_int(bitmap)
+                    for facet, value, bitmap in FacetBitmap.objects.values_list('facet', 'value', 'bitmap')
+                }
+            else:
+                # Копия: другие потоки могут читать текущие карты
+                bitmaps = {key: bitmap for key, bitmap in _snapshot['bitmaps'].items() if key not in changed}
+                bitmaps.update((key, _to_int(row.bitmap)) for key, row in _rows(changed).items())
+        _snapshot.update(version=version, bitmaps=bitmaps)
+    return _snapshot['bitmaps']
+
+
+def published_share(facet, values):
+    """Доля опубликованных товаров со значениями фасета (от 0 до 1)"""
+    bitmaps = get_bitmaps()
+    published = bitmaps.get(PUBLISHED, 0)
+    total = published.bit_count()
+    return (_union(bitmaps, facet, values) & published).bit_count() / total if total else 0.0
+
+
+def parse_selection(query_dict):
+    """Выбранные фильтры из параметров запроса: {фасет: множество значений}"""
+    price_values = {value for value, *_ in PRICE_RANGES}
+    selected = {}
+    for facet in FACET_TITLES:
+        values = {value.strip() for value in query_dict.getlist(facet) if value.strip()}
+        if facet == 'price':
+            values &= price_values
+        elif facet in ('category', 'tag'):
+            values = {value for value in values if value.isdigit()}
+        if values:
+            selected[facet] = values
+    return selected
+
+
+def filter_queryset(queryset, selected):
+    """Применяет выбранные фильтры к queryset товаров"""
+    for facet, values in selected.items():
+        if facet == 'price':
+            condition = Q()
+            for value in values:
+                condition |= price_range_q(value)
+            queryset = queryset.filter(condition)
+        elif facet == 'category':
+            queryset = queryset.filter(category_id__in=values)
+        elif facet == 'tag':
+            queryset = queryset.filter(pk__in=Product.tags.through.objects.filter(
+                tag_id__in=values).values('product_id'))
+        else:
+            queryset = queryset.filter(**{f'detail__{facet}__in': values})
+    return queryset
+
+
+def _union(bitmaps, facet, values):
+    result = 0
+    for value in values:
+        result |= bitmaps.get((facet, value), 0)
+    return result
+
+
+def _labels(facet):
+    if facet == 'category':
+        return {str(category.pk): category.name for category in cache.get_sidebar_categories()}
+    if facet == 'tag':
+        return {str(tag.pk): tag.name for tag in cache.get_sidebar_tags()}
+    if facet == 'price':
+        return {value: label for value, label, *_ in PRICE_RANGES}
+    return {}
+
+
+def build_facets(selected, fixed=None, exclude=()):
+    """
+    Считает количество товаров для каждого значения фасета.
+
+    selected - фильтры пользователя, fixed - фильтры самой страницы
+    (например, категория в CategoryView), exclude - фасеты, которые не нужно
+    показывать. Для значений фасета учитываются фильтры всех остальных
+    фасетов, поэтому внутри одного фасета значения можно комбинировать (ИЛИ).
+    """
+    bitmaps = get_bitmaps()
+    base = bitmaps.get(PUBLISHED, 0)
+    for facet, values in (fixed or {}).items():
+        base &= _union(bitmaps, facet, values)
+
+    masks = {facet: _union(bitmaps, facet, values) for facet, values in selected.items()}
+
+    facets = []
+    for facet, title in FACET_TITLES.items():
+        if facet in exclude:
+            continue
+        mask = base
+        for other, other_mask in masks.items():
+            if other != facet:
+                mask &= other_mask
+
+        labels = _labels(facet)
+        chosen = selected.get(facet, set())
+        values = []
+        for (name, value), bitmap in bitmaps.items():
+            if name != facet:
+                continue
+            count = (bitmap & mask).bit_count()
+            if count or value in chosen:
+                values.append({
+                    'value': value,
+                    'label': labels.get(value, value),
+                    'count': count,
+                    'selected': value in chosen,
+                })
+
+        if facet == 'price':
+            order = [value for value, *_ in PRICE_RANGES]
+            values.sort(key=lambda item: order.index(item['value']))
+            top = max((item['count'] for item in values), default=0)
+            for item in values:
+                item['percent'] = round(item['count'] * 100 / top) if top else 0
+        else:
+            values.sort(key=lambda item: str(item['label']).lower())
+
+        if values:
+            facets.append({'name': facet, 'title': title, 'values': values})
+
+    total = base
+    for mask in masks.values():
+        total &= mask
+    return {'facets': facets, 'total': total.bit_count(), 'selected': selected}
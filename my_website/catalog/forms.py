@@ -3,6 +3,36 @@ from django.core.validators import MinLengthValidator, MaxLengthValidator
 import re
 from .models import Product, Category, Tag, ProductDetail, Review
 
+
+# Правила проверки полей товара (общие для форм и импорта товаров, catalog/importer.py)
+NAME_VALIDATORS = [
+    MinLengthValidator(5, message='Название товара должно быть не менее 5 символов.'),
+    MaxLengthValidator(255, message='Название товара должно быть не более 255 символов.'),
+]
+SLUG_VALIDATORS = [
+    MinLengthValidator(5, message='URL-адрес должен быть не менее 5 символов.'),
+    MaxLengthValidator(255, message='URL-адрес должен быть не более 255 символов.'),
+]
+DESCRIPTION_VALIDATORS = [
+    MinLengthValidator(10, message='Описание товара должно быть не менее 10 символов.'),
+    MaxLengthValidator(500, message='Описание товара должно быть не более 500 символов.'),
+]
+
+
+def validate_product_name(name):
+    if re.search(r'[!@#$%^&*()+=\[\]{};:"\\|<>/?]', name):
+        raise forms.ValidationError('Название товара не должно содержать специальные символы (!@#$%^&* и т.д.).')
+    return name
+
+
+def validate_product_price(price):
+    if price < 0:
+        raise forms.ValidationError('Цена товара должна быть не менее 0 рублей.')
+    if price > 10000000:
+        raise forms.ValidationError('Цена товара должна быть не более 10 000 000 рублей.')
+    return price
+
+
 class AddProductForm(forms.Form):
     """Форма для добавления товара, не связанная с моделью"""
     """Форма не используется в проекте"""
@@ -14,10 +44,7 @@ class AddProductForm(forms.Form):
             'class': 'form-control',
             'placeholder': 'Введите название товара',
         }),
-        validators=[
-            MinLengthValidator(5, message='Название товара должно быть не менее 5 символов.'),
-            MaxLengthValidator(255, message='Название товара должно быть не более 255 символов.'),
-        ]
+        validators=NAME_VALIDATORS
     )
     
     slug = forms.SlugField(
@@ -27,10 +54,7 @@ class AddProductForm(forms.Form):
             'class': 'form-control',
             'placeholder': 'url-adres-tovara'
         }),
-        validators=[
-            MinLengthValidator(5, message='URL-адрес должен быть не менее 5 символов.'),
-            MaxLengthValidator(255, message='URL-адрес должен быть не более 255 символов.'),
-        ]
+        validators=SLUG_VALIDATORS
     )
     
     description = forms.CharField(
@@ -40,10 +64,7 @@ class AddProductForm(forms.Form):
             'rows': 4,
             'placeholder': 'Описание товара'
         }),
-        validators=[
-            MinLengthValidator(10, message='Описание товара должно быть не менее 10 символов.'),
-            MaxLengthValidator(500, message='Описание товара должно быть не более 500 символов.'),
-        ]
+        validators=DESCRIPTION_VALIDATORS
     )
     
     price = forms.DecimalField(
@@ -80,23 +101,18 @@ class AddProductForm(forms.Form):
     )
 
     def clean_name(self):
-        name = self.cleaned_data.get('name')
-        if re.search(r'[!@#$%^&*()+=\[\]{};:"\\|<>/?]', name):
-            raise forms.ValidationError('Название товара не должно содержать специальные символы (!@#$%^&* и т.д.).')
-        return name
+        return validate_product_name(self.cleaned_data.get('name'))
     
     def clean_price(self):
-        price = self.cleaned_data.get('price')
-        if price < 0:
-            raise forms.ValidationError('Цена товара должна быть не менее 0 рублей.')
-        if price > 10000000:
-            raise forms.ValidationError('Цена товара должна быть не более 10 000 000 рублей.')
-        return price
+        return validate_product_price(self.cleaned_data.get('price'))
 
 
 class AddProductModelForm(forms.ModelForm):
     """Форма для добавления товара, связанная с моделью"""
     """Форма используется в проекте"""
+
+    # ID сессии загрузки изображения по частям (mediastore/sessions.py)
+    image_upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
     
     class Meta:
         model = Product
@@ -120,7 +136,7 @@ class AddProductModelForm(forms.ModelForm):
                 'step': '0.01',
                 'placeholder': '0.00'
             }),
-            'image': forms.FileInput(attrs={'class': 'form-control'}),
+            'image': forms.FileInput(attrs={'class': 'form-control', 'data-resumable-target': 'image_upload'}),
             'category': forms.Select(attrs={'class': 'form-control'}),
             'tags': forms.CheckboxSelectMultiple(),
             'is_published': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
@@ -147,36 +163,47 @@ class AddProductModelForm(forms.ModelForm):
         self.fields['is_published'].initial = True
 
         # Добавляем валидаторы
-        self.fields['name'].validators = [
-            MinLengthValidator(5, message='Название товара должно быть не менее 5 символов.'),
-            MaxLengthValidator(255, message='Название товара должно быть не более 255 символов.'),
-        ]
-        self.fields['slug'].validators = [
-            MinLengthValidator(5, message='URL-адрес должен быть не менее 5 символов.'),
-            MaxLengthValidator(255, message='URL-адрес должен быть не более 255 символов.'),
-        ]
-        self.fields['description'].validators = [
-            MinLengthValidator(10, message='Описание товара должно быть не менее 10 символов.'),
-            MaxLengthValidator(500, message='Описание товара должно быть не более 500 символов.'),
-        ]
+        self.fields['name'].validators = list(NAME_VALIDATORS)
+        self.fields['slug'].validators = list(SLUG_VALIDATORS)
+        self.fields['description'].validators = list(DESCRIPTION_VALIDATORS)
     
     def clean_name(self):
-        name = self.cleaned_data.get('name')
-        if re.search(r'[!@#$%^&*()+=\[\]{};:"\\|<>/?]', name):
-            raise forms.ValidationError('Название товара не должно содержать специальные символы (!@#$%^&* и т.д.).')
-        return name
+        return validate_product_name(self.cleaned_data.get('name'))
     
     def clean_price(self):
-        price = self.cleaned_data.get('price')
-        if price < 0:
-            raise forms.ValidationError('Цена товара должна быть не менее 0 рублей.')
-        if price > 10000000:
-            raise forms.ValidationError('Цена товара должна быть не более 10 000 000 рублей.')
-        return price
-
-# Форма для загрузки файла
+        return validate_product_price(self.cleaned_data.get('price'))
+
+# Форма для загрузки файла (большие файлы загружаются по частям, передаётся ID сессии загрузки)
 class UploadFileForm(forms.Form):
-    file = forms.FileField(label='Файл')
+    file = forms.FileField(label='Файл', required=False,
+                           widget=forms.FileInput(attrs={'data-resumable-target': 'upload_session'}))
+    upload_session = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('file') and not cleaned_data.get('upload_session'):
+            raise forms.ValidationError('Выберите файл для загрузки.')
+        return cleaned_data
+
+
+# Форма для импорта товаров из файла (админка)
+class ProductImportForm(forms.Form):
+    file = forms.FileField(label='Файл CSV или JSONL')
+    format = forms.ChoiceField(
+        label='Формат',
+        choices=[('', 'По расширению файла'), ('csv', 'CSV'), ('jsonl', 'JSON Lines')],
+        required=False,
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        file = cleaned_data.get('file')
+        if file and not cleaned_data.get('format'):
+            from .importer import detect_format
+            cleaned_data['format'] = detect_format(file.name)
+            if cleaned_data['format'] is None:
+                raise forms.ValidationError('Не удалось определить формат файла, выберите его в списке.')
+        return cleaned_data
 
 
 # Форма для добавления отзыва
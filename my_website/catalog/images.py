@@ -0,0 +1,177 @@
+"""
+Производные изображения для Product.image и Collection.image.
+
+При сохранении изображения оно ставится в очередь (PendingImage, после
+коммита транзакции), а команда generate_image_derivatives, запускаемая
+периодически, создаёт рядом с оригиналом уменьшенные копии фиксированной ширины WIDTHS в форматах AVIF и
+WebP (если Pillow их поддерживает) и в запасном формате (JPEG, для
+изображений с прозрачностью - PNG):
+
+    products/2025/01/01/dress.jpg
+    products/2025/01/01/dress_w320.avif
+    products/2025/01/01/dress_w320.webp
+    products/2025/01/01/dress_w320.jpg
+    products/2025/01/01/dress.derivatives.json   - манифест
+
+Манифест содержит размеры оригинала, список копий по MIME-типам и крошечную
+размытую заглушку (data URI), которая показывается до загрузки изображения.
+Шаблонный тег responsive_image (catalog_tags) строит по манифесту <picture>
+с srcset/sizes. Изображения, загруженные до появления очереди, обрабатываются
+командой generate_image_derivatives --all.
+
+Копии записываются в хранилище поля (FieldFile.storage) - для DedupStorage
+рядом с файлом содержимого (mediastore/storage.py).
+"""
+
+import base64
+import io
+import json
+import os
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+# Ширина копий в пикселях; самая маленькая используется как миниатюра в админке
+WIDTHS = (160, 320, 640, 1024)
+THUMBNAIL_WIDTH = WIDTHS[0]
+
+# Современные форматы в порядке предпочтения: (формат Pillow, расширение, MIME, параметры)
+MODERN_FORMATS = tuple(
+    fmt for fmt in (
+        ('AVIF', 'avif', 'image/avif', {'quality': 55}),
+        ('WEBP', 'webp', 'image/webp', {'quality': 75, 'method': 4}),
+    )
+    if features.check(fmt[1])
+)
+JPEG = ('JPEG', 'jpg', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True})
+PNG = ('PNG', 'png', 'image/png', {'optimize': True})
+
+PLACEHOLDER_WIDTH = 16
+MANIFEST_SUFFIX = '.derivatives.json'
+
+# Поля с изображениями, для которых создаются копии: (модель, поле)
+IMAGE_FIELDS = (('catalog.product', 'image'), ('homepage.collection', 'image'))
+
+# Отсутствие манифеста кэшируется ненадолго, чтобы не проверять файл на каждой странице
+MISSING_TIMEOUT = 60 * 5
+
+
+def manifest_name(name):
+    return os.path.splitext(name)[0] + MANIFEST_SUFFIX
+
+
+def _cache_key(name):
+    return f'images:manifest:{name}'
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _encode(image, fmt):
+    pil_format, _, _, params = fmt
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **params)
+    return buffer.getvalue()
+
+
+def _replace(storage, name, content):
+    # Storage.save() переименовывает файл при совпадении имён, а копии должны лежать по известному пути
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(content))
+
+
+def _placeholder(image):
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    small = image.convert('RGB').resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR)
+    buffer = io.BytesIO()
+    small.save(buffer, 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def generate(name, storage):
+    """Создаёт копии изображения и манифест, возвращает манифест"""
+    with storage.open(name, 'rb') as file:
+        with Image.open(file) as image:
+            image = ImageOps.exif_transpose(image)
+            alpha = _has_alpha(image)
+            image = image.convert('RGBA' if alpha else 'RGB')
+
+    root = os.path.splitext(name)[0]
+    formats = (*MODERN_FORMATS, PNG if alpha else JPEG)
+    widths = sorted({min(width, image.width) for width in WIDTHS})
+    renditions = {mime: [] for _, _, mime, _ in formats}
+    for width in widths:
+        if width == image.width:
+            resized = image
+        else:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            _, extension, mime, _ = fmt
+            saved = _replace(storage, f'{root}_w{width}.{extension}', _encode(resized, fmt))
+            renditions[mime].append([width, saved])
+
+    manifest = {
+        'width': image.width,
+        'height': image.height,
+        'fallback': formats[-1][2],
+        'placeholder': _placeholder(image),
+        'renditions': renditions,
+    }
+    _replace(storage, manifest_name(name), json.dumps(manifest).encode())
+    cache.set(_cache_key(name), manifest, None)
+    return manifest
+
+
+def field_storage(model, field):
+    """Хранилище поля по метке модели и имени поля (записи очереди)"""
+    return apps.get_model(model)._meta.get_field(field).storage
+
+
+def schedule(image):
+    """
+    Ставит изображение (FieldFile) в очередь после коммита транзакции, в которой
+    сохранён объект. Копии создаёт generate_image_derivatives, не запрос.
+    """
+    from .models import PendingImage
+
+    if image:
+        pending = PendingImage(model=image.instance._meta.label_lower, field=image.field.name, name=image.name)
+        transaction.on_commit(lambda: PendingImage.objects.bulk_create([pending], ignore_conflicts=True))
+
+
+def get_manifest(name, storage):
+    """Манифест копий изображения или None, если копии не созданы"""
+    if not name:
+        return None
+    manifest = cache.get(_cache_key(name))
+    if manifest is None:
+        try:
+            with storage.open(manifest_name(name), 'rb') as file:
+                manifest = json.load(file)
+            cache.set(_cache_key(name), manifest, None)
+        except (OSError, ValueError):
+            manifest = {}
+            cache.set(_cache_key(name), manifest, MISSING_TIMEOUT)
+    return manifest or None
+
+
+def thumbnail_url(image):
+    """URL миниатюры для поля ImageField (оригинал, если копий нет)"""
+    manifest = get_manifest(image.name, image.storage)
+    if manifest:
+        return image.storage.url(manifest['renditions'][manifest['fallback']][0][1])
+    return image.url
+
+
+def image_names():
+    """Все изображения товаров и коллекций: кортежи (модель, поле, имя файла)"""
+    for label, field in IMAGE_FIELDS:
+        names = (apps.get_model(label)._base_manager.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                 .values_list(field, flat=True).iterator())
+        yield from ((label, field, name) for name in names)
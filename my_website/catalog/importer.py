@@ -0,0 +1,461 @@
+"""
+Массовый импорт товаров из CSV и JSON Lines (команда import_products и
+загрузка файла в админке).
+
+Файл читается потоково и обрабатывается пачками по CHUNK_SIZE строк, поэтому
+расход памяти не зависит от размера файла. Каждая строка проверяется по тем же
+правилам, что и в AddProductModelForm (catalog/forms.py), плюс ограничения
+полей моделей; строки с ошибками пропускаются и попадают в отчёт.
+
+Колонки (все, кроме name, description и price, необязательны):
+    name, slug, description, price, is_published, category, category_slug,
+    tags (названия через запятую; в JSONL можно списком),
+    поля ProductDetail: size, material, color, weight, ...
+
+Ключ товара - колонка slug, а без неё - артикул sku: повторный импорт того же
+файла обновляет такие товары, а не создаёт копии. Строка без slug и sku -
+новый товар, его URL строится транслитерацией названия (и артикула) и при
+совпадении с занятым получает суффикс -2, -3, ... Строка, повторяющая ключ
+другой строки пачки, и артикул, который есть у нескольких товаров, попадают в
+отчёт об ошибках. Отсутствующие в строке колонки не изменяют уже сохранённые
+значения.
+
+Одна пачка - одна транзакция:
+  0. определение slug по ключам строк (товары с артикулом и свободные URL);
+  1. категории и теги, которых ещё нет в справочнике, - bulk_create(update_conflicts=True);
+  2. товары и их детальная информация - bulk_create(update_conflicts=True);
+  3. связи с тегами - одно удаление и одна вставка в промежуточную таблицу;
+  4. сигнал products_bulk_updated (поисковый индекс, фасеты, кэш страниц).
+"""
+
+import csv
+import io
+import json
+import os
+import time
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+from . import cache, page_cache
+from .forms import (DESCRIPTION_VALIDATORS, NAME_VALIDATORS, SLUG_VALIDATORS,
+                    validate_product_name, validate_product_price)
+from .models import Category, Product, ProductDetail, Tag
+from .signals import products_bulk_updated
+
+CHUNK_SIZE = 1000
+TAG_SEPARATOR = ','
+# Сколько ошибок хранится в отчёте (остальные только подсчитываются)
+MAX_REPORTED_ERRORS = 50
+# Сколько условий slug LIKE 'base-%' объединяется в одном запросе
+SLUG_LOOKUP_BATCH = 100
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+DETAIL_FIELDS = tuple(
+    field.name for field in ProductDetail._meta.concrete_fields if not field.primary_key
+)
+
+BOOLEAN_VALUES = {
+    '1': True, 'true': True, 'yes': True, 'да': True, 'y': True,
+    '0': False, 'false': False, 'no': False, 'нет': False, 'n': False, '': False,
+}
+
+TRANSLITERATION = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+})
+
+
+def make_slug(*parts, max_length=255):
+    """URL-адрес из русского текста: 'Платье летнее' -> 'plate-letnee'"""
+    text = ' '.join(str(part) for part in parts if part).lower().translate(TRANSLITERATION)
+    return slugify(text)[:max_length].strip('-')
+
+
+def detect_format(filename):
+    return FORMATS.get(os.path.splitext(filename)[1].lower())
+
+
+# Чтение файлов
+def read_csv(file):
+    """Строки CSV-файла: (номер строки, словарь колонок)"""
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(file):
+    """Строки JSON Lines: (номер строки, словарь или None для некорректной строки)"""
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        yield number, data if isinstance(data, dict) else None
+
+
+def read_rows(file, file_format):
+    """Строки текстового или двоичного файла в формате 'csv' или 'jsonl'"""
+    if isinstance(file.read(0), bytes):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    return read_csv(file) if file_format == 'csv' else read_jsonl(file)
+
+
+# Проверка строки
+def _clean(model, name, value, validators=()):
+    field = model._meta.get_field(name)
+    if isinstance(value, str):
+        value = value.strip()
+    if value in ('', None) and field.null:
+        return None
+    value = field.clean(value, None)
+    for validator in validators:
+        validator(value)
+    return value
+
+
+def _split_tags(value):
+    if isinstance(value, str):
+        value = value.split(TAG_SEPARATOR)
+    return [str(name).strip() for name in value or () if str(name).strip()]
+
+
+def parse_row(data):
+    """
+    Проверяет строку файла и возвращает словарь
+    {'slug', 'key', 'product', 'detail', 'category', 'tags'}; ошибки - ValidationError.
+    key - чем строка определяет товар: 'slug', 'sku' или None (новый товар,
+    slug построен из названия). Ключи 'detail' и 'tags' есть, только если в
+    строке были такие колонки.
+    """
+    if data is None:
+        raise ValidationError('Некорректная строка JSON')
+    data = {str(key).strip().lower(): value for key, value in data.items() if key is not None}
+    errors = defaultdict(list)
+
+    def clean(model, name, validators=(), check=None):
+        try:
+            value = _clean(model, name, data.get(name), validators)
+            return check(value) if check and value is not None else value
+        except ValidationError as e:
+            errors[name].extend(e.messages)
+
+    product = {}
+    if isinstance(data.get('price'), str):
+        data['price'] = data['price'].replace(' ', '').replace(',', '.')
+    if 'is_published' in data and not isinstance(data['is_published'], bool):
+        published = BOOLEAN_VALUES.get(str(data['is_published']).strip().lower())
+        if published is None:
+            errors['is_published'].append('Ожидается 1/0, true/false или да/нет.')
+        data['is_published'] = published
+
+    product['name'] = clean(Product, 'name', NAME_VALIDATORS, validate_product_name)
+    product['description'] = clean(Product, 'description', DESCRIPTION_VALIDATORS)
+    product['price'] = clean(Product, 'price', check=validate_product_price)
+    if 'is_published' in data and not errors['is_published']:
+        product['is_published'] = data['is_published']
+
+    has_slug = bool(str(data.get('slug') or '').strip())
+    if not has_slug:
+        data['slug'] = make_slug(data.get('name'), data.get('sku'))
+    slug = clean(Product, 'slug', SLUG_VALIDATORS)
+
+    category = None
+    if str(data.get('category') or '').strip():
+        try:
+            category_name = _clean(Category, 'name', data['category'])
+            category_slug = (_clean(Category, 'slug', data['category_slug'])
+                             if str(data.get('category_slug') or '').strip()
+                             else make_slug(category_name, max_length=100))
+            if not category_slug:
+                raise ValidationError('Не удалось построить URL-адрес категории, укажите category_slug.')
+            category = (category_slug, category_name)
+        except ValidationError as e:
+            errors['category'].extend(e.messages)
+    if 'category' in data:
+        product['category'] = category
+
+    result = {'slug': slug, 'key': 'slug' if has_slug else None, 'product': product, 'category': category}
+
+    if any(name in data for name in DETAIL_FIELDS):
+        detail = {}
+        for name in DETAIL_FIELDS:
+            if name in data:
+                detail[name] = clean(ProductDetail, name)
+        result['detail'] = detail
+        if not has_slug and detail.get('sku'):
+            result['key'] = 'sku'
+
+    if 'tags' in data:
+        tags = []
+        for name in _split_tags(data['tags']):
+            try:
+                tag_name = _clean(Tag, 'name', name)
+                tag_slug = make_slug(tag_name, max_length=100)
+                if not tag_slug:
+                    raise ValidationError(f'Не удалось построить URL-адрес тега «{name}».')
+                tags.append((tag_slug, tag_name))
+            except ValidationError as e:
+                errors['tags'].extend(e.messages)
+        result['tags'] = tags
+
+    errors = {name: messages for name, messages in errors.items() if messages}
+    if errors:
+        raise ValidationError(errors)
+    return result
+
+
+# Запись пачки
+def _upsert_names(model, names, ids):
+    """
+    Добавляет в справочник (категории или теги) отсутствующие в ids записи {slug: название}.
+    Существующие записи не переименовываются. Возвращает True, если записи добавлены.
+    """
+    missing = {slug: name for slug, name in names.items() if slug not in ids}
+    if not missing:
+        return False
+    ids.update(model.objects.filter(slug__in=missing).values_list('slug', 'pk'))
+    new = {slug: name for slug, name in missing.items() if slug not in ids}
+    if not new:
+        return False
+    # bulk_create не отправляет сигналы: кэш меню и боковых панелей сбрасывает save_chunk()
+    model.objects.bulk_create([model(slug=slug, name=name) for slug, name in new.items()], ignore_conflicts=True)
+    ids.update(model.objects.filter(slug__in=new).values_list('slug', 'pk'))
+    return True
+
+
+def _grouped(items):
+    """Группы объектов с одинаковым набором заданных полей (для update_fields)"""
+    groups = defaultdict(list)
+    for fields, obj in items:
+        groups[tuple(sorted(fields))].append(obj)
+    return groups.items()
+
+
+def _key(row):
+    return row['key'], row['detail']['sku'] if row['key'] == 'sku' else row['slug']
+
+
+def _suffixed(base, number):
+    suffix = f'-{number}'
+    max_length = Product._meta.get_field('slug').max_length
+    return base[:max_length - len(suffix)].rstrip('-') + suffix
+
+
+def _taken_slugs(bases):
+    """Занятые товарами slug из bases и их варианты с суффиксами (base-2, base-3, ...)"""
+    bases = list(bases)
+    taken = set()
+    for start in range(0, len(bases), SLUG_LOOKUP_BATCH):
+        batch = bases[start:start + SLUG_LOOKUP_BATCH]
+        condition = reduce(or_, (Q(slug__startswith=f'{base}-') for base in batch), Q(slug__in=batch))
+        taken.update(Product.objects.filter(condition).values_list('slug', flat=True))
+    return taken
+
+
+def _resolve_slugs(rows, on_error):
+    """
+    Определяет slug товара каждой строки (см. описание модуля) и возвращает
+    строки, которые можно сохранить; остальные передаются в on_error(строка, сообщения).
+    Строки с 'new': True - новые товары, их slug свободен.
+    """
+    accepted, first_lines = [], {}
+    for row in rows:
+        key = _key(row)
+        if key[0] is None:
+            accepted.append(row)
+        elif key in first_lines:
+            field = 'slug' if key[0] == 'slug' else 'sku'
+            on_error(row['line'], [f'{field}: «{key[1]}» уже встречается в строке {first_lines[key]}.'])
+        else:
+            first_lines[key] = row['line']
+            accepted.append(row)
+
+    skus = {row['detail']['sku'] for row in accepted if row['key'] == 'sku'}
+    owners = defaultdict(set)
+    for sku, slug in ProductDetail.objects.filter(sku__in=skus).values_list('sku', 'product__slug'):
+        owners[sku].add(slug)
+
+    rows, new_rows, slug_lines = [], [], {}
+    for row in accepted:
+        if row['key'] == 'sku':
+            slugs = owners[row['detail']['sku']]
+            if len(slugs) > 1:
+                on_error(row['line'], [f'sku: артикул «{row["detail"]["sku"]}» есть у нескольких товаров, '
+                                       f'укажите slug.'])
+                continue
+            if not slugs:
+                new_rows.append(row)
+                continue
+            row['slug'] = next(iter(slugs))
+        elif row['key'] is None:
+            new_rows.append(row)
+            continue
+        # Строка со slug и строка с артикулом того же товара
+        if row['slug'] in slug_lines:
+            on_error(row['line'], [f'slug: товар «{row["slug"]}» уже изменяет строка {slug_lines[row["slug"]]}.'])
+            continue
+        slug_lines[row['slug']] = row['line']
+        rows.append(row)
+
+    # URL новых товаров не должны совпадать с товарами базы и других строк пачки
+    reserved = {row['slug'] for row in rows}
+    bases = {row['slug'] for row in new_rows}
+    taken = _taken_slugs(bases) | reserved
+    numbers = defaultdict(lambda: 1)
+    for row in new_rows:
+        base, slug = row['slug'], row['slug']
+        while slug in taken:
+            numbers[base] += 1
+            slug = _suffixed(base, numbers[base])
+        taken.add(slug)
+        row['slug'], row['new'] = slug, True
+    # Суффикс мог обрезать slug до уже занятого длинного URL
+    collisions = set(Product.objects.filter(slug__in=[row['slug'] for row in new_rows])
+                     .values_list('slug', flat=True))
+    for row in new_rows:
+        if row['slug'] in collisions:
+            on_error(row['line'], [f'slug: не удалось подобрать свободный URL для «{row["slug"]}», укажите slug.'])
+        else:
+            rows.append(row)
+    return rows
+
+
+def save_chunk(rows, category_ids, tag_ids, on_error):
+    """
+    Сохраняет пачку проверенных строк одной транзакцией и возвращает ID товаров.
+    rows - результаты parse_row() с номером строки файла в 'line';
+    category_ids и tag_ids - словари {slug: ID}, общие для всех пачек импорта;
+    on_error(номер строки, сообщения) - для строк, которые не удалось сопоставить с товаром.
+    """
+    with transaction.atomic():
+        rows = _resolve_slugs(rows, on_error)
+        slugs = [row['slug'] for row in rows]
+
+        # Страницы, где товары показывались до изменения категории и тегов
+        page_cache.invalidate_products(Product.objects.filter(slug__in=slugs).values_list('pk', flat=True))
+
+        new_categories = _upsert_names(Category, dict(row['category'] for row in rows if row['category']),
+                                       category_ids)
+        new_tags = _upsert_names(Tag, dict(tag for row in rows for tag in row.get('tags', ())), tag_ids)
+        if new_categories:
+            page_cache.invalidate(cache.MENU)
+        if new_categories or new_tags:
+            page_cache.invalidate(cache.SIDEBAR)
+
+        products = []
+        for row in rows:
+            values = dict(row['product'])
+            if 'category' in values:
+                values['category_id'] = category_ids[values.pop('category')[0]] if values['category'] else None
+            products.append((row.get('new', False), values, Product(slug=row['slug'], **values)))
+        # Новые товары только добавляются: совпадение slug с чужим товаром - ошибка, а не обновление
+        Product.objects.bulk_create([obj for new, _, obj in products if new])
+        for fields, objects in _grouped((values, obj) for new, values, obj in products if not new):
+            Product.objects.bulk_create(
+                objects, update_conflicts=True, unique_fields=['slug'],
+                update_fields=[*fields, 'updated_at'],
+            )
+        product_ids = dict(Product.objects.filter(slug__in=slugs).values_list('slug', 'pk'))
+
+        details = [(row['detail'], ProductDetail(product_id=product_ids[row['slug']], **row['detail']))
+                   for row in rows if row.get('detail')]
+        for fields, objects in _grouped(details):
+            ProductDetail.objects.bulk_create(
+                objects, update_conflicts=True, unique_fields=['product'], update_fields=list(fields),
+            )
+
+        tagged = [row for row in rows if 'tags' in row]
+        if tagged:
+            through = Product.tags.through
+            through.objects.filter(product_id__in=[product_ids[row['slug']] for row in tagged]).delete()
+            through.objects.bulk_create([
+                through(product_id=product_ids[row['slug']], tag_id=tag_ids[slug])
+                for row in tagged for slug in dict(row['tags'])
+            ], ignore_conflicts=True)
+
+        products_bulk_updated.send(sender=Product, product_ids=list(product_ids.values()))
+    return list(product_ids.values())
+
+
+# Импорт
+class ImportResult:
+    """Итоги импорта"""
+
+    def __init__(self):
+        self.rows = 0            # прочитано строк
+        self.imported = 0        # сохранено товаров
+        self.error_count = 0
+        self.errors = []         # первые MAX_REPORTED_ERRORS ошибок: (номер строки, сообщения)
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, line, messages):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, messages))
+
+    def __str__(self):
+        return (f'Строк: {self.rows}, сохранено товаров: {self.imported}, ошибок: {self.error_count} '
+                f'за {self.elapsed:.1f} с ({self.rows_per_second:.0f} строк/с)')
+
+
+def _messages(error):
+    if hasattr(error, 'error_dict'):
+        return [f'{name}: {message}' for name, messages in error.message_dict.items() for message in messages]
+    return error.messages
+
+
+def import_rows(rows, chunk_size=CHUNK_SIZE, on_chunk=None, on_error=None):
+    """
+    Импортирует строки (номер строки, словарь колонок) пачками по chunk_size.
+    on_chunk(result) вызывается после каждой пачки, on_error(номер строки, сообщения) - для каждой ошибки.
+    """
+    result = ImportResult()
+    category_ids, tag_ids = {}, {}
+    chunk = []
+
+    def report(line, messages):
+        result.add_error(line, messages)
+        if on_error:
+            on_error(line, messages)
+
+    def flush():
+        result.imported += len(save_chunk(chunk, category_ids, tag_ids, report))
+        chunk.clear()
+        result.elapsed = time.monotonic() - result.started
+        if on_chunk:
+            on_chunk(result)
+
+    for line, data in rows:
+        result.rows += 1
+        try:
+            chunk.append({**parse_row(data), 'line': line})
+        except ValidationError as e:
+            report(line, _messages(e))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    result.elapsed = time.monotonic() - result.started
+    return result
+
+
+def import_file(file, file_format, **kwargs):
+    """Импорт из открытого файла (текстового или двоичного)"""
+    return import_rows(read_rows(file, file_format), **kwargs)
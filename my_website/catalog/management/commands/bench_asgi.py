@@ -0,0 +1,199 @@
+"""
+Сравнение пропускной способности WSGI и ASGI.
+
+Каждый режим запускается в отдельном процессе (настройка ASYNC_VIEWS читается
+при импорте URL-конфигурации):
+  - wsgi       - WSGI-обработчик, синхронные представления, запросы из пула потоков
+  - asgi-sync  - ASGI-обработчик, синхронные представления (по потоку на запрос)
+  - asgi       - ASGI-обработчик, асинхронные представления (catalog/views.py)
+
+Запросы передаются обработчикам Django напрямую, без сети и HTTP-сервера,
+поэтому результат - стоимость обработчика, промежуточных слоёв и
+представлений при одинаковой конкурентности. Под uvicorn приложение
+запускается командой `uvicorn my_website.asgi:application` (asgi.py включает
+асинхронные представления), внешняя нагрузка подаётся любым HTTP-генератором.
+"""
+
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from catalog.benchmarks import CLIENT_ADDRESS, percentile
+from catalog.models import Product
+from users.models import User
+
+MODES = ('wsgi', 'asgi-sync', 'asgi')
+HOST = '127.0.0.1'
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает запросы в секунду под WSGI и ASGI (синхронные и асинхронные представления)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Количество запросов в каждом режиме')
+        parser.add_argument('--concurrency', type=int, default=20, help='Одновременных запросов')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Адрес страницы (можно указать несколько раз)')
+        parser.add_argument('--user', help='Имя пользователя, от которого выполняются запросы')
+        parser.add_argument('--mode', action='append', dest='modes', choices=MODES,
+                            help='Режим (по умолчанию все)')
+        parser.add_argument('--worker', choices=MODES, help='Служебный: выполнить один режим в этом процессе')
+        parser.add_argument('--cookie', default='', help='Служебный: заголовок Cookie')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.run_worker(options)
+            return
+
+        started = time.monotonic()
+        paths = options['paths'] or self.default_paths(options['user'])
+        cookie = self.login(options['user']) if options['user'] else ''
+        self.stdout.write(f'Страницы: {", ".join(paths)}; запросов: {options["requests"]}, '
+                          f'одновременно: {options["concurrency"]}')
+
+        self.stdout.write(f'{"Режим":<10} {"Запросов/с":>11} {"p50, мс":>9} {"p95, мс":>9} {"Ошибок":>7}')
+        for mode in options['modes'] or MODES:
+            result = self.spawn(mode, paths, cookie, options)
+            self.stdout.write(f'{mode:<10} {result["rps"]:>11.1f} {result["p50"]:>9.1f} '
+                              f'{result["p95"]:>9.1f} {result["errors"]:>7}')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Готово за {elapsed:.1f} с'))
+
+    def default_paths(self, username):
+        paths = ['/', '/catalog/']
+        product = Product.published.order_by('-likes_count').values_list('slug', flat=True).first()
+        # Страница товара доступна только пользователям с правом просмотра
+        if username and product:
+            paths.append(f'/catalog/product/{product}/')
+        return paths
+
+    def login(self, username):
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {username} не найден')
+        client = Client()
+        client.force_login(user)
+        return f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+    def spawn(self, mode, paths, cookie, options):
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_asgi',
+                   '--worker', mode, '--requests', str(options['requests']),
+                   '--concurrency', str(options['concurrency']), '--cookie', cookie]
+        for path in paths:
+            command += ['--path', path]
+        env = {**os.environ, 'DJANGO_ASYNC_VIEWS': '1' if mode == 'asgi' else '0'}
+        process = subprocess.run(command, env=env, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f'Режим {mode} завершился с ошибкой:\n{process.stderr}')
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+    # Выполнение одного режима
+    def run_worker(self, options):
+        paths, cookie = options['paths'], options['cookie']
+        plan = [paths[number % len(paths)] for number in range(options['requests'])]
+        if options['worker'] == 'wsgi':
+            run = self.run_wsgi
+        else:
+            run = lambda *args: asyncio.run(self.run_asgi(*args))
+
+        # Прогрев: первые запросы заполняют кэши и открывают соединение с БД
+        run(paths, cookie, 1)
+        started = time.monotonic()
+        results = run(plan, cookie, options['concurrency'])
+        elapsed = time.monotonic() - started
+
+        latencies = [latency * 1000 for _, latency in results]
+        self.stdout.write(json.dumps({
+            'rps': len(results) / elapsed,
+            'p50': statistics.median(latencies),
+            'p95': percentile(latencies, 95),
+            'errors': sum(1 for status, _ in results if status >= 400),
+        }))
+
+    def run_wsgi(self, plan, cookie, concurrency):
+        from django.core.wsgi import get_wsgi_application
+
+        application = get_wsgi_application()
+
+        def request(path):
+            url = urlsplit(path)
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': url.path, 'QUERY_STRING': url.query,
+                'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': HOST, 'HTTP_COOKIE': cookie, 'REMOTE_ADDR': CLIENT_ADDRESS,
+                'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+                'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                'wsgi.run_once': False,
+            }
+            status = []
+            started = time.monotonic()
+            body = application(environ, lambda code, headers: status.append(int(code.split()[0])))
+            try:
+                for _ in body:
+                    pass
+            finally:
+                body.close()
+            return status[0], time.monotonic() - started
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(request, plan))
+
+    async def run_asgi(self, plan, cookie, concurrency):
+        from django.core.asgi import get_asgi_application
+
+        application = get_asgi_application()
+        queue = list(reversed(plan))
+        results = []
+
+        async def request(path):
+            url = urlsplit(path)
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': url.path, 'raw_path': url.path.encode(),
+                'query_string': url.query.encode(), 'root_path': '',
+                'headers': [(b'host', HOST.encode()), (b'cookie', cookie.encode())],
+                'client': (CLIENT_ADDRESS, 0), 'server': (HOST, 80),
+            }
+            finished = asyncio.Event()
+            received = False
+            status = []
+
+            async def receive():
+                nonlocal received
+                if not received:
+                    received = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Обработчик ждёт отключения клиента до конца ответа
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    finished.set()
+
+            started = time.monotonic()
+            await application(scope, receive, send)
+            finished.set()
+            return status[0], time.monotonic() - started
+
+        async def worker():
+            while queue:
+                results.append(await request(queue.pop()))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return results
@@ -0,0 +1,36 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import exporter
+
+
+class Command(BaseCommand):
+    help = 'Выгружает товары, отзывы или реакции в CSV, JSON Lines или XLSX (потоково)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(exporter.DATASETS))
+        parser.add_argument('--format', choices=list(exporter.FORMATS), default='csv')
+        parser.add_argument('-o', '--output', default='-', help='Путь к файлу или "-" для вывода в stdout')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        output = options['output']
+        try:
+            file = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        except OSError as e:
+            raise CommandError(f'Не удалось открыть файл: {e}')
+
+        size = 0
+        try:
+            for chunk in exporter.export(options['dataset'], options['format']):
+                file.write(chunk)
+                size += len(chunk)
+        finally:
+            if output != '-':
+                file.close()
+
+        elapsed = time.monotonic() - started
+        # Сообщение об итогах - в stderr, чтобы не смешиваться с выгрузкой в stdout
+        self.stderr.write(self.style.SUCCESS(f'Выгружено {size / 1024:.0f} КБ за {elapsed:.1f} с'))
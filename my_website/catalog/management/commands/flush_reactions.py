@@ -0,0 +1,22 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog import reaction_buffer
+
+
+class Command(BaseCommand):
+    help = 'Записывает в БД журналы буфера реакций, оставшиеся от завершившихся процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stats', action='store_true',
+                            help='Только показать глубину буфера и статистику сбросов')
+
+    def handle(self, *args, **options):
+        if not options['stats']:
+            started = time.monotonic()
+            count = reaction_buffer.replay_orphans()
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f'Записано реакций: {count} за {elapsed:.2f} с'))
+        self.stdout.write(json.dumps(reaction_buffer.metrics(), ensure_ascii=False, indent=2))
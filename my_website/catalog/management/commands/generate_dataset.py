@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import dataset
+
+
+class Command(BaseCommand):
+    help = 'Создаёт синтетический каталог для замеров производительности (catalog/dataset.py)'
+
+    def add_arguments(self, parser):
+        for name, default in dataset.DEFAULTS.items():
+            parser.add_argument(f'--{name}', type=int, default=default,
+                                help=f'Количество объектов (по умолчанию {default})')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=dataset.BATCH_SIZE,
+                            help='Количество строк, вставляемых одним запросом')
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее созданный набор перед генерацией')
+        parser.add_argument('--clear-only', action='store_true', help='Только удалить ранее созданный набор')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['clear'] or options['clear_only']:
+            dataset.clear(progress=self.stdout.write)
+            if options['clear_only']:
+                self.stdout.write(self.style.SUCCESS(f'Готово за {time.monotonic() - started:.1f} с'))
+                return
+
+        if dataset.exists():
+            raise CommandError('Набор данных уже создан, укажите --clear, чтобы пересоздать его')
+        counts = {name: options[name] for name in dataset.DEFAULTS}
+        result = dataset.generate(counts, seed=options['seed'], batch_size=options['batch_size'],
+                                  progress=self.stdout.write)
+
+        elapsed = time.monotonic() - started
+        summary = ', '.join(f'{name}: {count}' for name, count in result.items())
+        self.stdout.write(self.style.SUCCESS(f'Создано ({summary}) за {elapsed:.1f} с'))
+        self.stdout.write(f'Пользователь для замеров: {dataset.BENCHMARK_USER}, пароль: {dataset.PASSWORD}')
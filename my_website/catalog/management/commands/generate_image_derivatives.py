@@ -0,0 +1,75 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from catalog import images, page_cache
+from catalog.models import PendingImage, Product
+
+
+def _process(task, force):
+    # Выполняется в дочернем процессе: только работа с файлами, без обращений к БД
+    model, field, name = task
+    storage = images.field_storage(model, field)
+    if not force and storage.exists(images.manifest_name(name)):
+        return task, False
+    try:
+        images.generate(name, storage)
+    except Exception as e:
+        return task, e
+    return task, True
+
+
+class Command(BaseCommand):
+    help = ('Создаёт копии (миниатюры, WebP/AVIF) для изображений из очереди '
+            '(запускается периодически) или для всех загруженных изображений')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Количество процессов')
+        parser.add_argument('--all', action='store_true',
+                            help='Обработать все изображения товаров и коллекций, а не только очередь')
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать копии, даже если они уже есть')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['all']:
+            pending = []
+            tasks = sorted(set(images.image_names()))
+        else:
+            pending = list(PendingImage.objects.values_list('pk', 'model', 'field', 'name'))
+            tasks = sorted({(model, field, name) for _, model, field, name in pending})
+        # Соединения с БД не должны наследоваться дочерними процессами
+        connections.close_all()
+
+        created = skipped = failed = 0
+        done = []
+        if tasks:
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                for task, result in pool.map(_process, tasks, [options['force']] * len(tasks), chunksize=4):
+                    if isinstance(result, Exception):
+                        failed += 1
+                        self.stderr.write(f'{task[2]}: {result}')
+                    elif result:
+                        created += 1
+                        done.append(task)
+                    else:
+                        skipped += 1
+
+        # Изображения с ошибками тоже удаляются из очереди: повтор не исправит файл
+        if pending:
+            PendingImage.objects.filter(pk__in=[pk for pk, *_ in pending]).delete()
+        # Страницы со старой разметкой (<img> без копий) сбрасываются из кэша
+        names = [name for model, field, name in done if model == Product._meta.label_lower]
+        if names:
+            page_cache.invalidate_products(Product.objects.filter(image__in=names).values_list('pk', flat=True))
+        if len(names) < len(done):
+            page_cache.invalidate(page_cache.HOME_PAGES)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {created}, пропущено: {skipped}, ошибок: {failed} за {elapsed:.1f} с'
+        ))
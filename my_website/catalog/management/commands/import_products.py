@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import importer
+
+
+class Command(BaseCommand):
+    help = 'Импортирует товары из файла CSV или JSON Lines (потоково, пачками)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или "-" для чтения из stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--chunk-size', type=int, default=importer.CHUNK_SIZE,
+                            help='Строк в одной транзакции')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or importer.detect_format(path)
+        if file_format is None:
+            raise CommandError('Не удалось определить формат файла, укажите --format')
+
+        def on_chunk(result):
+            self.stdout.write(f'  строк: {result.rows}, {result.rows_per_second:.0f} строк/с')
+
+        def on_error(line, messages):
+            self.stderr.write(f'Строка {line}: {"; ".join(messages)}')
+
+        try:
+            file = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(f'Не удалось открыть файл: {e}')
+        with file:
+            result = importer.import_file(file, file_format, chunk_size=options['chunk_size'],
+                                          on_chunk=on_chunk, on_error=on_error)
+        self.stdout.write(self.style.SUCCESS(str(result)))
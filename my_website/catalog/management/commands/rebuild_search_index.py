@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый поисковый индекс товаров (SQLite FTS5)'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Полнотекстовый индекс поддерживается только для SQLite')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            search.create_index()
+            total = search.rebuild_index()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано товаров: {total} за {elapsed:.1f} с'))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import counters
+from catalog.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики лайков, дизлайков, отзывов и рейтинга товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Количество товаров, пересчитываемых одним запросом')
+        parser.add_argument('--product', type=int, action='append', dest='product_ids',
+                            help='ID товара (можно указать несколько раз)')
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.order_by('pk')
+        if options['product_ids']:
+            queryset = queryset.filter(pk__in=options['product_ids'])
+
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        total = 0
+        last_pk = 0
+        while True:
+            pks = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            with transaction.atomic():
+                total += counters.recount(Product.objects.filter(pk__in=pks))
+            last_pk = pks[-1]
+            self.stdout.write(f'Пересчитано товаров: {total}')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Готово: {total} товаров за {elapsed:.1f} с'))
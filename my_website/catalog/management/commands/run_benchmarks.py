@@ -0,0 +1,80 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время ответа, количество SQL-запросов и память горячих страниц (catalog/benchmarks.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=benchmarks.SCENARIOS,
+                            help='Сценарий (можно указать несколько раз, по умолчанию все)')
+        parser.add_argument('--iterations', type=int, default=30, help='Замеряемых запросов в сценарии')
+        parser.add_argument('--warmup', type=int, default=3, help='Запросов прогрева перед замером')
+        parser.add_argument('--deep-page', type=int, default=50, help='Номер глубокой страницы каталога')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Запрашивать списки анонимно (через кэш страниц)')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--compare', help='JSON-файл предыдущего прогона для сравнения')
+        parser.add_argument('--fail-threshold', type=float,
+                            help='Завершиться с ошибкой, если p50, p95 или число запросов '
+                                 'выросли больше чем на указанный процент')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть больше нуля')
+        baseline = self.load(options['compare']) if options['compare'] else None
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING('DEBUG включён: запросы к БД записываются, время завышено'))
+
+        started = time.monotonic()
+        self.stdout.write(f'{"Сценарий":<14} {"p50, мс":>9} {"p95, мс":>9} {"Запросов":>9} {"Память, КБ":>11}')
+        try:
+            report = benchmarks.run(
+                options['scenarios'] or benchmarks.SCENARIOS, iterations=options['iterations'],
+                warmup=options['warmup'], anonymous=options['anonymous'], deep_page=options['deep_page'],
+                progress=self.print_result,
+            )
+        except benchmarks.BenchmarkError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            benchmarks.save(report, options['output'])
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+        if baseline is not None:
+            self.print_comparison(baseline, report, options['fail_threshold'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Готово за {elapsed:.1f} с'))
+
+    def load(self, path):
+        try:
+            return benchmarks.load(path)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Не удалось прочитать {path}: {e}')
+
+    def print_result(self, name, result):
+        self.stdout.write(f'{name:<14} {result["p50_ms"]:>9.1f} {result["p95_ms"]:>9.1f} '
+                          f'{result["queries"]:>9} {result["peak_memory_kb"]:>11.1f}')
+
+    def print_comparison(self, baseline, report, threshold):
+        self.stdout.write(f'\nСравнение с прогоном {baseline.get("created_at", "")}:')
+        self.stdout.write(f'{"Сценарий":<14} {"Показатель":<12} {"Было":>10} {"Стало":>10} {"Изменение":>10}')
+        regressions = []
+        for name, changes in benchmarks.compare(baseline, report).items():
+            for metric, title in benchmarks.METRICS:
+                if metric not in changes:
+                    continue
+                old, new, change = changes[metric]
+                text = f'{change:+.1f}%' if change is not None else '-'
+                line = f'{name:<14} {title:<12} {old:>10} {new:>10} {text:>10}'
+                if (threshold is not None and change is not None and metric != 'peak_memory_kb'
+                        and change > threshold):
+                    regressions.append(f'{name} {title}')
+                    line = self.style.ERROR(line)
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError(f'Ухудшение больше {threshold}%: {", ".join(regressions)}')
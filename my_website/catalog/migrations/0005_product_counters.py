@@ -0,0 +1,63 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:15
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def fill_counters(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    Review = apps.get_model('catalog', 'Review')
+    ProductReaction = apps.get_model('catalog', 'ProductReaction')
+
+    def aggregate(model, expression, **filters):
+        return Coalesce(Subquery(
+            model.objects.filter(product=OuterRef('pk'), **filters)
+            .order_by().values('product').annotate(value=expression).values('value')
+        ), Value(0))
+
+    rating_sum = aggregate(Review, Sum('rating'))
+    reviews_count = aggregate(Review, Count('pk'))
+    Product.objects.update(
+        likes_count=aggregate(ProductReaction, Count('pk'), reaction_type=1),
+        dislikes_count=aggregate(ProductReaction, Count('pk'), reaction_type=-1),
+        reviews_count=reviews_count,
+        rating_sum=rating_sum,
+        rating_avg=Coalesce(Cast(rating_sum, FloatField()) / NullIf(reviews_count, 0), Value(0.0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_alter_product_options_productreaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество дизлайков'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество лайков'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_product_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='menu_position',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Позиция в главном меню'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='menu_title',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Название в меню'),
+        ),
+    ]
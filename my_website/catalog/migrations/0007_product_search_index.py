@@ -0,0 +1,61 @@
+from django.db import migrations
+
+# DDL и заполнение индекса зафиксированы на схеме этой миграции: код приложения
+# (catalog/search.py) меняется вместе с текущими моделями, и миграция на новой
+# базе не должна от него зависеть. Дальше индекс ведут сигналы и команда
+# rebuild_search_index.
+FTS_TABLE = 'catalog_product_fts'
+
+CREATE_INDEX = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"name, description, tags, category, attributes, "
+    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+)
+
+DROP_INDEX = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+
+
+def _normalize(expression):
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _fill_index_sql():
+    attributes = " || ' ' || ".join(
+        f'd.{field}' for field in ('material', 'color', 'manufacturer', 'size', 'country_origin', 'sku'))
+    tags = (
+        "(SELECT group_concat(t.name, ' ') FROM catalog_tag t "
+        "JOIN catalog_product_tags pt ON pt.tag_id = t.id WHERE pt.product_id = p.id)"
+    )
+    documents = ('p.name', 'p.description', f"COALESCE({tags}, '')", "COALESCE(c.name, '')",
+                 f"COALESCE({attributes}, '')")
+    return (
+        f"INSERT INTO {FTS_TABLE} (rowid, name, description, tags, category, attributes) "
+        f"SELECT p.id, {', '.join(_normalize(column) for column in documents)} "
+        f"FROM catalog_product p "
+        f"LEFT JOIN catalog_category c ON c.id = p.category_id "
+        f"LEFT JOIN catalog_productdetail d ON d.product_id = p.id"
+    )
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_INDEX)
+    schema_editor.execute(_fill_index_sql())
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_category_menu'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:20
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Построение индекса зафиксировано на схеме этой миграции (исторические модели):
+# catalog/facets.py работает с текущими моделями и на новой базе сломал бы
+# миграцию после изменения Product. Дальше индекс ведут сигналы и команда
+# rebuild_facet_index.
+PRICE_RANGES = (('low', None, 1000), ('medium', 1000, 5000), ('high', 5000, 10000), ('expensive', 10000, None))
+ATTRIBUTE_FACETS = ('size', 'color', 'material', 'country_origin', 'manufacturer')
+PUBLISHED = ('_status', 'published')
+
+
+def _product_keys(is_published, price, category_id, attributes):
+    keys = set()
+    price = Decimal(price)
+    for value, low, high in PRICE_RANGES:
+        if (low is None or price >= low) and (high is None or price < high):
+            keys.add(('price', value))
+            break
+    if is_published:
+        keys.add(PUBLISHED)
+    if category_id:
+        keys.add(('category', str(category_id)))
+    for name, value in zip(ATTRIBUTE_FACETS, attributes):
+        value = (value or '').strip()
+        if value:
+            keys.add((name, value[:255]))
+    return keys
+
+
+def build_facet_index(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    FacetBitmap = apps.get_model('catalog', 'FacetBitmap')
+    using = schema_editor.connection.alias
+
+    bitmaps = {}
+
+    def add(key, product_id):
+        bitmaps[key] = bitmaps.get(key, 0) | (1 << product_id)
+
+    fields = ['pk', 'is_published', 'price', 'category_id', *(f'detail__{name}' for name in ATTRIBUTE_FACETS)]
+    for pk, is_published, price, category_id, *attributes in (
+            Product.objects.using(using).values_list(*fields).iterator(chunk_size=2000)):
+        for key in _product_keys(is_published, price, category_id, attributes):
+            add(key, pk)
+    for product_id, tag_id in (Product.tags.through.objects.using(using)
+                               .values_list('product_id', 'tag_id').iterator(chunk_size=2000)):
+        add(('tag', str(tag_id)), product_id)
+
+    FacetBitmap.objects.using(using).bulk_create(
+        [FacetBitmap(facet=facet, value=value, bitmap=bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little'))
+         for (facet, value), bitmap in bitmaps.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=30, verbose_name='Фасет')),
+                ('value', models.CharField(max_length=255, verbose_name='Значение')),
+                ('bitmap', models.BinaryField(default=b'', verbose_name='Битовая карта товаров')),
+            ],
+            options={
+                'verbose_name': 'Фасетный индекс',
+                'verbose_name_plural': 'Фасетный индекс',
+                'unique_together': {('facet', 'value')},
+            },
+        ),
+        migrations.RunPython(build_facet_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_facetbitmap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-rating', '-created_at'], name='catalog_rev_product_51a0fc_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:42
+
+import mediastore.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_review_rating_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, default=None, null=True, storage=mediastore.storage.media_storage, upload_to='products/%Y/%m/%d/', verbose_name='Изображение товара'),
+        ),
+    ]
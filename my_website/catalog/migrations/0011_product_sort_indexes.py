@@ -0,0 +1,51 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_alter_product_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-created_at', '-id'], name='product_pub_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['price', 'id'], name='product_pub_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-rating_avg', '-id'], name='product_pub_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-likes_count', '-id'], name='product_pub_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['category', '-created_at', '-id'], name='product_cat_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['category', 'price', 'id'], name='product_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['category', '-rating_avg', '-id'], name='product_cat_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['category', '-likes_count', '-id'], name='product_cat_popular_idx'),
+        ),
+        # Покрывающий индекс промежуточной таблицы тегов: товары тега без чтения строк таблицы
+        # (у автоматической модели M2M нет Meta.indexes)
+        migrations.RunSQL(
+            'CREATE INDEX catalog_product_tags_tag_product_idx ON catalog_product_tags (tag_id, product_id)',
+            'DROP INDEX catalog_product_tags_tag_product_idx',
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:34
+
+from django.db import migrations, models
+
+
+def fill_product_keys(apps, schema_editor):
+    """Значения фасетов товаров из уже построенных битовых карт"""
+    FacetBitmap = apps.get_model('catalog', 'FacetBitmap')
+    ProductFacetKeys = apps.get_model('catalog', 'ProductFacetKeys')
+    using = schema_editor.connection.alias
+
+    product_keys = {}
+    for facet, value, bitmap in FacetBitmap.objects.using(using).values_list('facet', 'value', 'bitmap'):
+        for position, byte in enumerate(bytes(bitmap or b'')):
+            while byte:
+                low = byte & -byte
+                product_keys.setdefault(position * 8 + low.bit_length() - 1, []).append([facet, value])
+                byte ^= low
+    ProductFacetKeys.objects.using(using).bulk_create(
+        [ProductFacetKeys(product_id=product_id, keys=sorted(keys)) for product_id, keys in product_keys.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_product_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetKeys',
+            fields=[
+                ('product_id', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='ID товара')),
+                ('keys', models.JSONField(default=list, verbose_name='Значения фасетов')),
+            ],
+            options={
+                'verbose_name': 'Значения фасетов товара',
+                'verbose_name_plural': 'Значения фасетов товаров',
+            },
+        ),
+        migrations.RunPython(fill_product_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_productreactiontime'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('field', models.CharField(max_length=100, verbose_name='Поле')),
+                ('name', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+            ],
+            options={
+                'verbose_name': 'Изображение в очереди',
+                'verbose_name_plural': 'Очередь копий изображений',
+                'unique_together': {('model', 'field', 'name')},
+            },
+        ),
+    ]
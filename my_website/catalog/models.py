@@ -1,6 +1,8 @@
 from django.db import models
 from django.urls import reverse
 
+from mediastore.storage import media_storage
+
 # Create your models here.
 
 
@@ -31,6 +33,11 @@ class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название категории")
     slug = models.SlugField(max_length=100, unique=True, db_index=True, verbose_name="URL")
     description = models.TextField(blank=True, verbose_name="Описание")
+
+    # Показ в главном меню сайта (используется, если TOP_CATEGORIES в настройках пуст)
+    menu_title = models.CharField(max_length=100, blank=True, verbose_name="Название в меню")
+    menu_position = models.PositiveSmallIntegerField(null=True, blank=True,
+                                                     verbose_name="Позиция в главном меню")
     
     class Meta:
         verbose_name = "Категория"
@@ -56,7 +63,7 @@ class Product(models.Model):
     description = models.TextField(verbose_name="Описание товара")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена")
     image = models.ImageField(upload_to='products/%Y/%m/%d/', default=None, null=True, 
-                              blank=True, verbose_name="Изображение товара")
+                              blank=True, storage=media_storage, verbose_name="Изображение товара")
     
     # Связь Many-to-One: один товар принадлежит одной категории
     category = models.ForeignKey(Category, on_delete=models.PROTECT, null=True, blank=True, 
@@ -75,6 +82,13 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    # Денормализованные счётчики реакций и отзывов (поддерживаются в catalog/counters.py)
+    likes_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество лайков")
+    dislikes_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество дизлайков")
+    reviews_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество отзывов")
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name="Сумма оценок")
+    rating_avg = models.FloatField(default=0, editable=False, verbose_name="Средняя оценка")
+
     objects = models.Manager()       # стандартный менеджер
     published = PublishedModel()   # наш кастомный менеджер
 
@@ -82,11 +96,39 @@ class Product(models.Model):
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
         ordering = ['-created_at']
-        indexes = [models.Index(fields=['-created_at']),]
+        indexes = [
+            models.Index(fields=['-created_at']),
+            # Сортировки каталога (PRODUCT_SORTS): частичные индексы опубликованных
+            # товаров - весь каталог и страница категории читаются по индексу без
+            # сортировки; цена по убыванию - обратным проходом по индексу цены
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_published=True),
+                         name='product_pub_newest_idx'),
+            models.Index(fields=['price', 'id'], condition=models.Q(is_published=True),
+                         name='product_pub_price_idx'),
+            models.Index(fields=['-rating_avg', '-id'], condition=models.Q(is_published=True),
+                         name='product_pub_rating_idx'),
+            models.Index(fields=['-likes_count', '-id'], condition=models.Q(is_published=True),
+                         name='product_pub_popular_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], condition=models.Q(is_published=True),
+                         name='product_cat_newest_idx'),
+            models.Index(fields=['category', 'price', 'id'], condition=models.Q(is_published=True),
+                         name='product_cat_price_idx'),
+            models.Index(fields=['category', '-rating_avg', '-id'], condition=models.Q(is_published=True),
+                         name='product_cat_rating_idx'),
+            models.Index(fields=['category', '-likes_count', '-id'], condition=models.Q(is_published=True),
+                         name='product_cat_popular_idx'),
+        ]
         permissions = [
             ('can_publish_product', "Может публиковать и снимать товар с публикации"),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженные значения для точечного сброса кэша страниц при изменении
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def get_absolute_url(self):
         return reverse('product', kwargs={'product_slug': self.slug})
 
@@ -163,8 +205,16 @@ class Review(models.Model):
         indexes = [
             models.Index(fields=['-created_at']),
             models.Index(fields=['product', '-created_at']),
+            models.Index(fields=['product', '-rating', '-created_at']),
         ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженные значения для пересчёта счётчиков товара при изменении
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         return f"Отзыв от {self.user.username} на {self.product.name}"
 
@@ -198,5 +248,92 @@ class ProductReaction(models.Model):
             models.Index(fields=['product', 'reaction_type']),
         ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженные значения для пересчёта счётчиков товара при изменении
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         return f"{self.user.username} - {self.get_reaction_type_display()} - {self.product.name}"
+
+
+class ProductReactionTime(models.Model):
+    """
+    Время последнего записанного события реакции пользователя на товар
+    (catalog/reaction_buffer.py). Хранится и для снятых реакций: событие из
+    журнала другого процесса, записанное позже, применяется, только если оно новее.
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Товар")
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='+',
+                             verbose_name="Пользователь")
+    changed_at = models.FloatField(verbose_name="Время события (Unix)")
+
+    class Meta:
+        verbose_name = "Время реакции на товар"
+        verbose_name_plural = "Время реакций на товары"
+        unique_together = [['product', 'user']]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.user_id}"
+
+
+class FacetBitmap(models.Model):
+    """
+    Предвычисленный фасетный индекс: битовая карта ID товаров для значения фасета.
+    Бит с номером N установлен, если товар с ID = N имеет это значение.
+    Поддерживается в catalog/facets.py.
+    """
+
+    facet = models.CharField(max_length=30, verbose_name="Фасет")
+    value = models.CharField(max_length=255, verbose_name="Значение")
+    bitmap = models.BinaryField(default=b'', verbose_name="Битовая карта товаров")
+
+    class Meta:
+        verbose_name = "Фасетный индекс"
+        verbose_name_plural = "Фасетный индекс"
+        unique_together = [['facet', 'value']]
+
+    def __str__(self):
+        return f"{self.facet}={self.value}"
+
+
+class ProductFacetKeys(models.Model):
+    """
+    Значения фасетов товара, записанные в FacetBitmap: при изменении товара
+    обновляются только карты его старых и новых значений. ID товара без
+    внешнего ключа - запись удалённого товара нужна, чтобы снять его биты.
+    """
+
+    product_id = models.PositiveIntegerField(primary_key=True, verbose_name="ID товара")
+    keys = models.JSONField(default=list, verbose_name="Значения фасетов")
+
+    class Meta:
+        verbose_name = "Значения фасетов товара"
+        verbose_name_plural = "Значения фасетов товаров"
+
+    def __str__(self):
+        return str(self.product_id)
+
+
+class PendingImage(models.Model):
+    """
+    Очередь создания копий изображений (catalog/images.py). Строка добавляется
+    после коммита сохранения объекта с изображением, команда
+    generate_image_derivatives создаёт копии и удаляет строку.
+    """
+
+    model = models.CharField(max_length=100, verbose_name="Модель")
+    field = models.CharField(max_length=100, verbose_name="Поле")
+    name = models.CharField(max_length=255, verbose_name="Имя файла")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата добавления")
+
+    class Meta:
+        verbose_name = "Изображение в очереди"
+        verbose_name_plural = "Очередь копий изображений"
+        unique_together = [['model', 'field', 'name']]
+
+    def __str__(self):
+        return f"{self.model}.{self.field}: {self.name}"
@@ -0,0 +1,328 @@
+"""
+Полностраничный кэш списков для анонимных пользователей.
+
+Страница хранится в кэше под ключом, построенным из пути и параметров
+строки запроса, которые читает представление (page_cache_params: номер
+страницы, курсор, сортировка, фильтры), в порядке сортировки. Остальные
+параметры (метки рекламных кампаний, случайные строки) не создают новых
+записей и не попадают в страницу: представление получает request.GET только
+с этими параметрами. Вместе с HTML запись хранит версии
+пространств имён (см. catalog/cache.py), от которых страница зависит:
+  - CATALOG_PAGES - общий каталог
+  - category_pages(slug) / tag_pages(slug) - страницы категории и тега
+  - HOME_PAGES - главная страница с коллекциями
+  - SIDEBAR и MENU - боковые панели и меню, которые есть на каждой странице
+
+Изменение товара увеличивает версии только тех пространств, где товар
+показывается (его категории и теги), поэтому остальные страницы остаются в
+кэше. Запись с устаревшими версиями или истёкшим сроком ещё STALE_TIMEOUT
+секунд отдаётся остальным запросам, пока один из них пересобирает страницу
+(stale-while-revalidate).
+
+HTML сжимается один раз при сохранении (gzip и brotli, если установлен
+модуль brotli), клиент получает вариант согласно Accept-Encoding.
+Валидаторы ETag/Last-Modified сохраняются вместе со страницей, поэтому
+условный запрос к закэшированной странице получает 304.
+
+Пока для запроса показывается django-debug-toolbar, кэш страниц не
+используется: панель кэша сериализует значения кэша в JSON и не умеет
+работать со сжатыми телами страниц, а сама панель должна видеть свежий ответ.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, QueryDict
+from django.template.response import SimpleTemplateResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+from monitoring import prometheus
+
+from . import cache
+from .models import Category, Tag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CATALOG_PAGES = 'pages:catalog'
+HOME_PAGES = 'pages:home'
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TIMEOUT': 60 * 5,         # сколько страница считается свежей
+    'STALE_TIMEOUT': 60,       # сколько устаревшая страница отдаётся во время пересборки
+    'LOCK_TIMEOUT': 30,        # блокировка пересборки одной страницы
+    'MIN_COMPRESS_SIZE': 200,  # страницы меньше этого размера не сжимаются
+}
+
+# Варианты тела ответа в порядке предпочтения
+ENCODINGS = ('br', 'gzip', 'identity')
+
+# Заголовки ответа, сохраняемые вместе со страницей
+STORED_HEADERS = ('ETag', 'Last-Modified')
+
+
+def get_setting(name):
+    return getattr(settings, 'PAGE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def category_pages(slug):
+    return f'pages:category:{slug}'
+
+
+def tag_pages(slug):
+    return f'pages:tag:{slug}'
+
+
+# Инвалидация
+def invalidate(*namespaces):
+    """
+    Сбрасывает страницы пространств сразу и ещё раз после коммита транзакции:
+    страница, собранная другим запросом до коммита, не останется в кэше.
+    """
+    namespaces = [namespace for namespace in namespaces if namespace]
+    if namespaces:
+        cache.bump_version(*namespaces)
+        transaction.on_commit(lambda: cache.bump_version(*namespaces))
+
+
+def product_pages(product_ids, category_ids=()):
+    """Пространства страниц, на которых показываются товары (двумя запросами)"""
+    product_ids = list(product_ids)
+    category_ids = [pk for pk in category_ids if pk is not None]
+    category_slugs = Category.objects.filter(
+        Q(pk__in=category_ids) | Q(products__pk__in=product_ids)
+    ).values_list('slug', flat=True).distinct()
+    tag_slugs = Tag.objects.filter(products__pk__in=product_ids).values_list('slug', flat=True).distinct()
+    return [
+        CATALOG_PAGES,
+        *(category_pages(slug) for slug in category_slugs),
+        *(tag_pages(slug) for slug in tag_slugs),
+    ]
+
+
+def invalidate_products(product_ids, category_ids=()):
+    invalidate(*product_pages(product_ids, category_ids))
+
+
+# Хранение и отдача страниц
+def _page_query(request, params):
+    """Параметры запроса из params (имена и значения в порядке сортировки)"""
+    query = QueryDict(mutable=True)
+    for name in sorted(set(params)):
+        values = request.GET.getlist(name)
+        if values:
+            query.setlist(name, sorted(values))
+    query._mutable = False
+    return query
+
+
+def _cache_key(request):
+    url = f'{request.path}?{request.GET.urlencode()}'
+    return f'page:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+def _compress(content):
+    bodies = {'identity': content}
+    if len(content) >= get_setting('MIN_COMPRESS_SIZE'):
+        bodies['gzip'] = gzip.compress(content, compresslevel=6, mtime=0)
+        if brotli is not None:
+            bodies['br'] = brotli.compress(content, quality=5)
+    return bodies
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = part.partition(';')
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name.strip():
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _response_from_entry(request, entry, state):
+    prometheus.CACHE_REQUESTS.inc(cache='page', result=state.lower())
+    accepted = _accepted_encodings(request)
+    encoding = next(name for name in ENCODINGS
+                    if name in entry['bodies'] and (name == 'identity' or name in accepted))
+    body = entry['bodies'][encoding]
+    response = HttpResponse(body, content_type=entry['content_type'])
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    response['Content-Length'] = str(len(body))
+    response['X-Page-Cache'] = state
+    for name, value in entry['headers'].items():
+        response[name] = value
+    patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+    return get_conditional_response(
+        request,
+        etag=entry['headers'].get('ETag'),
+        last_modified=parse_http_date_safe(entry['headers'].get('Last-Modified', '')),
+        response=response,
+    )
+
+
+def _is_storable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not response.has_header('Content-Encoding')
+        and 'private' not in response.get('Cache-Control', '')
+        and 'no-store' not in response.get('Cache-Control', '')
+    )
+
+
+def _debug_toolbar_active(request):
+    """Для запроса показывается панель отладки"""
+    if not getattr(settings, 'DEBUG_TOOLBAR', False):
+        return False
+    from debug_toolbar.middleware import show_toolbar_func_or_path
+
+    show_toolbar = show_toolbar_func_or_path()
+    if iscoroutinefunction(show_toolbar):
+        # Асинхронную проверку отсюда не вызвать, считаем панель включённой
+        return True
+    return bool(show_toolbar(request))
+
+
+def is_cacheable(request):
+    return (
+        get_setting('ENABLED')
+        and request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not _debug_toolbar_active(request)
+    )
+
+
+def _make_entry(response, versions, now):
+    """Запись кэша для ответа или None, если ответ нельзя сохранять"""
+    if not _is_storable(response):
+        return None
+    return {
+        'versions': versions,
+        'expires': now + get_setting('TIMEOUT'),
+        'content_type': response['Content-Type'],
+        'headers': {name: response[name] for name in STORED_HEADERS if response.has_header(name)},
+        'bodies': _compress(response.content),
+    }
+
+
+def serve(request, namespaces, params, render):
+    """
+    Отдаёт страницу из кэша или собирает её вызовом render() и сохраняет.
+    params - параметры строки запроса, от которых зависит страница.
+    """
+    request.GET = _page_query(request, params)
+    key = _cache_key(request)
+    versions = cache.get_versions(*namespaces)
+    entry = default_cache.get(key)
+    now = time.time()
+
+    lock_key = None
+    if entry is not None:
+        if entry['versions'] == versions and now < entry['expires']:
+            return _response_from_entry(request, entry, 'HIT')
+        if default_cache.add(f'{key}:lock', 1, get_setting('LOCK_TIMEOUT')):
+            lock_key = f'{key}:lock'
+        elif now < entry['expires'] + get_setting('STALE_TIMEOUT'):
+            # Страницу уже пересобирает другой запрос
+            return _response_from_entry(request, entry, 'STALE')
+
+    try:
+        response = render()
+        if isinstance(response, SimpleTemplateResponse):
+            response.render()
+        entry = _make_entry(response, versions, now)
+        if entry is None:
+            return response
+        default_cache.set(key, entry, get_setting('TIMEOUT') + get_setting('STALE_TIMEOUT'))
+    finally:
+        if lock_key:
+            default_cache.delete(lock_key)
+    return _response_from_entry(request, entry, 'MISS')
+
+
+async def aserve(request, namespaces, params, render):
+    """Асинхронный вариант serve(): render() - корутина, шаблон рендерится в потоке"""
+    request.GET = _page_query(request, params)
+    key = _cache_key(request)
+    versions, entry = await asyncio.gather(cache.aget_versions(*namespaces), default_cache.aget(key))
+    now = time.time()
+
+    lock_key = None
+    if entry is not None:
+        if entry['versions'] == versions and now < entry['expires']:
+            return _response_from_entry(request, entry, 'HIT')
+        if await default_cache.aadd(f'{key}:lock', 1, get_setting('LOCK_TIMEOUT')):
+            lock_key = f'{key}:lock'
+        elif now < entry['expires'] + get_setting('STALE_TIMEOUT'):
+            return _response_from_entry(request, entry, 'STALE')
+
+    try:
+        response = await render()
+        if isinstance(response, SimpleTemplateResponse):
+            # Теги шаблонов обращаются к БД и кэшу синхронно
+            await sync_to_async(response.render)()
+        entry = _make_entry(response, versions, now)
+        if entry is None:
+            return response
+        await default_cache.aset(key, entry, get_setting('TIMEOUT') + get_setting('STALE_TIMEOUT'))
+    finally:
+        if lock_key:
+            await default_cache.adelete(lock_key)
+    return _response_from_entry(request, entry, 'MISS')
+
+
+class PageCacheMixin:
+    """
+    Миксин полностраничного кэша для анонимных пользователей.
+
+    Как использовать:
+      - Наследовать миксин ПЕРВЫМ: class SomeView(PageCacheMixin, ListView)
+      - Задать `page_cache_scopes` или переопределить get_page_cache_scopes() -
+        пространства имён, при смене версии которых страница устаревает.
+      - Задать `page_cache_params` - все параметры строки запроса, которые
+        читает представление (по умолчанию только номер страницы).
+
+    Работает и с асинхронными представлениями (см. catalog.utils.AsyncListView).
+    """
+
+    page_cache_scopes = ()
+    page_cache_params = ('page',)
+
+    def get_page_cache_scopes(self):
+        return self.page_cache_scopes
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self._adispatch_page_cache(request, *args, **kwargs)
+        if not is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+        return serve(request, self.get_page_cache_scopes(), self.page_cache_params,
+                     lambda: super(PageCacheMixin, self).dispatch(request, *args, **kwargs))
+
+    async def _adispatch_page_cache(self, request, *args, **kwargs):
+        # Ленивый request.user нельзя читать в асинхронном коде
+        request.user = await request.auser()
+        if not is_cacheable(request):
+            return await super().dispatch(request, *args, **kwargs)
+        return await aserve(request, self.get_page_cache_scopes(), self.page_cache_params,
+                            lambda: super(PageCacheMixin, self).dispatch(request, *args, **kwargs))
@@ -0,0 +1,186 @@
+"""
+Keyset-пагинация (пагинация по курсору) для списков товаров.
+
+В отличие от стандартного Paginator не выполняет COUNT(*) и OFFSET:
+страница выбирается условием по ключу сортировки последней (или первой)
+показанной записи, поэтому любая страница стоит столько же, сколько первая.
+"""
+
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    """Курсор повреждён или не соответствует сортировке"""
+
+
+class KeysetPage:
+    """Страница keyset-пагинации (совместима с шаблоном pagination.html)"""
+
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous,
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return f'<KeysetPage: {len(self)} объектов>'
+
+    @property
+    def count(self):
+        return self.paginator.count
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по курсору.
+
+    ordering - последовательность полей сортировки в нотации order_by()
+    (например ('-created_at', '-id')). Последним полем должен быть уникальный
+    ключ, иначе записи с одинаковыми значениями могут пропадать между страницами.
+    count - выполнять ли COUNT(*) для общего числа записей (по умолчанию нет).
+    """
+
+    salt = 'catalog.pagination.cursor'
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), count=False):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.with_count = count
+        self._count = None
+        self.keys = [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+        opts = queryset.model._meta
+        self.fields = [
+            opts.pk if name == 'pk' else opts.get_field(name) for name, _ in self.keys
+        ]
+
+    @property
+    def count(self):
+        """Общее число записей или None, если подсчёт отключён"""
+        if not self.with_count:
+            return None
+        if self._count is None:
+            self._count = self.queryset.order_by().count()
+        return self._count
+
+    # Кодирование курсора
+    def encode_cursor(self, obj, direction):
+        values = [self._dump_value(getattr(obj, name)) for name, _ in self.keys]
+        return signing.dumps({'o': list(self.ordering), 'v': values, 'd': direction},
+                             salt=self.salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=self.salt)
+            if data['o'] != list(self.ordering) or data['d'] not in ('n', 'p'):
+                raise InvalidCursor('Курсор не соответствует сортировке')
+            values = [
+                field.to_python(value) for field, value in zip(self.fields, data['v'], strict=True)
+            ]
+        except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError) as e:
+            raise InvalidCursor('Некорректный курсор') from e
+        return values, data['d']
+
+    @staticmethod
+    def _dump_value(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    # Построение условия "после курсора"
+    def _after(self, values, reverse=False):
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.keys, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        if len(equal) > 1:
+            # Цепочку OR СУБД не превращает в диапазон индекса; нестрогая граница
+            # по первому ключу даёт поиск по индексу вместо просмотра с начала
+            (name, descending), value = self.keys[0], values[0]
+            condition &= Q(**{f'{name}__{"lte" if descending != reverse else "gte"}': value})
+        return condition
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def _page_queryset(self, cursor):
+        """Запрос записей страницы (на одну больше размера) и направление курсора"""
+        size = self.per_page
+        if not cursor:
+            return self.queryset.order_by(*self.ordering)[:size + 1], None
+        values, direction = self.decode_cursor(cursor)
+        if direction == 'n':
+            qs = self.queryset.filter(self._after(values)).order_by(*self.ordering)
+        else:
+            qs = (self.queryset.filter(self._after(values, reverse=True))
+                  .order_by(*self._reversed_ordering()))
+        return qs[:size + 1], direction
+
+    def _make_page(self, rows, direction):
+        size = self.per_page
+        if direction is None:
+            has_next, has_previous = len(rows) > size, False
+            rows = rows[:size]
+        elif direction == 'n':
+            has_next, has_previous = len(rows) > size, True
+            rows = rows[:size]
+        else:
+            has_next, has_previous = True, len(rows) > size
+            rows = rows[:size][::-1]
+
+        next_cursor = self.encode_cursor(rows[-1], 'n') if rows and has_next else None
+        previous_cursor = self.encode_cursor(rows[0], 'p') if rows and has_previous else None
+        return KeysetPage(rows, self, has_next, has_previous, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        """Возвращает страницу после (или перед) указанным курсором"""
+        queryset, direction = self._page_queryset(cursor)
+        return self._make_page(list(queryset), direction)
+
+    async def apage(self, cursor=None):
+        """Асинхронный вариант page(): записи и количество (если включено) выбираются параллельно"""
+        queryset, direction = self._page_queryset(cursor)
+
+        async def rows():
+            return [obj async for obj in queryset]
+
+        if self.with_count and self._count is None:
+            objects, self._count = await asyncio.gather(rows(), self.queryset.order_by().acount())
+        else:
+            objects = await rows()
+        return self._make_page(objects, direction)
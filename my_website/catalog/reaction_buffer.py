@@ -0,0 +1,416 @@
+"""
+Буферизованная запись реакций (режим write-behind, включается настройкой
+REACTION_BUFFER['ENABLED']).
+
+Нажатие лайка/дизлайка не пишет в БД. Итоговое состояние реакции
+пользователя дописывается строкой JSON в журнал процесса
+(DIRECTORY/reactions-<pid>.log), а в общий кэш кладётся «наложение» -
+состояние реакции, которое пользователь сразу видит на странице товара
+(read-your-own-writes), даже если следующий запрос попадёт в другой процесс.
+
+Фоновый поток процесса раз в FLUSH_INTERVAL секунд:
+  1. переименовывает журнал в *.flushing и начинает новый;
+  2. схлопывает события (для пары товар-пользователь важно только событие с
+     наибольшим временем t);
+  3. одной транзакцией отбирает события новее уже записанных (время
+     последнего записанного события пары хранится в ProductReactionTime, в
+     том числе для снятых реакций), выполняет для них bulk_create(update_conflicts=True)
+     установленных реакций и DELETE снятых, затем пересчитывает счётчики
+     затронутых товаров;
+  4. удаляет обработанный файл.
+Поэтому и между процессами «последняя запись побеждает» по времени события,
+а не по порядку обработки журналов.
+
+Журналы процессов, завершившихся аварийно, дописываются при старте потока:
+он запускается первым запросом процесса (см. CatalogConfig.ready()), а также
+командой flush_reactions.
+
+Счётчики лайков в ответе - значение из БД плюс ещё не записанные изменения
+этого процесса, поэтому другие процессы видят их с задержкой до сброса.
+
+Глубина буфера (reaction_buffer_depth) и время сброса
+(reaction_buffer_flush_duration_seconds) отдаются в /metrics
+(monitoring/prometheus.py).
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+
+from monitoring import prometheus
+
+from . import counters
+from .models import Product, ProductReaction, ProductReactionTime
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'DIRECTORY': os.path.join(settings.BASE_DIR, 'var', 'reaction_buffer'),
+    'FLUSH_INTERVAL': 2.0,   # секунды между сбросами буфера
+    'FSYNC': False,          # fsync после каждой записи (защита и от сбоя ОС)
+    'OVERLAY_TIMEOUT': 60 * 10,
+}
+
+# Отсутствие реакции в наложении (None в кэше не отличить от промаха)
+NO_REACTION = 0
+CHUNK_SIZE = 500
+
+
+def get_setting(name):
+    return getattr(settings, 'REACTION_BUFFER', {}).get(name, DEFAULTS[name])
+
+
+def is_enabled():
+    return bool(get_setting('ENABLED'))
+
+
+def _overlay_key(product_id, user_id):
+    return f'reactions:overlay:{product_id}:{user_id}'
+
+
+# Состояние процесса
+_lock = threading.Lock()
+_state = {
+    'file': None,
+    'pending': {},       # {ID товара: {тип реакции: изменение}} - ещё не записано в БД
+    'flushing': {},      # то же для журнала, который сейчас записывается
+    'depth': 0,          # событий в текущем журнале
+    'thread': None,
+    'pid': None,
+}
+_flush_lock = threading.Lock()
+
+
+def _log_path(pid=None):
+    return os.path.join(get_setting('DIRECTORY'), f'reactions-{pid or os.getpid()}.log')
+
+
+def _reset_after_fork():
+    # Дочерний процесс (например, воркер gunicorn) не наследует журнал и поток родителя
+    if _state['pid'] != os.getpid():
+        _state.update(file=None, pending={}, flushing={}, depth=0, thread=None, pid=os.getpid())
+
+
+def _append(event):
+    if _state['file'] is None:
+        os.makedirs(get_setting('DIRECTORY'), exist_ok=True)
+        _state['file'] = open(_log_path(), 'a', encoding='utf-8')
+    _state['file'].write(json.dumps(event) + '\n')
+    _state['file'].flush()
+    if get_setting('FSYNC'):
+        os.fsync(_state['file'].fileno())
+    _state['depth'] += 1
+
+
+def _add_delta(bucket, product_id, old, new):
+    deltas = bucket.setdefault(product_id, {})
+    for reaction_type, delta in ((old, -1), (new, 1)):
+        if reaction_type:
+            deltas[reaction_type] = deltas.get(reaction_type, 0) + delta
+
+
+# Запись и чтение
+def current_state(product_id, user_id):
+    """Реакция пользователя с учётом ещё не записанных событий"""
+    state = cache.get(_overlay_key(product_id, user_id))
+    if state is None:
+        state = (ProductReaction.objects.filter(product=product_id, user=user_id)
+                 .values_list('reaction_type', flat=True).first()) or NO_REACTION
+    return state or None
+
+
+def pending_deltas(product_id):
+    """Ещё не записанные в БД изменения счётчиков товара в этом процессе"""
+    with _lock:
+        _reset_after_fork()
+        result = {}
+        for bucket in (_state['pending'], _state['flushing']):
+            for reaction_type, delta in bucket.get(product_id, {}).items():
+                result[reaction_type] = result.get(reaction_type, 0) + delta
+    return result
+
+
+def overlay(product_id, user_id):
+    """
+    Поправки для страницы товара: (реакция пользователя из наложения или
+    None, если наложения нет; изменение лайков; изменение дизлайков)
+    """
+    state = cache.get(_overlay_key(product_id, user_id))
+    deltas = pending_deltas(product_id)
+    return (state, deltas.get(ProductReaction.ReactionType.LIKE, 0),
+            deltas.get(ProductReaction.ReactionType.DISLIKE, 0))
+
+
+def record(product_id, user_id, reaction_type):
+    """
+    Переключает реакцию в буфере. Возвращает то же, что
+    reactions.toggle_reaction: (реакция или None, лайки, дизлайки).
+    """
+    old = current_state(product_id, user_id)
+    new = None if old == reaction_type else int(reaction_type)
+    event = {'p': product_id, 'u': user_id, 's': new or NO_REACTION, 't': time.time()}
+    with _lock:
+        _reset_after_fork()
+        _append(event)
+        _add_delta(_state['pending'], product_id, old, new)
+    cache.set(_overlay_key(product_id, user_id), new or NO_REACTION, get_setting('OVERLAY_TIMEOUT'))
+    start_flusher()
+
+    likes, dislikes = Product.objects.filter(pk=product_id).values_list('likes_count', 'dislikes_count').get()
+    deltas = pending_deltas(product_id)
+    return (new,
+            max(likes + deltas.get(ProductReaction.ReactionType.LIKE, 0), 0),
+            max(dislikes + deltas.get(ProductReaction.ReactionType.DISLIKE, 0), 0))
+
+
+# Сброс в БД
+def _merge_event(events, key, event):
+    # При равном времени побеждает событие, прочитанное позже
+    if key not in events or event[0] >= events[key][0]:
+        events[key] = event
+
+
+def _read_events(path, events):
+    """Добавляет в events события журнала: {(товар, пользователь): (время, состояние)}"""
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                event = json.loads(line)
+                _merge_event(events, (int(event['p']), int(event['u'])),
+                             (float(event.get('t', 0)), int(event['s'])))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # Недописанная строка при аварийном завершении
+                continue
+    return events
+
+
+def _newer_events(events):
+    """
+    Запоминает время событий в ProductReactionTime и возвращает ключи пар, для
+    которых событие новее уже записанного. Один оператор
+    INSERT ... ON CONFLICT DO UPDATE ... WHERE с RETURNING на пачку: параллельный
+    сброс другого процесса не может применить более старое событие.
+    """
+    quote = connection.ops.quote_name
+    table = quote(ProductReactionTime._meta.db_table)
+    product, user, changed_at = quote('product_id'), quote('user_id'), quote('changed_at')
+    items = list(events.items())
+    newer = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), CHUNK_SIZE):
+            chunk = items[start:start + CHUNK_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({product}, {user}, {changed_at}) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(chunk))} '
+                f'ON CONFLICT ({product}, {user}) DO UPDATE SET {changed_at} = excluded.{changed_at} '
+                f'WHERE {table}.{changed_at} < excluded.{changed_at} '
+                f'RETURNING {product}, {user}',
+                [value for (product_id, user_id), (t, _) in chunk for value in (product_id, user_id, t)],
+            )
+            newer.update(cursor.fetchall())
+    return newer
+
+
+def apply_events(events):
+    """
+    Записывает схлопнутые события {(товар, пользователь): (время, состояние)} в
+    БД; события старше уже записанных для той же пары пропускаются.
+    """
+    if not events:
+        return 0
+    from users.models import User
+
+    product_ids = {product_id for product_id, _ in events}
+    user_ids = {user_id for _, user_id in events}
+    # События удалённых товаров и пользователей отбрасываются
+    product_ids &= set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+    user_ids &= set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    events = {key: event for key, event in events.items()
+              if key[0] in product_ids and key[1] in user_ids}
+
+    with transaction.atomic():
+        newer = _newer_events(events)
+        events = {key: state for key, (_, state) in events.items() if key in newer}
+        upserts = [ProductReaction(product_id=product_id, user_id=user_id, reaction_type=state)
+                   for (product_id, user_id), state in events.items() if state != NO_REACTION]
+        deletes = [key for key, state in events.items() if state == NO_REACTION]
+
+        ProductReaction.objects.bulk_create(
+            upserts, batch_size=CHUNK_SIZE, update_conflicts=True,
+            unique_fields=['product', 'user'], update_fields=['reaction_type'],
+        )
+        for start in range(0, len(deletes), CHUNK_SIZE):
+            chunk = deletes[start:start + CHUNK_SIZE]
+            ProductReaction.objects.filter(
+                reduce(or_, (Q(product_id=p, user_id=u) for p, u in chunk))
+            ).delete()
+        # Сырые изменения в обход save()/delete(): счётчики пересчитываются по факту
+        affected = sorted({product_id for product_id, _ in events})
+        for start in range(0, len(affected), CHUNK_SIZE):
+            counters.recount(Product.objects.filter(pk__in=affected[start:start + CHUNK_SIZE]))
+    return len(events)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _orphaned_logs():
+    """Журналы завершившихся процессов"""
+    paths = []
+    for path in sorted(glob.glob(os.path.join(get_setting('DIRECTORY'), 'reactions-*'))):
+        try:
+            pid = int(os.path.basename(path).split('-')[1].split('.')[0])
+        except (IndexError, ValueError):
+            continue
+        if pid != os.getpid() and not _pid_alive(pid):
+            paths.append(path)
+    return paths
+
+
+def _process_files(paths):
+    events = {}
+    for path in paths:
+        _read_events(path, events)
+    count = apply_events(events)
+    for path in paths:
+        os.remove(path)
+    return count
+
+
+def replay_orphans():
+    """Дописывает в БД журналы аварийно завершившихся процессов"""
+    with _flush_lock:
+        return _process_files(_orphaned_logs())
+
+
+def flush():
+    """Сбрасывает буфер текущего процесса в БД, возвращает число записанных пар"""
+    with _flush_lock:
+        started = time.monotonic()
+        root = _log_path()[:-len('.log')]
+        depth = 0
+        with _lock:
+            _reset_after_fork()
+            if _state['file'] is not None:
+                _state['file'].close()
+                _state['file'] = None
+                os.replace(_log_path(), f'{root}.{int(time.time() * 1000)}.flushing')
+                depth, _state['depth'] = _state['depth'], 0
+                _state['flushing'], _state['pending'] = _state['pending'], {}
+
+        # Вместе с новым файлом - файлы, не записанные при прошлых неудачных сбросах
+        paths = sorted(glob.glob(f'{root}.*.flushing'))
+        if not paths:
+            return 0
+        try:
+            count = _process_files(paths)
+        except BaseException:
+            # Журналы *.flushing остаются на диске и записываются следующим сбросом,
+            # до тех пор их изменения счётчиков снова считаются ожидающими
+            with _lock:
+                for product_id, deltas in _state['flushing'].items():
+                    for reaction_type, delta in deltas.items():
+                        bucket = _state['pending'].setdefault(product_id, {})
+                        bucket[reaction_type] = bucket.get(reaction_type, 0) + delta
+                _state['flushing'] = {}
+            raise
+        with _lock:
+            _state['flushing'] = {}
+
+        duration = time.monotonic() - started
+        prometheus.REACTION_FLUSH_DURATION.observe(duration)
+        _store_stats(depth, count, duration)
+        return count
+
+
+def _store_stats(events, pairs, duration):
+    stats = cache.get('reactions:flush_stats') or {'flushes': 0, 'events': 0, 'pairs': 0}
+    stats.update(
+        flushes=stats['flushes'] + 1,
+        events=stats['events'] + events,
+        pairs=stats['pairs'] + pairs,
+        last_duration=round(duration, 4),
+        last_flush=time.time(),
+    )
+    cache.set('reactions:flush_stats', stats, None)
+
+
+def _run_flusher():
+    try:
+        replay_orphans()
+    except Exception:
+        logger.exception('Не удалось дописать журналы реакций завершившихся процессов')
+    while True:
+        time.sleep(get_setting('FLUSH_INTERVAL'))
+        try:
+            flush()
+        except Exception:
+            # Журнал *.flushing остаётся на диске и будет записан при следующем сбросе
+            logger.exception('Не удалось записать буфер реакций')
+
+
+def start_flusher():
+    with _lock:
+        _reset_after_fork()
+        if _state['thread'] is None:
+            _state['thread'] = threading.Thread(target=_run_flusher, name='reaction-buffer-flusher',
+                                                daemon=True)
+            _state['thread'].start()
+
+
+def start_on_request(sender, **kwargs):
+    """
+    Обработчик request_started (подключается в CatalogConfig.ready()): поток
+    запускается первым запросом процесса, в том числе воркера после fork, и сразу
+    дописывает журналы завершившихся процессов, не дожидаясь первой реакции.
+    """
+    if is_enabled():
+        start_flusher()
+
+
+# Метрики
+def _log_files():
+    return glob.glob(os.path.join(get_setting('DIRECTORY'), 'reactions-*'))
+
+
+def buffer_depth(files=None):
+    """Глубина буфера: события во всех журналах на диске (всех процессов)"""
+    depth = 0
+    for path in _log_files() if files is None else files:
+        try:
+            with open(path, 'rb') as file:
+                depth += sum(1 for _ in file)
+        except FileNotFoundError:
+            continue
+    return depth
+
+
+prometheus.REACTION_BUFFER_DEPTH.set_function(buffer_depth)
+
+
+def metrics():
+    """Глубина буфера и статистика сбросов (flush_reactions --stats)"""
+    files = _log_files()
+    return {
+        'buffer_depth': buffer_depth(files),
+        'log_files': len(files),
+        **(cache.get('reactions:flush_stats') or {}),
+    }
@@ -0,0 +1,74 @@
+"""
+Переключение реакции пользователя на товар (лайк/дизлайк).
+
+Нажатие кнопки выполняется в одной короткой транзакции без предварительного
+чтения строки реакции:
+  1. INSERT ... ON CONFLICT DO NOTHING - реакции не было, она создаётся;
+  2. DELETE ... WHERE reaction_type = нажатая - повторное нажатие снимает реакцию;
+  3. UPDATE ... WHERE reaction_type <> нажатая - реакция меняется на противоположную.
+Каждый шаг - один оператор с RETURNING, поэтому параллельные нажатия не
+приводят к нарушению уникальности (product, user), а результат шага сразу
+известен без отдельного SELECT.
+
+Сырой SQL не вызывает сигналы моделей, поэтому счётчики товара изменяются
+здесь явно (catalog/counters.py) в той же транзакции.
+"""
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import counters
+from .models import Product, ProductReaction
+
+
+def _table():
+    quote = connection.ops.quote_name
+    return quote(ProductReaction._meta.db_table), quote
+
+
+def _fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def toggle_reaction(product_id, user_id, reaction_type):
+    """
+    Переключает реакцию и возвращает (текущая реакция пользователя или None,
+    количество лайков, количество дизлайков).
+    """
+    reaction_type = ProductReaction.ReactionType(reaction_type)
+    table, quote = _table()
+    created_at = ProductReaction._meta.get_field('created_at').get_db_prep_value(
+        timezone.now(), connection
+    )
+
+    with transaction.atomic():
+        if _fetch(
+            f'INSERT INTO {table} ({quote("product_id")}, {quote("user_id")}, '
+            f'{quote("reaction_type")}, {quote("created_at")}) VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT ({quote("product_id")}, {quote("user_id")}) DO NOTHING RETURNING {quote("id")}',
+            [product_id, user_id, reaction_type, created_at],
+        ):
+            state, deltas = reaction_type, {reaction_type: 1}
+        elif _fetch(
+            f'DELETE FROM {table} WHERE {quote("product_id")} = %s AND {quote("user_id")} = %s '
+            f'AND {quote("reaction_type")} = %s RETURNING {quote("id")}',
+            [product_id, user_id, reaction_type],
+        ):
+            state, deltas = None, {reaction_type: -1}
+        elif _fetch(
+            f'UPDATE {table} SET {quote("reaction_type")} = %s WHERE {quote("product_id")} = %s '
+            f'AND {quote("user_id")} = %s AND {quote("reaction_type")} <> %s RETURNING {quote("id")}',
+            [reaction_type, product_id, user_id, reaction_type],
+        ):
+            # Типов реакций два, прежняя - противоположная нажатой
+            state, deltas = reaction_type, {reaction_type: 1, -reaction_type: -1}
+        else:
+            # Строку удалили между шагами (без блокировки записи в начале транзакции)
+            state, deltas = None, {}
+
+        counters.change_reactions(product_id, deltas)
+        likes, dislikes = (Product.objects.filter(pk=product_id)
+                           .values_list('likes_count', 'dislikes_count').get())
+    return state, likes, dislikes
@@ -0,0 +1,260 @@
+"""
+Полнотекстовый поиск товаров на SQLite FTS5.
+
+Индекс - виртуальная таблица catalog_product_fts (rowid = ID товара) с колонками
+name, description, tags, category и attributes (характеристики из ProductDetail).
+Индекс содержит все товары, фильтр по публикации выполняется при поиске,
+поэтому массовая публикация/снятие с публикации не требует переиндексации.
+Индекс обновляется сигналами (catalog/signals.py) и пересобирается командой
+rebuild_search_index.
+
+Запрос пользователя разбивается на слова, каждое слово приводится к основе
+(catalog/stemmer.py) и ищется как префикс, результаты ранжируются по BM25.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Category, Product, ProductDetail, Tag
+from .stemmer import stem
+
+FTS_TABLE = 'catalog_product_fts'
+COLUMNS = ('name', 'description', 'tags', 'category', 'attributes')
+# Веса колонок для BM25 (в порядке COLUMNS)
+WEIGHTS = (10.0, 1.0, 4.0, 3.0, 2.0)
+
+# Поля ProductDetail, попадающие в колонку attributes
+ATTRIBUTE_FIELDS = ('material', 'color', 'manufacturer', 'size', 'country_origin', 'sku')
+
+# Маркеры подсветки заменяются на <mark> после экранирования HTML
+MARK_START, MARK_END = '\x02', '\x03'
+
+WORD_RE = re.compile(r'\w+')
+MIN_STEM_LENGTH = 3
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def _normalize(expression):
+    # unicode61 не отождествляет "ё" и "е", приводим вручную
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def create_index(schema_editor=None):
+    cursor = (schema_editor.connection if schema_editor else connection).cursor()
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{', '.join(COLUMNS)}, tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+    )
+
+
+def drop_index(schema_editor=None):
+    cursor = (schema_editor.connection if schema_editor else connection).cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def _select_documents(where):
+    product = Product._meta.db_table
+    category = Category._meta.db_table
+    detail = ProductDetail._meta.db_table
+    tag = Tag._meta.db_table
+    through = Product.tags.through._meta.db_table
+    attributes = " || ' ' || ".join(f'd.{field}' for field in ATTRIBUTE_FIELDS)
+    tags = (
+        f"(SELECT group_concat(t.name, ' ') FROM {tag} t "
+        f"JOIN {through} pt ON pt.tag_id = t.id WHERE pt.product_id = p.id)"
+    )
+    documents = (
+        'p.name',
+        'p.description',
+        f"COALESCE({tags}, '')",
+        "COALESCE(c.name, '')",
+        f"COALESCE({attributes}, '')",
+    )
+    return (
+        f"SELECT p.id, {', '.join(_normalize(column) for column in documents)} "
+        f"FROM {product} p "
+        f"LEFT JOIN {category} c ON c.id = p.category_id "
+        f"LEFT JOIN {detail} d ON d.product_id = p.id "
+        f"WHERE {where}"
+    )
+
+
+def _execute_reindex(where, params=()):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT p.id FROM {Product._meta.db_table} p WHERE {where})",
+            params,
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(COLUMNS)}) {_select_documents(where)}",
+            params,
+        )
+
+
+def index_products(product_ids):
+    """Переиндексирует товары с указанными ID"""
+    if not is_available():
+        return
+    product_ids = list(product_ids)
+    # Ограничение SQLite на количество параметров запроса
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        _execute_reindex(f"p.id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def index_category(category_id):
+    if is_available():
+        _execute_reindex('p.category_id = %s', [category_id])
+
+
+def index_tag(tag_id):
+    if is_available():
+        through = Product.tags.through._meta.db_table
+        _execute_reindex(f'p.id IN (SELECT product_id FROM {through} WHERE tag_id = %s)', [tag_id])
+
+
+def remove_products(product_ids):
+    if not is_available():
+        return
+    product_ids = list(product_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), 500):
+            chunk = product_ids[start:start + 500]
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk
+            )
+
+
+def rebuild_index():
+    """Полностью пересобирает индекс одним INSERT ... SELECT"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(COLUMNS)}) {_select_documents('1 = 1')}")
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def build_match_query(query):
+    """
+    Строит выражение FTS5 MATCH из пользовательского запроса:
+    каждое слово -> основа как префикс ("плат"*), слова объединяются через AND.
+    """
+    terms = []
+    for word in WORD_RE.findall(query.lower().replace('ё', 'е')):
+        stemmed = stem(word)
+        if len(stemmed) < MIN_STEM_LENGTH:
+            stemmed = word
+        term = f'"{stemmed}"*'
+        if term not in terms:
+            terms.append(term)
+    return ' '.join(terms)
+
+
+def _highlighted(text):
+    text = escape(text or '')
+    return mark_safe(text.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+class SearchResults:
+    """
+    Ленивая выдача поиска, совместимая с django.core.paginator.Paginator:
+    count() выполняет COUNT по индексу, срез - ранжированную выборку одной
+    страницы (LIMIT/OFFSET) и загрузку товаров одним запросом.
+    """
+
+    model = Product
+
+    def __init__(self, query):
+        self.query = query
+        self.match = build_match_query(query)
+        self._count = None
+
+    def _from(self):
+        return (
+            f'FROM {FTS_TABLE} JOIN {Product._meta.db_table} p ON p.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s AND p.is_published = %s'
+        )
+
+    def count(self):
+        if not self.match:
+            return 0
+        if self._count is None:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT count(*) {self._from()}', [self.match, True])
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = key.stop if key.stop is not None else self.count()
+        if not self.match or stop <= start:
+            return []
+
+        weights = ', '.join(str(weight) for weight in WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {FTS_TABLE}.rowid, "
+                f"highlight({FTS_TABLE}, 0, %s, %s), "
+                f"snippet({FTS_TABLE}, -1, %s, %s, '…', 24) "
+                f"{self._from()} ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s",
+                [MARK_START, MARK_END, MARK_START, MARK_END, self.match, True, stop - start, start],
+            )
+            rows = cursor.fetchall()
+
+        products = Product.objects.select_related('category').in_bulk([row[0] for row in rows])
+        results = []
+        for product_id, name, snippet in rows:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            product.highlighted_name = _highlighted(name)
+            product.snippet = _highlighted(snippet)
+            results.append(product)
+        return results
+
+
+class FallbackSearchResults(SearchResults):
+    """Поиск для СУБД без FTS5: простое совпадение по подстроке без ранжирования"""
+
+    def __init__(self, query):
+        self.query = query
+        self.match = query.strip()
+        condition = Q()
+        for word in WORD_RE.findall(query):
+            condition &= (Q(name__icontains=word) | Q(description__icontains=word)
+                          | Q(tags__name__icontains=word) | Q(category__name__icontains=word))
+        self.queryset = Product.published.filter(condition).distinct()
+
+    def count(self):
+        return self.queryset.count() if self.match else 0
+
+    def __getitem__(self, key):
+        if not self.match:
+            return []
+        return self.queryset[key]
+
+
+def search_products(query):
+    """Ранжированный поиск опубликованных товаров"""
+    if is_available():
+        return SearchResults(query)
+    return FallbackSearchResults(query)
+
+
+def matching_ids_sql(query):
+    """Подзапрос с ID товаров, подходящих под запрос (для фильтрации queryset)"""
+    return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [build_match_query(query)])
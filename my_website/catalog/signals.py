@@ -0,0 +1,263 @@
+"""
+Обработчики сигналов приложения "catalog".
+Подключаются в CatalogConfig.ready().
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from . import cache, counters, facets, images, page_cache, search
+from .models import Category, Product, ProductDetail, ProductReaction, Review, Tag
+
+# Массовое изменение товаров в обход save() (queryset.update(), bulk_create()).
+# Отправитель - модель Product, аргумент product_ids - список ID изменённых товаров.
+products_bulk_updated = Signal()
+
+
+def _is_product_cascade(origin):
+    # При удалении самого товара пересчитывать его счётчики не нужно
+    return isinstance(origin, Product) or getattr(origin, 'model', None) is Product
+
+
+# Счётчики реакций
+@receiver(post_save, sender=ProductReaction)
+def reaction_saved(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None)
+    if created:
+        counters.change_reactions(instance.product_id, {instance.reaction_type: 1})
+    elif loaded is None:
+        counters.recount(Product.objects.filter(pk=instance.product_id))
+    elif (loaded['product_id'], loaded['reaction_type']) != (instance.product_id, instance.reaction_type):
+        counters.change_reactions(loaded['product_id'], {loaded['reaction_type']: -1})
+        counters.change_reactions(instance.product_id, {instance.reaction_type: 1})
+    instance._loaded_values = {'product_id': instance.product_id, 'reaction_type': instance.reaction_type}
+
+
+@receiver(post_delete, sender=ProductReaction)
+def reaction_deleted(sender, instance, origin=None, **kwargs):
+    if not _is_product_cascade(origin):
+        counters.change_reactions(instance.product_id, {instance.reaction_type: -1})
+
+
+# Счётчики отзывов и рейтинга
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None)
+    rating = int(instance.rating)
+    if created:
+        counters.change_reviews(instance.product_id, count=1, rating=rating)
+    elif loaded is None:
+        counters.recount(Product.objects.filter(pk=instance.product_id))
+    elif loaded['product_id'] != instance.product_id:
+        counters.change_reviews(loaded['product_id'], count=-1, rating=-loaded['rating'])
+        counters.change_reviews(instance.product_id, count=1, rating=rating)
+    elif loaded['rating'] != rating:
+        counters.change_reviews(instance.product_id, rating=rating - loaded['rating'])
+    instance._loaded_values = {'product_id': instance.product_id, 'rating': rating}
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, origin=None, **kwargs):
+    if not _is_product_cascade(origin):
+        counters.change_reviews(instance.product_id, count=-1, rating=-int(instance.rating))
+
+
+# Дата обновления товара при изменении характеристик: по ней строятся
+# ETag и Last-Modified страницы товара
+@receiver(post_save, sender=ProductDetail)
+@receiver(post_delete, sender=ProductDetail)
+def detail_changed_touch(sender, instance, origin=None, **kwargs):
+    if not _is_product_cascade(origin):
+        Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+# Сброс кэша боковых панелей категорий и тегов
+# (сохранение товара обрабатывается в product_saved_pages)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_sidebar(sender, **kwargs):
+    cache.bump_version(cache.SIDEBAR)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def product_tags_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        cache.bump_version(cache.SIDEBAR)
+
+
+@receiver(products_bulk_updated)
+def products_bulk_updated_sidebar(sender, product_ids, **kwargs):
+    cache.bump_version(cache.SIDEBAR)
+
+
+# Сброс кэша главного меню
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_menu(sender, **kwargs):
+    cache.bump_version(cache.MENU)
+
+
+# Синхронизация поискового индекса
+@receiver(post_save, sender=Product)
+def search_index_product(sender, instance, **kwargs):
+    search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def search_remove_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductDetail)
+@receiver(post_delete, sender=ProductDetail)
+def search_index_detail(sender, instance, origin=None, **kwargs):
+    if not _is_product_cascade(origin):
+        search.index_products([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def search_index_category(sender, instance, created, **kwargs):
+    if not created:
+        search.index_category(instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+def search_index_tag(sender, instance, created, **kwargs):
+    if not created:
+        search.index_tag(instance.pk)
+
+
+@receiver(pre_delete, sender=Tag)
+def search_tag_deleting(sender, instance, **kwargs):
+    instance._search_product_ids = list(instance.products.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def search_tag_deleted(sender, instance, **kwargs):
+    search.index_products(getattr(instance, '_search_product_ids', []))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def search_index_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.index_products([instance.pk])
+    elif action == 'pre_clear':
+        instance._search_product_ids = list(instance.products.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        search.index_products(getattr(instance, '_search_product_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        search.index_products(pk_set)
+
+
+@receiver(products_bulk_updated)
+def products_bulk_updated_search(sender, product_ids, **kwargs):
+    search.index_products(product_ids)
+
+
+# Обновление фасетного индекса
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def facets_product_changed(sender, instance, **kwargs):
+    facets.schedule_update([instance.pk])
+
+
+@receiver(post_save, sender=ProductDetail)
+@receiver(post_delete, sender=ProductDetail)
+def facets_detail_changed(sender, instance, origin=None, **kwargs):
+    if not _is_product_cascade(origin):
+        facets.schedule_update([instance.product_id])
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def facets_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            facets.schedule_update([instance.pk])
+    elif action == 'pre_clear':
+        facets.schedule_update(instance.products.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        facets.schedule_update(pk_set)
+
+
+@receiver(post_delete, sender=Tag)
+def facets_tag_deleted(sender, instance, **kwargs):
+    facets.remove_value('tag', instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def facets_category_deleted(sender, instance, **kwargs):
+    facets.remove_value('category', instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def facets_labels_changed(sender, **kwargs):
+    # Названия значений берутся из кэша боковых панелей, достаточно сменить версию
+    facets.publish_changes(())
+
+
+@receiver(products_bulk_updated)
+def products_bulk_updated_facets(sender, product_ids, **kwargs):
+    facets.schedule_update(product_ids)
+
+
+# Копии изображений товаров (очередь после коммита, см. catalog/images.py)
+@receiver(post_save, sender=Product)
+def product_image_saved(sender, instance, **kwargs):
+    if instance.image:
+        images.schedule(instance.image)
+
+
+# Сброс полностраничного кэша списков (после обработчика фасетов: версии страниц
+# после коммита меняются, когда индекс уже готов; страницы с новыми копиями
+# изображений сбрасывает generate_image_derivatives)
+@receiver(post_save, sender=Product)
+def product_saved_pages(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    old_category_id = loaded.get('category_id')
+    # Количество товаров в боковых панелях меняется только при публикации и смене категории
+    if created or (old_category_id, loaded.get('is_published')) != (instance.category_id, instance.is_published):
+        page_cache.invalidate(cache.SIDEBAR)
+    page_cache.invalidate_products([instance.pk], [old_category_id, instance.category_id])
+    instance._loaded_values = {'category_id': instance.category_id, 'is_published': instance.is_published}
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting_pages(sender, instance, **kwargs):
+    # Теги товара ещё не удалены, страницы можно определить
+    page_cache.invalidate_products([instance.pk], [instance.category_id])
+
+
+@receiver(post_save, sender=ProductDetail)
+@receiver(post_delete, sender=ProductDetail)
+def detail_changed_pages(sender, instance, origin=None, **kwargs):
+    if not _is_product_cascade(origin):
+        page_cache.invalidate_products([instance.product_id])
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def tags_changed_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('pre_clear', 'post_add', 'post_remove'):
+        return
+    if not reverse:
+        # Страницы удаляемых тегов нужно сбросить до удаления связей
+        page_cache.invalidate_products([instance.pk])
+        if action == 'post_remove':
+            page_cache.invalidate(*(page_cache.tag_pages(slug) for slug in
+                                    Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True)))
+    elif action == 'pre_clear':
+        page_cache.invalidate_products(instance.products.values_list('pk', flat=True))
+    else:
+        page_cache.invalidate_products(pk_set)
+        page_cache.invalidate(page_cache.tag_pages(instance.slug))
+
+
+@receiver(products_bulk_updated)
+def products_bulk_updated_pages(sender, product_ids, **kwargs):
+    page_cache.invalidate_products(product_ids)
+
@@ -0,0 +1,34 @@
+// Переключение лайка/дизлайка без перезагрузки страницы товара.
+// Сервер возвращает новые счётчики и реакцию пользователя (JSON).
+document.addEventListener('submit', async (event) => {
+    const form = event.target.closest('.reaction-form');
+    if (!form) {
+        return;
+    }
+    event.preventDefault();
+    const container = form.closest('.product-reactions');
+    const buttons = container.querySelectorAll('.reaction-btn[data-reaction]');
+    buttons.forEach((button) => { button.disabled = true; });
+
+    try {
+        const response = await fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            headers: {'Accept': 'application/json'},
+        });
+        if (!response.ok) {
+            throw new Error(response.statusText);
+        }
+        const data = await response.json();
+        const counts = {'1': data.likes_count, '-1': data.dislikes_count};
+        buttons.forEach((button) => {
+            button.querySelector('.reaction-count').textContent = counts[button.dataset.reaction];
+            button.classList.toggle('active', String(data.reaction) === button.dataset.reaction);
+        });
+    } catch (error) {
+        // При ошибке отправляем форму обычным способом
+        form.submit();
+    } finally {
+        buttons.forEach((button) => { button.disabled = false; });
+    }
+});
@@ -0,0 +1,23 @@
+// Подгрузка следующих страниц отзывов без перезагрузки страницы товара.
+// Без JavaScript кнопка "Показать ещё" работает как обычная ссылка.
+document.addEventListener('click', async (event) => {
+    const link = event.target.closest('.reviews-more');
+    if (!link || !link.dataset.url) {
+        return;
+    }
+    event.preventDefault();
+    link.classList.add('loading');
+
+    try {
+        const response = await fetch(link.dataset.url, {headers: {'Accept': 'text/html'}});
+        if (!response.ok) {
+            throw new Error(response.statusText);
+        }
+        // Фрагмент содержит новые отзывы и, если есть ещё, новую кнопку
+        link.insertAdjacentHTML('afterend', await response.text());
+        link.remove();
+    } catch (error) {
+        // При ошибке переходим по обычной ссылке
+        window.location.href = link.href;
+    }
+});
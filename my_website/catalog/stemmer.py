@@ -0,0 +1,133 @@
+"""
+Стеммер для русского языка (алгоритм Snowball, Russian stemming algorithm).
+
+Используется полнотекстовым поиском: основа слова, полученная стеммером,
+является префиксом всех его словоформ, поэтому запрос "платья" превращается
+в префиксный запрос FTS5 "плат"* и находит "платье", "платьев" и т.д.
+"""
+
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    ('в', 'вши', 'вшись'),                               # после а/я
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым',
+    'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),                       # после а/я
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ('ся', 'сь')
+VERB = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют',
+     'ны', 'ть', 'ешь', 'нно'),                          # после а/я
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил',
+     'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт',
+     'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+NOUN = (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией',
+    'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах',
+    'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+)
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+CYRILLIC_WORD = re.compile(r'^[а-я]+$')
+
+
+def _regions(word):
+    """Начало областей RV и R2 (индексы в слове)"""
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _longest(word, start, endings):
+    """Самое длинное окончание из endings, целиком лежащее после start"""
+    for ending in sorted(endings, key=len, reverse=True):
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            return ending
+    return None
+
+
+def _remove_grouped(word, start, groups):
+    """Удаляет окончание из групп (первая группа - только после а/я)"""
+    candidates = []
+    first, second = groups
+    for ending in first:
+        if (word.endswith(ending) and len(word) - len(ending) - 1 >= start
+                and word[-len(ending) - 1] in 'ая'):
+            candidates.append(ending)
+    for ending in second:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            candidates.append(ending)
+    if not candidates:
+        return word, False
+    return word[:-len(max(candidates, key=len))], True
+
+
+def stem(word):
+    """Возвращает основу русского слова (слово приводится к нижнему регистру, ё -> е)"""
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC_WORD.match(word):
+        return word
+
+    rv, r2 = _regions(word)
+
+    # Шаг 1
+    word, removed = _remove_grouped(word, rv, PERFECTIVE_GERUND)
+    if not removed:
+        reflexive = _longest(word, rv, REFLEXIVE)
+        if reflexive:
+            word = word[:-len(reflexive)]
+
+        adjective = _longest(word, rv, ADJECTIVE)
+        if adjective:
+            word = word[:-len(adjective)]
+            word, _ = _remove_grouped(word, rv, PARTICIPLE)
+        else:
+            word, removed = _remove_grouped(word, rv, VERB)
+            if not removed:
+                noun = _longest(word, rv, NOUN)
+                if noun:
+                    word = word[:-len(noun)]
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    derivational = _longest(word, r2, DERIVATIONAL)
+    if derivational:
+        word = word[:-len(derivational)]
+
+    # Шаг 4
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    else:
+        superlative = _longest(word, rv, SUPERLATIVE)
+        if superlative:
+            word = word[:-len(superlative)]
+            if word.endswith('нн') and len(word) - 2 >= rv:
+                word = word[:-1]
+        elif word.endswith('ь') and len(word) - 1 >= rv:
+            word = word[:-1]
+
+    return word
@@ -1,19 +1,47 @@
 from django import template 
-from django.db.models import Count
-from catalog.models import Category, Tag
+from catalog import images
+from catalog.cache import get_sidebar_categories, get_sidebar_tags
 
 register = template.Library()
 
 
 @register.inclusion_tag('catalog/includes/list_categories.html')
-def show_categories():
-    categories = Category.objects.all()
-    # categories = Category.objects.annotate(total=Count("products")).filter(total__gt=0)
+def show_categories(hide_empty=False):
+    categories = get_sidebar_categories()
+    if hide_empty:
+        categories = [category for category in categories if category.total]
     return {'categories': categories}
 
 
 @register.inclusion_tag('catalog/includes/list_tags.html')
-def show_tags():
-    tags = Tag.objects.all()
-    # tags = Tag.objects.annotate(total=Count("products")).filter(total__gt=0)
+def show_tags(hide_empty=False):
+    tags = get_sidebar_tags()
+    if hide_empty:
+        tags = [tag for tag in tags if tag.total]
     return {'tags': tags}
+
+
+@register.inclusion_tag('catalog/includes/responsive_image.html')
+def responsive_image(image, alt='', sizes='100vw', css_class='', loading='lazy'):
+    """
+    Изображение с копиями в современных форматах (см. catalog/images.py):
+    <picture> с srcset/sizes и размытой заглушкой до загрузки.
+    Если копии ещё не созданы - обычный <img> с оригиналом.
+    """
+    context = {'image': image, 'alt': alt, 'sizes': sizes, 'css_class': css_class, 'loading': loading}
+    manifest = images.get_manifest(image.name, image.storage) if image else None
+    if not manifest:
+        return context
+
+    def srcset(renditions):
+        return ', '.join(f'{image.storage.url(name)} {width}w' for width, name in renditions)
+
+    fallback = manifest['renditions'][manifest['fallback']]
+    context.update({
+        'manifest': manifest,
+        'sources': [{'type': mime, 'srcset': srcset(renditions)}
+                    for mime, renditions in manifest['renditions'].items() if mime != manifest['fallback']],
+        'src': image.storage.url(fallback[-1][1]),
+        'srcset': srcset(fallback),
+    })
+    return context
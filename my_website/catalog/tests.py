@@ -1,3 +1,932 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import unittest
+import warnings
+import zipfile
+from unittest import mock
+from xml.etree import ElementTree
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from homepage.templatetags import homepage_tags
+from my_website import urls as root_urls
+from monitoring import prometheus
+from monitoring.metrics import QueryBudgetExceeded
+from monitoring.models import SlowQuery
+from users.models import User
+from . import cache as catalog_cache
+from . import exporter, facets, images, importer, reaction_buffer, reactions, search
+from .pagination import InvalidCursor, KeysetPaginator
+from .models import (Category, FacetBitmap, PendingImage, Product, ProductDetail, ProductFacetKeys,
+                     ProductReaction, Review, Tag)
+from .views import ProductPageMixin
 
 # Create your tests here.
+
+
+# URLconf с асинхронными представлениями, как под ASGI (настройка ASYNC_VIEWS)
+class AsyncViewsURLConf:
+    urlpatterns = root_urls.get_urlpatterns(async_views=True)
+    handler404 = root_urls.handler404
+
+
+class ProductViewQueriesTests(TestCase):
+    """Страница товара загружается фиксированным числом запросов"""
+
+    def setUp(self):
+        cache.clear()
+        # Превышение бюджета SQL-запросов представления - ошибка теста
+        self.enterContext(warnings.catch_warnings())
+        warnings.simplefilter('error', QueryBudgetExceeded)
+        self.category = Category.objects.create(name='Платья', slug='dresses')
+        self.user = User.objects.create_user('viewer', password='password')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_product'))
+        self.client.force_login(self.user)
+
+    def create_product(self, slug, tags_count, reviews_count):
+        product = Product.objects.create(name=slug, slug=slug, description='Описание', price=1000,
+                                         category=self.category, is_published=True)
+        ProductDetail.objects.create(product=product, color='Синий', material='Хлопок')
+        product.tags.set(Tag.objects.create(name=f'{slug}-tag-{i}', slug=f'{slug}-tag-{i}')
+                         for i in range(tags_count))
+        for i in range(reviews_count):
+            author = User.objects.create(username=f'{slug}-author-{i}')
+            Review.objects.create(product=product, user=author, text='Отличный товар', rating=5)
+        ProductReaction.objects.create(product=product, user=self.user,
+                                       reaction_type=ProductReaction.ReactionType.LIKE)
+        return product
+
+    def count_queries(self, product):
+        url = reverse('product', kwargs={'product_slug': product.slug})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_depend_on_tags_and_reviews(self):
+        small = self.create_product('small', tags_count=1, reviews_count=1)
+        large = self.create_product('large', tags_count=8, reviews_count=10)
+        # Первый запрос заполняет кэш боковых панелей и меню
+        self.count_queries(small)
+
+        small_count, _ = self.count_queries(small)
+        large_count, response = self.count_queries(large)
+
+        self.assertEqual(small_count, large_count)
+        # Сессия, пользователь, права (2), валидаторы ETag, товар, теги, отзывы с авторами
+        self.assertEqual(large_count, 8)
+        self.assertContains(response, 'large-tag-7')
+        self.assertContains(response, 'large-author-9')
+        self.assertContains(response, 'Хлопок')
+        self.assertEqual(response.context['user_reaction'], ProductReaction.ReactionType.LIKE)
+        self.assertFalse(response.context['user_has_review'])
+
+    def test_async_view_within_budget(self):
+        product = self.create_product('async', tags_count=8, reviews_count=10)
+        with override_settings(ROOT_URLCONF=AsyncViewsURLConf):
+            # Холодный кэш боковых панелей укладывается в бюджет представления
+            self.count_queries(product)
+            count, response = self.count_queries(product)
+
+        # Сессия, пользователь, права (2), валидаторы ETag, товар, теги, отзывы с авторами
+        self.assertEqual(count, 8)
+        self.assertContains(response, 'async-tag-7')
+        self.assertContains(response, 'async-author-9')
+        self.assertEqual(response.context['user_reaction'], ProductReaction.ReactionType.LIKE)
+        self.assertFalse(response.context['user_has_review'])
+
+    def test_detail_is_optional(self):
+        product = Product.objects.create(name='bare', slug='bare', description='Описание', price=10,
+                                         is_published=True)
+        _, response = self.count_queries(product)
+        self.assertIsNone(response.context['user_reaction'])
+
+    def test_detail_change_updates_validators(self):
+        product = self.create_product('edited', tags_count=1, reviews_count=0)
+        url = reverse('product', kwargs={'product_slug': product.slug})
+        for urlconf in ('my_website.urls', AsyncViewsURLConf):
+            with self.subTest(urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                etag = self.client.get(url)['ETag']
+                detail = ProductDetail.objects.get(product=product)
+                detail.color = 'Зелёный' if detail.color != 'Зелёный' else 'Синий'
+                detail.save()
+
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, detail.color)
+
+    def test_server_timing_header(self):
+        product = self.create_product('timed', tags_count=1, reviews_count=1)
+        self.count_queries(product)
+        count, response = self.count_queries(product)
+        self.assertIn(f'desc="{count} queries"', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+
+    def test_query_budget_exceeded(self):
+        product = self.create_product('heavy', tags_count=1, reviews_count=1)
+        with mock.patch.object(ProductPageMixin, 'query_budget', 3):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.count_queries(product)
+
+    def test_slow_query_log(self):
+        product = self.create_product('slow', tags_count=1, reviews_count=1)
+        self.count_queries(product)
+        _, response = self.count_queries(product)
+        with override_settings(SLOW_QUERIES={'THRESHOLD': 0}), \
+                self.assertLogs('monitoring.slow_queries', 'WARNING') as logs:
+            _, logged_response = self.count_queries(product)
+        # Значения параметров (slug товара) не сохраняются
+        self.assertFalse(any("'slow'" in line for line in logs.output))
+        self.assertFalse(SlowQuery.objects.filter(params__contains='slow').exists())
+        self.assertTrue(SlowQuery.objects.filter(sql__contains='"slug" = ?',
+                                                 params__regex=r'^\d+: .*str.* \[\w+\]$').exists())
+
+        # Запросы журнала не входят в показатели запроса
+        self.assertEqual(logged_response['Server-Timing'].split(',')[0].split(';')[-1],
+                         response['Server-Timing'].split(',')[0].split(';')[-1])
+        reviews = SlowQuery.objects.filter(view='product', sql__startswith='SELECT',
+                                           sql__contains='FROM "catalog_review"').first()
+        self.assertIsNotNone(reviews)
+        self.assertNotIn('%s', reviews.sql)
+        self.assertTrue(reviews.plan)
+
+    def test_catalog_sort(self):
+        tag = Tag.objects.create(name='Лето', slug='summer')
+        for i, price in enumerate((300, 100, 600, 500, 200, 400)):
+            product = Product.objects.create(name=f'sorted-{i}', slug=f'sorted-{i}', description='Описание',
+                                             price=price, category=self.category, is_published=True)
+            product.tags.add(tag)
+        urls = (reverse('category', kwargs={'category_slug': self.category.slug}),
+                reverse('tag', kwargs={'tag_slug': tag.slug}))
+        # Тег проверяется и через JOIN, и подзапросом EXISTS
+        for url, semi_join_share in ((urls[0], 0.03), (urls[1], 2), (urls[1], 0)):
+            with self.subTest(url=url, semi_join_share=semi_join_share), \
+                    mock.patch('catalog.views.TagView.semi_join_share', semi_join_share):
+                cache.clear()
+                response = self.client.get(url, {'sort': 'price_desc'})
+                self.assertEqual([p.price for p in response.context['products']], [600, 500, 400, 300])
+                self.assertEqual(response.context['current_sort'], 'price_desc')
+                next_cursor = response.context['page_obj'].next_cursor
+                response = self.client.get(url, {'sort': 'price_desc', 'cursor': next_cursor})
+                self.assertEqual([p.price for p in response.context['products']], [200, 100])
+                # Курсор другой сортировки недействителен
+                self.assertEqual(self.client.get(url, {'sort': 'price_asc', 'cursor': next_cursor}).status_code,
+                                 404)
+                response = self.client.get(url, {'sort': 'unknown'})
+                self.assertEqual(response.context['current_sort'], 'newest')
+
+
+class KeysetPaginatorTests(TestCase):
+    """Keyset-пагинация: курсоры, равные ключи сортировки, направление"""
+
+    def setUp(self):
+        for i, price in enumerate((300, 100, 200, 100, 300, 100, 200)):
+            Product.objects.create(name=f'Товар {i}', slug=f'item-{i}', description='Описание', price=price,
+                                   is_published=True)
+
+    def walk(self, paginator):
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def test_equal_keys_split_between_pages(self):
+        for ordering in (('price', 'id'), ('-price', '-id')):
+            with self.subTest(ordering=ordering):
+                pages = self.walk(KeysetPaginator(Product.objects.all(), 3, ordering=ordering))
+                expected = list(Product.objects.order_by(*ordering).values_list('pk', flat=True))
+                self.assertEqual([obj.pk for page in pages for obj in page], expected)
+                self.assertEqual([len(page) for page in pages], [3, 3, 1])
+                # Назад со второй страницы - снова первая
+                previous = pages[0].paginator.page(pages[1].previous_cursor)
+                self.assertEqual([obj.pk for obj in previous], expected[:3])
+                self.assertFalse(previous.has_previous())
+
+    def test_descending_order(self):
+        page = KeysetPaginator(Product.objects.all(), 4, ordering=('-price', '-id')).page()
+        self.assertEqual([obj.price for obj in page], [300, 300, 200, 200])
+        self.assertGreater(page[0].pk, page[1].pk)
+
+    def test_last_and_empty_pages(self):
+        last = self.walk(KeysetPaginator(Product.objects.all(), 7, ordering=('price', 'id')))[-1]
+        self.assertEqual(len(last), 7)
+        self.assertFalse(last.has_other_pages())
+        self.assertIsNone(last.next_cursor)
+
+        paginator = KeysetPaginator(Product.objects.none(), 3, ordering=('price', 'id'), count=True)
+        empty = paginator.page()
+        self.assertEqual(list(empty), [])
+        self.assertFalse(empty.has_other_pages())
+        self.assertEqual(empty.count, 0)
+
+    def test_tampered_cursor(self):
+        paginator = KeysetPaginator(Product.objects.all(), 3, ordering=('price', 'id'))
+        cursor = paginator.page().next_cursor
+        tampered = cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')
+        with self.assertRaises(InvalidCursor) as error:
+            paginator.page(tampered)
+        self.assertIsInstance(error.exception.__cause__, signing.BadSignature)
+        # Курсор другой сортировки не принимается
+        other = KeysetPaginator(Product.objects.all(), 3, ordering=('-price', '-id'))
+        with self.assertRaises(InvalidCursor):
+            other.page(cursor)
+
+
+class FacetIndexTests(TestCase):
+    """Инкрементальное обновление фасетного индекса и фильтрация по нему"""
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch.dict(facets._snapshot, {'version': None, 'bitmaps': {}}))
+        self.dresses = Category.objects.create(name='Платья', slug='dresses')
+        self.shoes = Category.objects.create(name='Обувь', slug='shoes')
+        self.summer = Tag.objects.create(name='Лето', slug='summer')
+        self.sale = Tag.objects.create(name='Скидки', slug='sale')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap = self.create_product('cheap', 500, self.dresses, 'Синий', [self.summer])
+            self.middle = self.create_product('middle', 2000, self.dresses, 'Красный', [self.summer, self.sale])
+            self.expensive = self.create_product('expensive', 20000, self.shoes, 'Синий', [])
+
+    def create_product(self, slug, price, category, color, tags):
+        product = Product.objects.create(name=slug, slug=slug, description='Описание', price=price,
+                                         category=category, is_published=True)
+        ProductDetail.objects.create(product=product, color=color)
+        product.tags.set(tags)
+        return product
+
+    def index_state(self):
+        return ({(row.facet, row.value): bytes(row.bitmap) for row in FacetBitmap.objects.all()},
+                {row.product_id: row.keys for row in ProductFacetKeys.objects.all()})
+
+    def assert_matches_rebuild(self):
+        state = self.index_state()
+        facets.rebuild_index()
+        self.assertEqual(state, self.index_state())
+
+    def test_incremental_update_matches_rebuild(self):
+        self.assert_matches_rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap.price = 7000
+            self.cheap.category = self.shoes
+            self.cheap.save()
+            self.cheap.tags.set([self.sale])
+            self.middle.detail.color = 'Зелёный'
+            self.middle.detail.save()
+            self.expensive.delete()
+        self.assertNotIn(('color', 'Красный'), self.index_state()[0])
+        self.assertNotIn(self.expensive.pk, {row.product_id for row in ProductFacetKeys.objects.all()})
+        self.assert_matches_rebuild()
+
+    def test_update_reads_only_affected_bitmaps(self):
+        Product.objects.filter(pk=self.cheap.pk).update(is_published=False)
+        with CaptureQueriesContext(connection) as queries:
+            facets.update_products([self.cheap.pk])
+        bitmap_selects = [query['sql'] for query in queries.captured_queries
+                          if query['sql'].startswith('SELECT') and '"catalog_facetbitmap"' in query['sql']]
+        self.assertEqual(len(bitmap_selects), 1)
+        self.assertIn('WHERE', bitmap_selects[0])
+        self.assert_matches_rebuild()
+
+    def test_snapshot_reloads_only_changed_bitmaps(self):
+        facets.get_bitmaps()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap.tags.set([self.sale])
+        with CaptureQueriesContext(connection) as queries:
+            bitmaps = facets.get_bitmaps()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('WHERE', queries[0]['sql'])
+        self.assertEqual(bitmaps, {(facet, value): facets._to_int(bitmap) for facet, value, bitmap
+                                   in FacetBitmap.objects.values_list('facet', 'value', 'bitmap')})
+        self.assertEqual(bitmaps[('tag', str(self.summer.pk))], 1 << self.middle.pk)
+
+    def test_filter_queryset_and_build_facets(self):
+        selected = facets.parse_selection(QueryDict(f'price=low&price=medium&tag={self.summer.pk}&color=Синий'))
+        self.assertEqual(selected, {'price': {'low', 'medium'}, 'tag': {str(self.summer.pk)}, 'color': {'Синий'}})
+        self.assertEqual(list(facets.filter_queryset(Product.published.all(), selected)), [self.cheap])
+
+        result = facets.build_facets(selected, fixed={'category': {str(self.dresses.pk)}}, exclude=('category',))
+        self.assertEqual(result['total'], 1)
+        counts = {facet['name']: {item['value']: item['count'] for item in facet['values']}
+                  for facet in result['facets']}
+        self.assertNotIn('category', counts)
+        # Счётчики значения учитывают фильтры остальных фасетов, но не своего
+        self.assertEqual(counts['color'], {'Синий': 1, 'Красный': 1})
+        self.assertEqual(counts['price'], {'low': 1, 'medium': 0})
+        self.assertEqual(counts['tag'], {str(self.summer.pk): 1})
+
+
+class PageCacheTests(TestCase):
+    """Полностраничный кэш списков для анонимных пользователей"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Платья', slug='dresses')
+        Product.objects.create(name='Платье', slug='dress', description='Описание', price=1000,
+                               category=category, is_published=True)
+
+    def test_cached_for_anonymous(self):
+        url = reverse('catalog')
+        first = self.client.get(url, REMOTE_ADDR='192.0.2.1', HTTP_ACCEPT_ENCODING='gzip')
+        second = self.client.get(url, REMOTE_ADDR='192.0.2.1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        self.assertEqual(second['X-Page-Cache'], 'HIT')
+        self.assertEqual(second['Content-Encoding'], 'gzip')
+
+    def test_key_ignores_unknown_params(self):
+        url = reverse('catalog')
+        first = self.client.get(url, {'sort': 'price_asc', 'price': 'low', 'utm_source': 'mail'},
+                                REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        self.assertNotContains(first, 'utm_source')
+        # Тот же набор параметров в другом порядке и без лишних - та же запись
+        second = self.client.get(f'{url}?price=low&ref=x&sort=price_asc', REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(second['X-Page-Cache'], 'HIT')
+        other = self.client.get(url, {'sort': 'price_desc'}, REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(other['X-Page-Cache'], 'MISS')
+
+    @unittest.skipUnless(settings.DEBUG_TOOLBAR, 'панель отладки не подключена')
+    @override_settings(DEBUG=True)
+    def test_skipped_with_debug_toolbar(self):
+        # Панель кэша debug_toolbar сериализует значения в JSON и не принимает сжатые тела
+        for url in (reverse('catalog'), reverse('homepage')):
+            with self.subTest(url=url):
+                response = self.client.get(url, REMOTE_ADDR='127.0.0.1', HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header('X-Page-Cache'))
+                self.assertContains(response, 'djDebug')
+
+
+class SidebarMenuCacheTests(TestCase):
+    """Кэш боковых панелей и меню: попадание без запросов, промах после изменения"""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Платья', slug='dresses', menu_position=1)
+        self.tag = Tag.objects.create(name='Лето', slug='summer')
+        self.product = Product.objects.create(name='Платье', slug='dress', description='Описание', price=1000,
+                                              category=self.category, is_published=True)
+
+    def assertLoads(self, loader, queries):
+        with self.assertNumQueries(queries):
+            return loader()
+
+    def test_sidebar(self):
+        loaders = (catalog_cache.get_sidebar_categories, catalog_cache.get_sidebar_tags)
+        changes = (
+            lambda: Category.objects.create(name='Юбки', slug='skirts'),
+            lambda: Tag.objects.create(name='Зима', slug='winter'),
+            lambda: Product.objects.create(name='Юбка', slug='skirt', description='Описание', price=500,
+                                           category=self.category, is_published=True),
+        )
+        for change in changes:
+            for loader in loaders:
+                self.assertLoads(loader, 1)
+                self.assertLoads(loader, 0)
+            change()
+        for loader in loaders:
+            self.assertLoads(loader, 1)
+
+    def test_sidebar_counts_published_products(self):
+        self.assertEqual(self.assertLoads(catalog_cache.get_sidebar_categories, 1)[0].total, 1)
+        # Изменение цены не меняет боковые панели
+        self.product.price = 1200
+        self.product.save()
+        self.assertLoads(catalog_cache.get_sidebar_categories, 0)
+
+        self.product.is_published = False
+        self.product.save()
+        self.assertEqual(self.assertLoads(catalog_cache.get_sidebar_categories, 1)[0].total, 0)
+
+    @override_settings(TOP_CATEGORIES=None)
+    def test_menu(self):
+        menu = self.assertLoads(homepage_tags.get_top_categories, 1)
+        self.assertEqual([item['name'] for item in menu], ['Платья'])
+        self.assertLoads(homepage_tags.get_top_categories, 0)
+        # Теги и товары в меню не показываются
+        Tag.objects.create(name='Зима', slug='winter')
+        self.product.save()
+        self.assertLoads(homepage_tags.get_top_categories, 0)
+
+        self.category.menu_title = 'Все платья'
+        self.category.save()
+        menu = self.assertLoads(homepage_tags.get_top_categories, 1)
+        self.assertEqual([item['name'] for item in menu], ['Все платья'])
+
+
+class SearchTests(TestCase):
+    """Полнотекстовый поиск: основы слов, ё/е, ранжирование BM25 и поиск без FTS5"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Одежда', slug='clothes')
+        self.dress = Product.objects.create(name='Зелёное платье', slug='dress', description='Летнее, из хлопка',
+                                            price=1000, category=category, is_published=True)
+        self.skirt = Product.objects.create(name='Юбка миди', slug='skirt', price=800, category=category,
+                                            description='Подойдёт к любому платью', is_published=True)
+        Product.objects.create(name='Платье вечернее', slug='hidden', description='Черновик', price=5000,
+                               category=category, is_published=False)
+
+    def slugs(self, results):
+        return [product.slug for product in results[:10]]
+
+    @unittest.skipUnless(search.is_available(), 'FTS5 доступен только на SQLite')
+    def test_stemming_and_yo(self):
+        for query in ('платьями', 'зеленые платья', 'ЗЕЛЁНЫЙ', 'летняя'):
+            with self.subTest(query=query):
+                self.assertEqual(self.slugs(search.search_products(query))[0], 'dress')
+        self.assertEqual(self.slugs(search.search_products('зеленая юбка')), [])
+
+    @unittest.skipUnless(search.is_available(), 'FTS5 доступен только на SQLite')
+    def test_bm25_ordering(self):
+        # Слово в названии весит больше, чем в описании
+        results = search.search_products('платье')
+        self.assertEqual(results.count(), 2)
+        self.assertEqual(self.slugs(results), ['dress', 'skirt'])
+        self.assertEqual(str(results[0].highlighted_name), 'Зеленое <mark>платье</mark>')
+
+        response = self.client.get(reverse('search'), {'q': 'платье'})
+        self.assertEqual([product.slug for product in response.context['products']], ['dress', 'skirt'])
+
+    def test_fallback_without_fts(self):
+        with mock.patch.object(search, 'is_available', return_value=False):
+            results = search.search_products('Юбка')
+            self.assertIsInstance(results, search.FallbackSearchResults)
+            self.assertEqual(self.slugs(results), ['skirt'])
+            self.assertEqual(self.slugs(search.search_products('платье Одежда')), ['dress'])
+            self.assertEqual(search.search_products('  ').count(), 0)
+
+
+class AsyncViewsTests(TestCase):
+    """Асинхронные представления (под ASGI) отдают то же, что синхронные"""
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch.dict(facets._snapshot, {'version': None, 'bitmaps': {}}))
+        category = Category.objects.create(name='Платья', slug='dresses')
+        tag = Tag.objects.create(name='Лето', slug='summer')
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(7):
+                product = Product.objects.create(name=f'Платье {i}', slug=f'dress-{i}', description='Описание',
+                                                 price=100 * (i + 1), category=category, is_published=True)
+                product.tags.add(tag)
+        self.product = Product.objects.get(slug='dress-1')
+        self.user = User.objects.create_user('viewer', password='password')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_product'))
+        author = User.objects.create_user('author', password='password')
+        Review.objects.create(product=self.product, user=author, text='Отличное платье', rating=5)
+        self.client.force_login(self.user)
+
+    def get(self, url, async_views=True, **extra):
+        with override_settings(ROOT_URLCONF=AsyncViewsURLConf if async_views else 'my_website.urls'):
+            return self.client.get(url, **extra)
+
+    def post(self, url, data, async_views=True, **extra):
+        with override_settings(ROOT_URLCONF=AsyncViewsURLConf if async_views else 'my_website.urls'):
+            return self.client.post(url, data, **extra)
+
+    def test_pages_match_sync(self):
+        product_url = reverse('product', kwargs={'product_slug': self.product.slug})
+        list_urls = (reverse('catalog'), reverse('catalog') + '?price=low',
+                     reverse('category', kwargs={'category_slug': 'dresses'}),
+                     reverse('tag', kwargs={'tag_slug': 'summer'}))
+        for url in list_urls:
+            with self.subTest(url=url):
+                sync, async_ = self.get(url, async_views=False), self.get(url)
+                self.assertEqual(async_.status_code, 200)
+                self.assertEqual([p.slug for p in async_.context['products']],
+                                 [p.slug for p in sync.context['products']])
+                self.assertEqual(async_.context['facets'], sync.context['facets'])
+
+        sync, async_ = self.get(product_url, async_views=False), self.get(product_url)
+        self.assertEqual(async_.status_code, 200)
+        for key in ('reviews_count', 'likes_count', 'dislikes_count', 'user_reaction', 'user_has_review'):
+            self.assertEqual(async_.context[key], sync.context[key], key)
+        self.assertEqual(list(async_.context['reviews_page']), list(sync.context['reviews_page']))
+
+        url = reverse('product_reviews', kwargs={'product_slug': self.product.slug})
+        self.assertEqual(self.get(url, HTTP_ACCEPT='application/json').json(),
+                         self.get(url, async_views=False, HTTP_ACCEPT='application/json').json())
+        self.assertEqual(self.get(reverse('homepage')).status_code, 200)
+
+    def test_cursor_pagination(self):
+        url = reverse('catalog')
+        first = self.get(url)
+        second = self.get(url, data={'cursor': first.context['page_obj'].next_cursor})
+        slugs = [p.slug for p in first.context['products']] + [p.slug for p in second.context['products']]
+        self.assertEqual(sorted(slugs), sorted(Product.objects.values_list('slug', flat=True)))
+        self.assertIsNone(second.context['page_obj'].next_cursor)
+
+        self.assertEqual(self.get(url, data={'cursor': 'bad'}).status_code, 404)
+        self.assertEqual(self.get(reverse('category', kwargs={'category_slug': 'missing'})).status_code, 404)
+        self.assertEqual(self.get(reverse('tag', kwargs={'tag_slug': 'missing'})).status_code, 404)
+        self.assertEqual(self.get(reverse('product', kwargs={'product_slug': 'missing'})).status_code, 404)
+
+    def test_conditional_get(self):
+        for url in (reverse('catalog'), reverse('product', kwargs={'product_slug': self.product.slug})):
+            with self.subTest(url=url):
+                etag = self.get(url)['ETag']
+                self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_reaction_and_review(self):
+        url = reverse('product', kwargs={'product_slug': self.product.slug})
+        response = self.post(reverse('product_reaction', kwargs={'product_slug': self.product.slug}),
+                             {'reaction_type': '1'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {'reaction': 1, 'likes_count': 1, 'dislikes_count': 0})
+        page = self.get(url)
+        self.assertEqual(page.context['user_reaction'], ProductReaction.ReactionType.LIKE)
+
+        review_url = reverse('add_review', kwargs={'product_slug': self.product.slug})
+        for async_views in (False, True):
+            with self.subTest(async_views=async_views):
+                # Страница с ошибками формы показывает то же, что и GET
+                response = self.post(review_url, {'rating': 5, 'text': ''}, async_views=async_views)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.context['review_form'].errors)
+                for key in ('reviews_count', 'likes_count', 'dislikes_count', 'user_reaction', 'user_has_review',
+                            'review_sorts'):
+                    self.assertEqual(response.context[key], page.context[key], key)
+                self.assertEqual(list(response.context['reviews_page']), list(page.context['reviews_page']))
+        response = self.post(review_url, {'rating': 4, 'text': 'Хорошо сидит, ткань приятная'})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertTrue(self.get(url).context['user_has_review'])
+
+    def test_access(self):
+        url = reverse('product', kwargs={'product_slug': self.product.slug})
+        self.client.logout()
+        self.assertEqual(self.get(url).status_code, 302)
+        # Анонимному пользователю список отдаётся из кэша страниц
+        self.assertEqual(self.get(reverse('catalog'))['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.get(reverse('catalog'))['X-Page-Cache'], 'HIT')
+
+        self.client.force_login(User.objects.create_user('stranger', password='password'))
+        self.assertEqual(self.get(url).status_code, 403)
+
+    async def test_keyset_apage_matches_page(self):
+        paginator = KeysetPaginator(Product.objects.all(), 3, ordering=('price', 'id'), count=True)
+        apaginator = KeysetPaginator(Product.objects.all(), 3, ordering=('price', 'id'), count=True)
+        cursor = None
+        while True:
+            page, apage = await sync_to_async(paginator.page)(cursor), await apaginator.apage(cursor)
+            self.assertEqual(list(apage), list(page))
+            self.assertEqual((apage.next_cursor, apage.previous_cursor), (page.next_cursor, page.previous_cursor))
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(apaginator.count, 7)
+
+
+class ImporterTests(TestCase):
+    """Импорт товаров: ключи строк и подбор свободных URL"""
+
+    def setUp(self):
+        cache.clear()
+        self.existing = Product.objects.create(name='Платье летнее', slug='plate-letnee', description='Чужой товар',
+                                               price=700, is_published=True)
+
+    def import_rows(self, *rows, **kwargs):
+        return importer.import_rows(enumerate(rows, 2), **kwargs)
+
+    def test_same_names_create_separate_products(self):
+        row = {'name': 'Платье летнее', 'description': 'Описание товара', 'price': '1000'}
+        result = self.import_rows(row, dict(row, price='1200'), chunk_size=1)
+        result = self.import_rows(dict(row, price='1500'))
+
+        self.assertEqual(result.error_count, 0)
+        self.assertEqual(dict(Product.objects.values_list('slug', 'price')),
+                         {'plate-letnee': 700, 'plate-letnee-2': 1000, 'plate-letnee-3': 1200,
+                          'plate-letnee-4': 1500})
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.description, 'Чужой товар')
+
+    def test_sku_and_slug_update_products(self):
+        row = {'name': 'Платье летнее', 'description': 'Описание товара', 'price': '1000', 'sku': 'A-1'}
+        self.import_rows(row, {'name': 'Юбка миди', 'slug': 'yubka', 'description': 'Описание товара', 'price': '500'})
+        product = Product.objects.get(detail__sku='A-1')
+        self.assertEqual(product.slug, 'plate-letnee-a-1')
+
+        result = self.import_rows(dict(row, name='Платье вечернее', price='1100'),
+                                  {'name': 'Юбка миди', 'slug': 'yubka', 'description': 'Описание товара', 'price': '550'})
+        self.assertEqual(result.error_count, 0)
+        self.assertEqual(Product.objects.count(), 3)
+        product.refresh_from_db()
+        self.assertEqual((product.slug, product.name, product.price), ('plate-letnee-a-1', 'Платье вечернее', 1100))
+        self.assertEqual(Product.objects.get(slug='yubka').price, 550)
+
+    def test_collisions_reported(self):
+        ProductDetail.objects.create(product=self.existing, sku='B-2')
+        other = Product.objects.create(name='Копия', slug='kopiya', description='Описание', price=10)
+        ProductDetail.objects.create(product=other, sku='B-2')
+        errors = []
+        result = self.import_rows(
+            {'name': 'Юбка миди', 'slug': 'yubka', 'description': 'Описание товара', 'price': '500'},
+            {'name': 'Юбка синяя', 'slug': 'yubka', 'description': 'Описание товара', 'price': '600'},
+            {'name': 'Платье', 'description': 'Описание товара', 'price': '900', 'sku': 'B-2'},
+            on_error=lambda line, messages: errors.append(line),
+        )
+
+        self.assertEqual((result.imported, result.error_count), (1, 2))
+        self.assertEqual(errors, [3, 4])
+        self.assertEqual(Product.objects.get(slug='yubka').price, 500)
+        self.assertEqual(Product.objects.get(slug='plate-letnee').price, 700)
+
+    def test_existing_categories_not_renamed(self):
+        category = Category.objects.create(name='Платья', slug='platya')
+        menu_version = catalog_cache.get_version(catalog_cache.MENU)
+        self.import_rows({'name': 'Юбка миди', 'description': 'Описание товара', 'price': '500',
+                          'category': 'Платья и сарафаны', 'category_slug': 'platya'})
+        category.refresh_from_db()
+        self.assertEqual(category.name, 'Платья')
+        self.assertEqual(catalog_cache.get_version(catalog_cache.MENU), menu_version)
+
+        self.import_rows({'name': 'Юбка синяя', 'description': 'Описание товара', 'price': '600',
+                          'category': 'Юбки'})
+        self.assertEqual(Product.objects.get(name='Юбка синяя').category.name, 'Юбки')
+        self.assertGreater(catalog_cache.get_version(catalog_cache.MENU), menu_version)
+
+
+class ExporterTests(TestCase):
+    """Выгрузка каталога: XLSX открывается как книга, CSV загружается обратно импортом"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Платья', slug='dresses')
+        self.product = Product.objects.create(name='Платье летнее', slug='dress',
+                                              description='Ткань "лён" <50%> & хлопок,\nдлинное\x01', price=1000,
+                                              category=category, is_published=True)
+        ProductDetail.objects.create(product=self.product, color='Синий', weight='0.35')
+        self.product.tags.set([Tag.objects.create(name='Лето', slug='summer'),
+                               Tag.objects.create(name='Хлопок', slug='cotton')])
+        skirt = Product.objects.create(name='Юбка миди', slug='skirt', description='Описание товара', price=500)
+        ProductDetail.objects.create(product=skirt, material='Шерсть')
+
+    def test_xlsx_sheet(self):
+        data = b''.join(exporter.export('products', 'xlsx'))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertIn('xl/workbook.xml', archive.namelist())
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = [[cell.findtext('s:v', namespaces=namespace) or cell.findtext('s:is/s:t', namespaces=namespace)
+                 for cell in row.findall('s:c', namespaces=namespace)]
+                for row in sheet.findall('s:sheetData/s:row', namespaces=namespace)]
+        columns = exporter.DATASETS['products'][1]
+        self.assertEqual(rows[0], columns)
+        self.assertEqual(len(rows), 3)
+        product = dict(zip(columns, rows[1]))
+        self.assertEqual(product['name'], 'Платье летнее')
+        # Управляющие символы удаляются, разметка экранируется
+        self.assertEqual(product['description'], 'Ткань "лён" <50%> & хлопок,\nдлинное')
+        self.assertEqual((product['price'], product['tags'], product['color']), ('1000.00', 'Лето, Хлопок', 'Синий'))
+
+    def test_csv_round_trip(self):
+        data = b''.join(exporter.export('products', 'csv'))
+        self.assertTrue(data.startswith('\ufeff'.encode()))
+        fields = ('slug', 'name', 'description', 'price', 'is_published', 'category__slug',
+                  'detail__color', 'detail__material', 'detail__weight')
+        expected = list(Product.objects.order_by('slug').values_list(*fields))
+        Product.objects.all().delete()
+
+        result = importer.import_file(io.BytesIO(data), 'csv')
+        self.assertEqual(result.error_count, 0, str(result.errors))
+        self.assertEqual(list(Product.objects.order_by('slug').values_list(*fields)), expected)
+        self.assertEqual(list(Product.objects.get(slug='dress').tags.order_by('name').values_list('name', flat=True)),
+                         ['Лето', 'Хлопок'])
+
+
+class CounterTests(TestCase):
+    """Денормализованные счётчики товара: сигналы и пересчёт"""
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Платье', slug='dress', description='Описание', price=1000,
+                                              is_published=True)
+        self.other = Product.objects.create(name='Юбка', slug='skirt', description='Описание', price=500,
+                                            is_published=True)
+        self.users = [User.objects.create_user(f'user-{i}', password='password') for i in range(3)]
+
+    def assertCounters(self, product, likes, dislikes, reviews, rating):
+        product.refresh_from_db()
+        self.assertEqual((product.likes_count, product.dislikes_count, product.reviews_count),
+                         (likes, dislikes, reviews))
+        self.assertAlmostEqual(product.rating_avg, rating)
+
+    def test_reviews(self):
+        first = Review.objects.create(product=self.product, user=self.users[0], text='Отличный товар', rating=5)
+        second = Review.objects.create(product=self.product, user=self.users[1], text='Неплохо', rating=2)
+        self.assertCounters(self.product, 0, 0, 2, 3.5)
+
+        second.rating = 4
+        second.save()
+        self.assertCounters(self.product, 0, 0, 2, 4.5)
+
+        second.product = self.other
+        second.save()
+        self.assertCounters(self.product, 0, 0, 1, 5.0)
+        self.assertCounters(self.other, 0, 0, 1, 4.0)
+
+        first.delete()
+        self.assertCounters(self.product, 0, 0, 0, 0.0)
+
+    def test_reactions(self):
+        LIKE, DISLIKE = ProductReaction.ReactionType.LIKE, ProductReaction.ReactionType.DISLIKE
+        reactions = [ProductReaction.objects.create(product=self.product, user=user, reaction_type=LIKE)
+                     for user in self.users]
+        self.assertCounters(self.product, 3, 0, 0, 0.0)
+
+        reactions[0].reaction_type = DISLIKE
+        reactions[0].save()
+        self.assertCounters(self.product, 2, 1, 0, 0.0)
+
+        reactions[1].delete()
+        reactions[0].delete()
+        self.assertCounters(self.product, 1, 0, 0, 0.0)
+
+    def test_recount_repairs_drift(self):
+        Review.objects.create(product=self.product, user=self.users[0], text='Отличный товар', rating=5)
+        Review.objects.create(product=self.product, user=self.users[1], text='Так себе', rating=2)
+        ProductReaction.objects.create(product=self.product, user=self.users[0],
+                                       reaction_type=ProductReaction.ReactionType.LIKE)
+        # Изменения в обход сигналов
+        Product.objects.update(likes_count=10, dislikes_count=3, reviews_count=7, rating_sum=1, rating_avg=0.1)
+
+        call_command('recount_product_counters', stdout=io.StringIO())
+        self.assertCounters(self.product, 1, 0, 2, 3.5)
+        self.assertCounters(self.other, 0, 0, 0, 0.0)
+
+
+class ToggleReactionTests(TestCase):
+    """Переключение реакции: строка ProductReaction и счётчики товара"""
+
+    LIKE = ProductReaction.ReactionType.LIKE
+    DISLIKE = ProductReaction.ReactionType.DISLIKE
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Платье', slug='dress', description='Описание', price=1000,
+                                              is_published=True)
+        self.user = User.objects.create_user('viewer', password='password')
+
+    def toggle(self, reaction_type, user=None):
+        return reactions.toggle_reaction(self.product.pk, (user or self.user).pk, reaction_type)
+
+    def assertReaction(self, reaction_type):
+        self.assertEqual(list(ProductReaction.objects.filter(product=self.product, user=self.user)
+                              .values_list('reaction_type', flat=True)),
+                         [reaction_type] if reaction_type is not None else [])
+
+    def test_like_then_unlike(self):
+        self.assertEqual(self.toggle(self.LIKE), (self.LIKE, 1, 0))
+        self.assertReaction(self.LIKE)
+        self.assertEqual(self.toggle(self.LIKE), (None, 0, 0))
+        self.assertReaction(None)
+
+    def test_like_then_dislike(self):
+        self.toggle(self.LIKE)
+        self.assertEqual(self.toggle(self.DISLIKE), (self.DISLIKE, 0, 1))
+        self.assertReaction(self.DISLIKE)
+        self.assertEqual(ProductReaction.objects.count(), 1)
+
+    def test_repeated_toggles(self):
+        other = User.objects.create_user('other', password='password')
+        self.toggle(self.LIKE, other)
+        for reaction_type in (self.LIKE, self.LIKE, self.DISLIKE, self.LIKE, self.DISLIKE, self.DISLIKE,
+                              self.DISLIKE):
+            self.toggle(reaction_type)
+        self.assertReaction(self.DISLIKE)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.likes_count, self.product.dislikes_count), (1, 1))
+
+
+class ReactionBufferTests(TestCase):
+    """Буферизованная запись реакций: последнее по времени событие побеждает"""
+
+    def setUp(self):
+        cache.clear()
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(REACTION_BUFFER={'ENABLED': True, 'DIRECTORY': directory}))
+        # Поток сброса в тестах не запускается, буфер сбрасывается явно
+        self.start_flusher = self.enterContext(mock.patch.object(reaction_buffer, 'start_flusher'))
+        self.directory = directory
+        self.product = Product.objects.create(name='Платье летнее', slug='dress', description='Описание',
+                                              price=1000, is_published=True)
+        self.user = User.objects.create_user('viewer', password='password')
+
+    def reaction(self):
+        return (ProductReaction.objects.filter(product=self.product, user=self.user)
+                .values_list('reaction_type', flat=True).first())
+
+    def write_log(self, pid, *events):
+        with open(os.path.join(self.directory, f'reactions-{pid}.log'), 'w', encoding='utf-8') as file:
+            for t, state in events:
+                file.write(json.dumps({'p': self.product.pk, 'u': self.user.pk, 's': state, 't': t}) + '\n')
+
+    def test_record_and_flush(self):
+        like = ProductReaction.ReactionType.LIKE
+        self.assertEqual(reaction_buffer.record(self.product.pk, self.user.pk, like), (like, 1, 0))
+        self.assertIsNone(self.reaction())
+        self.assertEqual(reaction_buffer.flush(), 1)
+        self.assertEqual(self.reaction(), like)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.likes_count, 1)
+
+        self.assertEqual(reaction_buffer.record(self.product.pk, self.user.pk, like), (None, 0, 0))
+        reaction_buffer.flush()
+        self.assertIsNone(self.reaction())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_failed_flush_keeps_pending_deltas(self):
+        like = ProductReaction.ReactionType.LIKE
+        reaction_buffer.record(self.product.pk, self.user.pk, like)
+        with mock.patch.object(reaction_buffer, 'apply_events', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                reaction_buffer.flush()
+        self.assertEqual(reaction_buffer.pending_deltas(self.product.pk), {like: 1})
+        self.assertEqual(reaction_buffer.record(self.product.pk, self.user.pk, like), (None, 0, 0))
+
+        self.assertEqual(reaction_buffer.flush(), 1)
+        self.assertEqual(reaction_buffer.pending_deltas(self.product.pk), {})
+        self.assertIsNone(self.reaction())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_prometheus_metrics(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(METRICS={'ENABLED': True, 'DIRECTORY': directory}))
+        reaction_buffer.record(self.product.pk, self.user.pk, ProductReaction.ReactionType.LIKE)
+        self.assertIn('\nreaction_buffer_depth 1.0\n', prometheus.render())
+        reaction_buffer.flush()
+        metrics = prometheus.render()
+        self.assertIn('\nreaction_buffer_depth 0.0\n', metrics)
+        self.assertIn('\nreaction_buffer_flush_duration_seconds_count 1.0\n', metrics)
+
+    def test_older_event_does_not_override(self):
+        key = (self.product.pk, self.user.pk)
+        dislike = ProductReaction.ReactionType.DISLIKE
+        # Снятие реакции записано раньше, чем более старая установка из журнала другого процесса
+        reaction_buffer.apply_events({key: (200.0, reaction_buffer.NO_REACTION)})
+        reaction_buffer.apply_events({key: (100.0, dislike)})
+        self.assertIsNone(self.reaction())
+
+        reaction_buffer.apply_events({key: (300.0, dislike)})
+        self.assertEqual(self.reaction(), dislike)
+        reaction_buffer.apply_events({key: (250.0, reaction_buffer.NO_REACTION)})
+        self.assertEqual(self.reaction(), dislike)
+
+    def test_replay_orphans_by_event_time(self):
+        like, dislike = ProductReaction.ReactionType.LIKE, ProductReaction.ReactionType.DISLIKE
+        # Журналы читаются по имени: более новые события первого не затираются вторым
+        self.write_log(1001, (100.0, like), (300.0, dislike))
+        self.write_log(1002, (200.0, like))
+        with mock.patch.object(reaction_buffer, '_pid_alive', return_value=False):
+            self.assertEqual(reaction_buffer.replay_orphans(), 1)
+        self.assertEqual(self.reaction(), dislike)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_flusher_started_by_first_request(self):
+        self.client.get(reverse('homepage'))
+        self.start_flusher.assert_called()
+        with override_settings(REACTION_BUFFER={'ENABLED': False}):
+            self.start_flusher.reset_mock()
+            self.client.get(reverse('homepage'))
+            self.start_flusher.assert_not_called()
+
+
+class ImageDerivativesTests(TestCase):
+    """Копии изображений: очередь после сохранения и создание копий командой"""
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+
+    def test_queue_drained_by_command(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(buffer, 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Платье летнее', slug='plate', description='Описание товара',
+                                             price=1000, image=SimpleUploadedFile('plate.jpg', buffer.getvalue()))
+        storage = product.image.storage
+        self.assertTrue(product.image.name.startswith('blobs/'))
+        self.assertEqual(list(PendingImage.objects.values_list('model', 'field', 'name')),
+                         [('catalog.product', 'image', product.image.name)])
+        # Запрос только ставит изображение в очередь
+        self.assertFalse(storage.exists(images.manifest_name(product.image.name)))
+
+        call_command('generate_image_derivatives', workers=1, stdout=io.StringIO())
+        self.assertFalse(PendingImage.objects.exists())
+        manifest = images.get_manifest(product.image.name, storage)
+        self.assertEqual((manifest['width'], manifest['height']), (400, 200))
+        for renditions in manifest['renditions'].values():
+            self.assertTrue(all(storage.exists(name) for _, name in renditions))
+        self.assertTrue(images.thumbnail_url(product.image).endswith('_w160.jpg'))
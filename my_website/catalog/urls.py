@@ -1,20 +1,37 @@
+from django.conf import settings
 from django.urls import path, register_converter
 
 from . import views, converters
 
 register_converter(converters.DateConverter, 'ymd')
 
-urlpatterns = [
-    path('', views.CatalogView.as_view(), name='catalog'),
-    path('add-product/', views.AddProductView.as_view(), name='add_product'),
-    path('upload-file/', views.UploadFileView.as_view(), name='upload_file'),
-    path('items/<slug:item_slug>/', views.item_detail, name='items'),
-    path('events/<ymd:event_date>/', views.event_detail, name='events'),
-    path('tag/<slug:tag_slug>/', views.TagView.as_view(), name='tag'),
-    path('product/<slug:product_slug>/', views.ProductView.as_view(), name='product'),
-    path('product/<slug:product_slug>/review/', views.AddReviewView.as_view(), name='add_review'),
-    path('product/<slug:product_slug>/reaction/', views.ProductReactionView.as_view(), name='product_reaction'),
-    path('product/<slug:product_slug>/edit/', views.UpdateProductView.as_view(), name='edit_product'),
-    path('product/<slug:product_slug>/delete/', views.DeleteProductView.as_view(), name='delete_product'),
-    path('<slug:category_slug>/', views.CategoryView.as_view(), name='category'),
-]
+
+def get_urlpatterns(async_views):
+    """Маршруты каталога; async_views - асинхронные варианты представлений (под ASGI)"""
+
+    def as_view(view, async_view):
+        return (async_view if async_views else view).as_view()
+
+    return [
+        path('', as_view(views.CatalogView, views.AsyncCatalogView), name='catalog'),
+        path('add-product/', views.AddProductView.as_view(), name='add_product'),
+        path('upload-file/', views.UploadFileView.as_view(), name='upload_file'),
+        path('items/<slug:item_slug>/', views.item_detail, name='items'),
+        path('events/<ymd:event_date>/', views.event_detail, name='events'),
+        path('tag/<slug:tag_slug>/', as_view(views.TagView, views.AsyncTagView), name='tag'),
+        path('search/', views.SearchView.as_view(), name='search'),
+        path('product/<slug:product_slug>/', as_view(views.ProductView, views.AsyncProductView), name='product'),
+        path('product/<slug:product_slug>/review/',
+             as_view(views.AddReviewView, views.AsyncAddReviewView), name='add_review'),
+        path('product/<slug:product_slug>/reviews/',
+             as_view(views.ReviewListView, views.AsyncReviewListView), name='product_reviews'),
+        path('product/<slug:product_slug>/reaction/',
+             as_view(views.ProductReactionView, views.AsyncProductReactionView), name='product_reaction'),
+        path('product/<slug:product_slug>/edit/', views.UpdateProductView.as_view(), name='edit_product'),
+        path('product/<slug:product_slug>/delete/', views.DeleteProductView.as_view(), name='delete_product'),
+        path('<slug:category_slug>/', as_view(views.CategoryView, views.AsyncCategoryView), name='category'),
+    ]
+
+
+# Под ASGI (настройка ASYNC_VIEWS) - асинхронные варианты представлений
+urlpatterns = get_urlpatterns(settings.ASYNC_VIEWS)
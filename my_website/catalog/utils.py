@@ -1,3 +1,98 @@
+import asyncio
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import AccessMixin
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import InvalidPage
+from django.http import Http404
+from django.views.decorators.http import condition
+from django.views.generic import ListView
+
+from . import cache, facets
+from .models import Review
+from .pagination import KeysetPaginator, InvalidCursor
+
+# Сортировки отзывов товара: (название, порядок keyset-пагинации)
+REVIEW_SORTS = {
+    'newest': ('Сначала новые', ('-created_at', '-id')),
+    'rating': ('Сначала с высокой оценкой', ('-rating', '-created_at', '-id')),
+}
+REVIEWS_PER_PAGE = 10
+
+# Сортировки списков товаров: (название, порядок keyset-пагинации). Каждую
+# поддерживают частичные индексы опубликованных товаров (Product.Meta.indexes):
+# общий и по категории; обратный порядок цены SQLite читает по тому же индексу
+PRODUCT_SORTS = {
+    'newest': ('Сначала новые', ('-created_at', '-id')),
+    'price_asc': ('Сначала дешёвые', ('price', 'id')),
+    'price_desc': ('Сначала дорогие', ('-price', '-id')),
+    'rating': ('С высоким рейтингом', ('-rating_avg', '-id')),
+    'popular': ('Популярные', ('-likes_count', '-id')),
+}
+DEFAULT_PRODUCT_SORT = 'newest'
+
+
+def wants_json(request):
+    """Клиент запросил JSON (заголовок Accept или параметр ?format=json)"""
+    return (request.GET.get('format') == 'json'
+            or 'application/json' in request.headers.get('Accept', ''))
+
+
+def _reviews_paginator(reviews, sort, per_page):
+    return KeysetPaginator(reviews.select_related('user'), per_page, ordering=REVIEW_SORTS[sort][1])
+
+
+def get_reviews_page(product, sort=None, cursor=None, per_page=REVIEWS_PER_PAGE):
+    """
+    Страница отзывов товара с авторами (один запрос, без COUNT и OFFSET).
+    Неизвестная сортировка заменяется на 'newest', некорректный курсор - Http404.
+    """
+    if sort not in REVIEW_SORTS:
+        sort = 'newest'
+    paginator = _reviews_paginator(Review.objects.filter(product=product), sort, per_page)
+    try:
+        page = paginator.page(cursor)
+    except InvalidCursor as e:
+        raise Http404('Некорректный курсор страницы') from e
+    page.sort = sort
+    return page
+
+
+async def aget_reviews_page(reviews, sort=None, cursor=None, per_page=REVIEWS_PER_PAGE):
+    """
+    Асинхронный вариант get_reviews_page(). reviews - отзывы товара, например
+    Review.objects.filter(product__slug=slug): страницу можно выбирать
+    параллельно с самим товаром.
+    """
+    if sort not in REVIEW_SORTS:
+        sort = 'newest'
+    try:
+        page = await _reviews_paginator(reviews, sort, per_page).apage(cursor)
+    except InvalidCursor as e:
+        raise Http404('Некорректный курсор страницы') from e
+    page.sort = sort
+    return page
+
+
+def reviews_page_data(page):
+    """Страница отзывов для JSON-ответа"""
+    return {
+        'reviews': [
+            {
+                'id': review.pk,
+                'user': review.user.username,
+                'rating': review.rating,
+                'text': review.text,
+                'created_at': review.created_at.isoformat(),
+            }
+            for review in page
+        ],
+        'sort': page.sort,
+        'next_cursor': page.next_cursor,
+    }
+
+
 class CatalogContextMixin:
     """
     Миксин для классов представлений приложения "catalog".
@@ -12,10 +107,20 @@ class CatalogContextMixin:
       - title (если задан атрибут `page_title`)
       - любые дополнительные пары ключ-значение, переданные в метод
         get_mixin_context(...)
+
+    Пагинация списков (ListView):
+      - pagination_mode = 'offset' - стандартная постраничная навигация (?page=N)
+      - pagination_mode = 'keyset' - навигация по курсору (?cursor=...) без
+        COUNT(*) и OFFSET; порядок задаётся `keyset_ordering`, подсчёт общего
+        числа записей включается атрибутом `paginate_count`.
     """
 
     page_title: str | None = None
     paginate_by = 4
+    pagination_mode = 'offset'
+    keyset_ordering = ('-created_at', '-id')
+    paginate_count = False
+    cursor_kwarg = 'cursor'
 
     def get_mixin_context(self, context, **kwargs):
         if self.page_title:
@@ -23,3 +128,280 @@ class CatalogContextMixin:
         if kwargs:
             context.update(kwargs)
         return context
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def get_keyset_paginator(self, queryset, page_size):
+        return KeysetPaginator(queryset, page_size, ordering=self.get_keyset_ordering(),
+                               count=self.paginate_count)
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.pagination_mode != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = self.get_keyset_paginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor as e:
+            raise Http404('Некорректный курсор страницы') from e
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def apaginate_queryset(self, queryset, page_size):
+        if self.pagination_mode != 'keyset':
+            return await super().apaginate_queryset(queryset, page_size)
+
+        paginator = self.get_keyset_paginator(queryset, page_size)
+        try:
+            page = await paginator.apage(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor as e:
+            raise Http404('Некорректный курсор страницы') from e
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class ProductSortMixin:
+    """
+    Сортировка списков товаров по выбору пользователя (?sort=price_asc).
+
+    Наследовать перед CatalogContextMixin: порядок из PRODUCT_SORTS
+    передаётся keyset-пагинации, в контекст добавляются product_sorts,
+    current_sort и default_sort. Неизвестная сортировка заменяется сортировкой по умолчанию.
+    """
+
+    sort_kwarg = 'sort'
+
+    def get_sort(self):
+        sort = self.request.GET.get(self.sort_kwarg)
+        return sort if sort in PRODUCT_SORTS else DEFAULT_PRODUCT_SORT
+
+    def get_keyset_ordering(self):
+        return PRODUCT_SORTS[self.get_sort()][1]
+
+    def get_mixin_context(self, context, **kwargs):
+        return super().get_mixin_context(context, product_sorts=PRODUCT_SORTS, current_sort=self.get_sort(),
+                                         default_sort=DEFAULT_PRODUCT_SORT, **kwargs)
+
+
+class FacetFilterMixin:
+    """
+    Миксин фасетной фильтрации списков товаров (см. catalog/facets.py).
+
+    Фильтры передаются в строке запроса (?price=low&tag=3&color=Черный),
+    значения одного фасета объединяются через ИЛИ, разных фасетов - через И.
+      - get_fixed_facets() - фильтры самой страницы (категория, тег)
+      - facet_exclude - фасеты, которые не показываются на странице
+      - filter_by_facets(queryset) - применить выбранные фильтры
+      - get_facets_context() - значения фасетов с количеством товаров
+    """
+
+    facet_exclude = ()
+
+    def get_facet_selection(self):
+        if not hasattr(self, '_facet_selection'):
+            self._facet_selection = facets.parse_selection(self.request.GET)
+        return self._facet_selection
+
+    def get_fixed_facets(self):
+        return {}
+
+    def filter_by_facets(self, queryset):
+        return facets.filter_queryset(queryset, self.get_facet_selection())
+
+    def get_facets_context(self):
+        return facets.build_facets(self.get_facet_selection(), self.get_fixed_facets(),
+                                   exclude=self.facet_exclude)
+
+
+def make_etag(*parts):
+    """Слабый ETag из произвольных значений (repr которых стабилен)"""
+    return 'W/"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+class ConditionalGetMixin:
+    """
+    Миксин условных GET-запросов (ETag / Last-Modified -> 304 Not Modified).
+
+    Валидаторы вычисляются в get_validators() до обработчика представления,
+    поэтому при совпадении клиенту отдаётся 304 без выборки данных страницы и
+    рендеринга шаблона. Наследовать после миксинов проверки доступа.
+      - get_validators() возвращает (части ETag, время изменения) или None;
+        для ListView по умолчанию - ID и `last_modified_field` объектов текущей
+        страницы (один запрос) и версии кэша из get_validator_versions()
+      - в ETag всегда входит ID пользователя (в шаблоне есть имя пользователя)
+
+    ETag слабый: CSRF-токен в странице меняется от запроса к запросу.
+    В асинхронных представлениях валидаторы вычисляет aget_validators().
+    """
+
+    last_modified_field = 'updated_at'
+    validator_versions = ()
+
+    def get_validator_versions(self):
+        # Представления с полностраничным кэшем зависят от тех же пространств
+        if hasattr(self, 'get_page_cache_scopes'):
+            return self.get_page_cache_scopes()
+        return self.validator_versions
+
+    def get_validator_fields(self):
+        fields = ['pk', self.last_modified_field]
+        if getattr(self, 'pagination_mode', None) == 'keyset':
+            fields += [field.lstrip('-') for field in self.get_keyset_ordering()]
+        return fields
+
+    def get_validators(self):
+        queryset = self.get_queryset().only(*self.get_validator_fields())
+        page_size = self.get_paginate_by(queryset)
+        if page_size:
+            _, _, objects, _ = self.paginate_queryset(queryset, page_size)
+        else:
+            objects = queryset
+        rows = [(obj.pk, getattr(obj, self.last_modified_field)) for obj in objects]
+        last_modified = max((modified for _, modified in rows), default=None)
+        return (rows, cache.get_versions(*self.get_validator_versions())), last_modified
+
+    async def aget_validators(self):
+        """Асинхронный вариант get_validators() (для AsyncListView)"""
+        queryset = (await self.aget_queryset()).only(*self.get_validator_fields())
+        page_size = self.get_paginate_by(queryset)
+
+        async def objects():
+            if page_size:
+                return (await self.apaginate_queryset(queryset, page_size))[2]
+            return [obj async for obj in queryset]
+
+        objects, versions = await asyncio.gather(objects(), cache.aget_versions(*self.get_validator_versions()))
+        rows = [(obj.pk, getattr(obj, self.last_modified_field)) for obj in objects]
+        last_modified = max((modified for _, modified in rows), default=None)
+        return (rows, versions), last_modified
+
+    @staticmethod
+    def _condition(etag, last_modified):
+        return condition(etag_func=lambda request, *args, **kwargs: etag,
+                         last_modified_func=lambda request, *args, **kwargs: last_modified)
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self._adispatch_conditional(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        validators = self.get_validators()
+        if validators is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        parts, last_modified = validators
+        etag = make_etag(request.user.pk, *parts)
+        return self._condition(etag, last_modified)(super().dispatch)(request, *args, **kwargs)
+
+    async def _adispatch_conditional(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await super().dispatch(request, *args, **kwargs)
+        request.user = await request.auser()
+        validators = await self.aget_validators()
+        if validators is None:
+            return await super().dispatch(request, *args, **kwargs)
+
+        parts, last_modified = validators
+        etag = make_etag(request.user.pk, *parts)
+
+        async def view(request, *args, **kwargs):
+            return await super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs)
+
+        return await self._condition(etag, last_modified)(view)(request, *args, **kwargs)
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    """
+    LoginRequiredMixin для асинхронных представлений.
+
+    Ленивый request.user нельзя читать в асинхронном коде, поэтому
+    пользователь загружается через request.auser() и подставляется в
+    request.user - дальше его можно использовать как обычно (в том числе в шаблонах).
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncPermissionRequiredMixin(AccessMixin):
+    """PermissionRequiredMixin для асинхронных представлений (см. AsyncLoginRequiredMixin)"""
+
+    permission_required = None
+
+    def get_permission_required(self):
+        if self.permission_required is None:
+            raise ImproperlyConfigured(
+                f'{self.__class__.__name__} is missing the permission_required attribute.'
+            )
+        if isinstance(self.permission_required, str):
+            return (self.permission_required,)
+        return self.permission_required
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        # Права читаются из БД бэкендами аутентификации синхронно
+        if not await sync_to_async(request.user.has_perms)(self.get_permission_required()):
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncListView(ListView):
+    """
+    ListView с асинхронной выборкой страницы (для запуска под ASGI).
+
+    Как использовать:
+      - Наследовать ПОСЛЕ синхронного представления, настройки и миксины
+        которого используются: class AsyncSomeView(SomeView, AsyncListView)
+      - aget_queryset() - переопределить, если для queryset нужны запросы
+        (например, поиск категории)
+      - aget_extra_context() - дополнительные данные страницы, выбираются
+        параллельно со страницей списка
+
+    PageCacheMixin и ConditionalGetMixin работают с ним без изменений.
+    Шаблон рендерится обработчиком ASGI в потоке: теги шаблонов обращаются к БД
+    и кэшу синхронно.
+    """
+
+    async def aget_queryset(self):
+        return self.get_queryset()
+
+    async def aget_extra_context(self):
+        return {}
+
+    async def apaginate_queryset(self, queryset, page_size):
+        paginator = self.get_paginator(queryset, page_size, orphans=self.get_paginate_orphans(),
+                                       allow_empty_first_page=self.get_allow_empty())
+        # Paginator считает записи синхронно - количество подставляется заранее
+        paginator.count = await queryset.acount()
+        page_number = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        try:
+            page = paginator.page(paginator.num_pages if page_number == 'last' else page_number)
+        except InvalidPage as e:
+            raise Http404(f'Некорректная страница ({page_number}): {e}') from e
+        page.object_list = [obj async for obj in page.object_list]
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = await self.aget_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+
+        async def page():
+            if page_size:
+                return await self.apaginate_queryset(self.object_list, page_size)
+            return None, None, [obj async for obj in self.object_list], False
+
+        (paginator, page, objects, is_paginated), extra = await asyncio.gather(page(), self.aget_extra_context())
+        context = {
+            'view': self,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': is_paginated,
+            'object_list': objects,
+        }
+        if self.context_object_name:
+            context[self.context_object_name] = objects
+        context.update(self.extra_context or {})
+        context.update(extra)
+        return self.render_to_response(context)
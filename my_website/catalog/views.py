@@ -1,129 +1,269 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, Http404, HttpResponseNotFound
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.http import HttpResponse, Http404, HttpResponseNotFound, JsonResponse
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
 from django.views import View
 from django.views.generic import ListView, DetailView, FormView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.urls import reverse_lazy
+from django.utils.functional import cached_property
+from django.db.models import Exists, OuterRef, Subquery
 
 from datetime import datetime as dt
-from .models import Product, Category, Tag, ProductReaction
+from .models import Product, Category, Tag, ProductReaction, Review
 from .forms import AddProductForm, AddProductModelForm, UploadFileForm, ReviewForm
-from .utils import CatalogContextMixin
-import uuid
+from . import cache, facets, reaction_buffer
+from .page_cache import CATALOG_PAGES, PageCacheMixin, category_pages, tag_pages
+from .utils import (AsyncListView, AsyncLoginRequiredMixin, AsyncPermissionRequiredMixin, CatalogContextMixin,
+                    ConditionalGetMixin, FacetFilterMixin, ProductSortMixin, REVIEW_SORTS, aget_reviews_page,
+                    get_reviews_page, reviews_page_data, wants_json)
+from .reactions import toggle_reaction
+from .search import search_products
+from mediastore.models import Upload
+from mediastore.views import ResumableUploadMixin
 
 # Create your views here.
 
+# Параметры строки запроса списков товаров (ключ полностраничного кэша)
+PRODUCT_LIST_PARAMS = ('cursor', 'sort', *facets.FACET_TITLES)
+
 
 # Каталог товаров
-class CatalogView(CatalogContextMixin, ListView):
+class CatalogView(PageCacheMixin, ConditionalGetMixin, ProductSortMixin, CatalogContextMixin, FacetFilterMixin,
+                  ListView):
     model = Product
     template_name = 'catalog/catalog.html'
     context_object_name = 'products'
     page_title = 'Каталог'
+    pagination_mode = 'keyset'
+    page_cache_scopes = (CATALOG_PAGES, cache.SIDEBAR, cache.MENU)
+    page_cache_params = PRODUCT_LIST_PARAMS
+    # Бюджет SQL-запросов представления (monitoring/metrics.py; сессия, пользователь и
+    # заполнение кэшей боковых панелей и фасетов в него не входят): ключи страницы для
+    # валидаторов, товары страницы и права пользователя для perms в шаблоне (2 запроса)
+    query_budget = 4
     
     def get_queryset(self):
-        return Product.published.all()
+        return self.filter_by_facets(Product.published.all())
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        return self.get_mixin_context(context, category=None)
+        return self.get_mixin_context(context, category=None, facets=self.get_facets_context())
 
 
 # Показ товаров категории
-class CategoryView(CatalogContextMixin, ListView):
+class CategoryView(PageCacheMixin, ConditionalGetMixin, ProductSortMixin, CatalogContextMixin, FacetFilterMixin,
+                   ListView):
     model = Product
     template_name = 'catalog/catalog.html'
     context_object_name = 'products'
     page_title = 'Каталог'
+    pagination_mode = 'keyset'
+    facet_exclude = ('category',)
+    page_cache_params = PRODUCT_LIST_PARAMS
+    # Как у CatalogView и категория
+    query_budget = 5
+
+    def get_page_cache_scopes(self):
+        return (category_pages(self.kwargs['category_slug']), cache.SIDEBAR, cache.MENU)
+
+    @cached_property
+    def category(self):
+        return get_object_or_404(Category, slug=self.kwargs['category_slug'])
+
+    def get_fixed_facets(self):
+        return {'category': {str(self.category.pk)}}
     
     def get_queryset(self):
-        category = get_object_or_404(Category, slug=self.kwargs['category_slug'])
-        return Product.published.filter(category=category)
+        return self.filter_by_facets(Product.published.filter(category=self.category))
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        category = get_object_or_404(Category, slug=self.kwargs['category_slug'])
-        return self.get_mixin_context(context, category=category)
+        return self.get_mixin_context(context, category=self.category, facets=self.get_facets_context())
 
 
 # Показ товаров с тегом
-class TagView(CatalogContextMixin, ListView):
+class TagView(PageCacheMixin, ConditionalGetMixin, ProductSortMixin, CatalogContextMixin, FacetFilterMixin,
+              ListView):
     model = Product
     template_name = 'catalog/catalog.html'
     context_object_name = 'products'
     page_title = 'Каталог'
+    pagination_mode = 'keyset'
+    page_cache_params = PRODUCT_LIST_PARAMS
+    # Как у CatalogView и тег
+    query_budget = 5
+    # С какой доли опубликованных товаров тег проверяется подзапросом EXISTS
+    semi_join_share = 0.03
+
+    def get_page_cache_scopes(self):
+        return (tag_pages(self.kwargs['tag_slug']), cache.SIDEBAR, cache.MENU)
+
+    @cached_property
+    def tag(self):
+        return get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
+
+    def get_fixed_facets(self):
+        return {'tag': {str(self.tag.pk)}}
     
     def get_queryset(self):
-        tag = get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
-        return Product.published.filter(tags=tag)
+        # Редкий тег: JOIN от покрывающего индекса (tag_id, product_id) и сортировка
+        # его товаров. Частый тег: проход по частичному индексу сортировки с проверкой
+        # тега по уникальному индексу (product_id, tag_id) до заполнения страницы
+        if facets.published_share('tag', {str(self.tag.pk)}) >= self.semi_join_share:
+            has_tag = Product.tags.through.objects.filter(product_id=OuterRef('pk'), tag_id=self.tag.pk)
+            queryset = Product.published.filter(Exists(has_tag))
+        else:
+            queryset = Product.published.filter(tags=self.tag)
+        return self.filter_by_facets(queryset)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        tag = get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
-        return self.get_mixin_context(context, tag=tag)
+        return self.get_mixin_context(context, tag=self.tag, facets=self.get_facets_context())
 
 
-# Показ товара
-class ProductView(PermissionRequiredMixin, LoginRequiredMixin, CatalogContextMixin, DetailView):
+# Поиск товаров
+class SearchView(CatalogContextMixin, ListView):
+    template_name = 'catalog/search.html'
+    context_object_name = 'products'
+    page_title = 'Поиск'
+    paginate_by = 12
+
+    def get_search_query(self):
+        return self.request.GET.get('q', '').strip()
+
+    def get_queryset(self):
+        return search_products(self.get_search_query())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        return self.get_mixin_context(context, query=self.get_search_query())
+
+
+# Общее для синхронной и асинхронной страниц товара
+class ProductPageMixin:
     model = Product
     template_name = 'catalog/product.html'
     context_object_name = 'product'
     slug_url_kwarg = 'product_slug'
     page_title = 'Каталог'
-    permission_required = 'catalog.view_product'
-    
+    # Бюджет SQL-запросов представления (monitoring/metrics.py; без сессии, пользователя
+    # и заполнения кэшей): валидаторы, товар с категорией и характеристиками, теги,
+    # отзывы с авторами и права пользователя для perms в шаблоне (2 запроса)
+    query_budget = 6
+
+    def get_user_reaction(self):
+        """Подзапрос с реакцией текущего пользователя на товар"""
+        reactions = ProductReaction.objects.filter(product=OuterRef('pk'), user=self.request.user.pk)
+        return Subquery(reactions.values('reaction_type')[:1])
+
     def get_queryset(self):
-        return Product.published.all()
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        product = self.get_object()
-        
-        # Получаем отзывы для товара
-        reviews = product.reviews.all()
-        
-        # Проверяем, оставлял ли текущий пользователь отзыв
-        user_has_review = False
-        if self.request.user.is_authenticated:
-            user_has_review = reviews.filter(user=self.request.user).exists()
-        
-        # Добавляем форму для отзыва
-        review_form = ReviewForm()
-        
-        # Получаем счетчики реакций
-        likes_count = product.reactions.filter(reaction_type=ProductReaction.ReactionType.LIKE).count()
-        dislikes_count = product.reactions.filter(reaction_type=ProductReaction.ReactionType.DISLIKE).count()
-        
-        # Получаем реакцию текущего пользователя
-        user_reaction = None
-        if self.request.user.is_authenticated:
-            try:
-                user_reaction = product.reactions.get(user=self.request.user).reaction_type
-            except ProductReaction.DoesNotExist:
-                user_reaction = None
-        
-        context.update({
-            'reviews': reviews,
+        # Всё, что нужно странице: категория и характеристики - JOIN, теги - отдельным
+        # запросом, реакция и наличие отзыва пользователя - подзапросами
+        user_reviews = Review.objects.filter(product=OuterRef('pk'), user=self.request.user.pk)
+        return (Product.published
+                .select_related('category', 'detail')
+                .prefetch_related('tags')
+                .annotate(user_reaction=self.get_user_reaction(), user_has_review=Exists(user_reviews)))
+
+    def get_validators_query(self):
+        # Товар, счётчики реакций и отзывов, последний отзыв и реакция пользователя - одним запросом
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by('-updated_at')
+        return (Product.published.filter(slug=self.kwargs[self.slug_url_kwarg])
+                .annotate(reviews_updated=Subquery(reviews.values('updated_at')[:1]),
+                          user_reaction=self.get_user_reaction())
+                .values_list('pk', 'updated_at', 'likes_count', 'dislikes_count', 'reviews_count',
+                             'rating_sum', 'reviews_updated', 'user_reaction'))
+
+    def make_validators(self, row, versions, overlay=None):
+        last_modified = max(filter(None, (row[1], row[6])))
+        parts = [row, versions]
+        if overlay is not None:
+            parts.append(overlay)
+        return parts, last_modified
+
+    def get_product_context(self, product, reviews_page, user_reaction, user_has_review, overlay=None,
+                            review_form=None):
+        # Счетчики хранятся в самом товаре (см. catalog/counters.py)
+        likes_count, dislikes_count = product.likes_count, product.dislikes_count
+        if overlay is not None:
+            # Ещё не записанные в БД реакции (см. catalog/reaction_buffer.py)
+            state, likes_delta, dislikes_delta = overlay
+            if state is not None:
+                user_reaction = state or None
+            likes_count = max(likes_count + likes_delta, 0)
+            dislikes_count = max(dislikes_count + dislikes_delta, 0)
+
+        return {
+            'reviews_page': reviews_page,
+            'review_sorts': REVIEW_SORTS,
             'user_has_review': user_has_review,
-            'review_form': review_form,
-            'reviews_count': reviews.count(),
+            'review_form': review_form or ReviewForm(),
+            'reviews_count': product.reviews_count,
             'likes_count': likes_count,
             'dislikes_count': dislikes_count,
             'user_reaction': user_reaction,
-        })
+        }
+
+
+# Показ товара
+class ProductView(PermissionRequiredMixin, LoginRequiredMixin, ConditionalGetMixin, CatalogContextMixin,
+                  ProductPageMixin, DetailView):
+    permission_required = 'catalog.view_product'
+
+    def get_validators(self):
+        row = self.get_validators_query().first()
+        if row is None:
+            return None
+        overlay = None
+        if reaction_buffer.is_enabled():
+            overlay = reaction_buffer.overlay(row[0], self.request.user.pk)
+        return self.make_validators(row, cache.get_versions(cache.SIDEBAR, cache.MENU), overlay)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        product = self.object
+        
+        # Только первая страница отзывов, остальные подгружаются через ReviewListView
+        reviews_page = get_reviews_page(product, self.request.GET.get('reviews_sort'),
+                                        self.request.GET.get('reviews_cursor'))
+        overlay = None
+        if reaction_buffer.is_enabled():
+            overlay = reaction_buffer.overlay(product.pk, self.request.user.pk)
         
+        context.update(self.get_product_context(product, reviews_page, product.user_reaction,
+                                                product.user_has_review, overlay))
         return self.get_mixin_context(context)
 
 
+# Подгрузка отзывов товара (HTML-фрагмент или JSON)
+class ReviewListView(PermissionRequiredMixin, LoginRequiredMixin, View):
+    """Следующая страница отзывов: ?sort=newest|rating&cursor=..."""
+    permission_required = 'catalog.view_product'
+
+    def get(self, request, product_slug):
+        product = get_object_or_404(Product.published.only('pk', 'slug'), slug=product_slug)
+        page = get_reviews_page(product, request.GET.get('sort'), request.GET.get('cursor'))
+
+        if wants_json(request):
+            return JsonResponse(reviews_page_data(page))
+        html = render_to_string('catalog/includes/review_list.html',
+                                {'product': product, 'reviews_page': page}, request=request)
+        return HttpResponse(html)
+
+
 # Добавление отзыва к товару
-class AddReviewView(LoginRequiredMixin, View):
+class AddReviewView(LoginRequiredMixin, CatalogContextMixin, ProductPageMixin, View):
     """View для добавления отзыва к товару"""
     
     def post(self, request, product_slug):
-        product = get_object_or_404(Product, slug=product_slug, is_published=True)
+        product = get_object_or_404(self.get_queryset(), slug=product_slug)
         
         # Проверяем, не оставлял ли пользователь уже отзыв
-        if product.reviews.filter(user=request.user).exists():
+        if product.user_has_review:
             return redirect('product', product_slug=product_slug)
         
         form = ReviewForm(request.POST)
@@ -135,58 +275,195 @@ class AddReviewView(LoginRequiredMixin, View):
             return redirect('product', product_slug=product_slug)
         
         # Если форма невалидна, возвращаемся на страницу товара с ошибками
-        context = {
-            'product': product,
-            'reviews': product.reviews.all(),
-            'review_form': form,
-            'user_has_review': False,
-            'reviews_count': product.reviews.count(),
-        }
-        return render(request, 'catalog/product.html', context)
+        # (контекст тот же, что у ProductView)
+        overlay = None
+        if reaction_buffer.is_enabled():
+            overlay = reaction_buffer.overlay(product.pk, request.user.pk)
+        context = self.get_product_context(product, get_reviews_page(product), product.user_reaction, False,
+                                           overlay, review_form=form)
+        return render(request, self.template_name, self.get_mixin_context({'product': product, **context}))
 
 
 # Добавление/изменение реакции на товар (лайк/дизлайк)
 class ProductReactionView(LoginRequiredMixin, View):
-    """View для добавления или изменения реакции на товар"""
+    """
+    View для переключения реакции на товар (см. catalog/reactions.py).
+    Для запросов с Accept: application/json возвращает новые счётчики и
+    реакцию пользователя вместо перенаправления на страницу товара.
+    """
     
     def post(self, request, product_slug):
-        product = get_object_or_404(Product, slug=product_slug, is_published=True)
+        product_id = get_object_or_404(Product.published.values_list('pk', flat=True), slug=product_slug)
         reaction_type = request.POST.get('reaction_type')
         
         # Валидация типа реакции
         if reaction_type not in ['1', '-1']:
+            if wants_json(request):
+                return JsonResponse({'error': 'Некорректный тип реакции'}, status=400)
             return redirect('product', product_slug=product_slug)
         
-        reaction_type = int(reaction_type)
+        if reaction_buffer.is_enabled():
+            state, likes, dislikes = reaction_buffer.record(product_id, request.user.pk, int(reaction_type))
+        else:
+            state, likes, dislikes = toggle_reaction(product_id, request.user.pk, int(reaction_type))
         
-        # Получаем существующую реакцию пользователя или создаем новую
-        reaction, created = ProductReaction.objects.get_or_create(
-            product=product,
-            user=request.user,
-            defaults={'reaction_type': reaction_type}
+        if wants_json(request):
+            return JsonResponse({
+                'reaction': state,
+                'likes_count': likes,
+                'dislikes_count': dislikes,
+            })
+        return redirect('product', product_slug=product_slug)
+
+
+# Асинхронные представления для запуска под ASGI (настройка ASYNC_VIEWS, см. catalog/urls.py).
+# Независимые выборки выполняются параллельно через asyncio.gather, поток на
+# запрос не занимается, пока он ждёт БД и кэш; шаблоны рендерит обработчик ASGI.
+
+# Каталог товаров (асинхронно)
+class AsyncCatalogView(CatalogView, AsyncListView):
+    async def aget_extra_context(self):
+        # Индекс фасетов загружается синхронно (в памяти процесса)
+        facets = await sync_to_async(self.get_facets_context)()
+        return self.get_mixin_context({}, category=None, facets=facets)
+
+
+# Показ товаров категории (асинхронно)
+class AsyncCategoryView(CategoryView, AsyncListView):
+    async def aget_queryset(self):
+        # Категория ищется один раз - для валидаторов и для страницы
+        if 'category' not in self.__dict__:
+            self.category = await aget_object_or_404(Category, slug=self.kwargs['category_slug'])
+        return self.get_queryset()
+
+    async def aget_extra_context(self):
+        facets = await sync_to_async(self.get_facets_context)()
+        return self.get_mixin_context({}, category=self.category, facets=facets)
+
+
+# Показ товаров с тегом (асинхронно)
+class AsyncTagView(TagView, AsyncListView):
+    async def aget_queryset(self):
+        if 'tag' not in self.__dict__:
+            self.tag = await aget_object_or_404(Tag, slug=self.kwargs['tag_slug'])
+        # Выбор запроса читает битовые карты фасетов (при смене версии - из БД)
+        return await sync_to_async(self.get_queryset)()
+
+    async def aget_extra_context(self):
+        facets = await sync_to_async(self.get_facets_context)()
+        return self.get_mixin_context({}, tag=self.tag, facets=facets)
+
+
+# Показ товара (асинхронно)
+class AsyncProductView(AsyncPermissionRequiredMixin, AsyncLoginRequiredMixin, ConditionalGetMixin,
+                       CatalogContextMixin, ProductPageMixin, DetailView):
+    permission_required = 'catalog.view_product'
+
+    async def get_overlay(self, product_id):
+        if not reaction_buffer.is_enabled():
+            return None
+        return await sync_to_async(reaction_buffer.overlay)(product_id, self.request.user.pk)
+
+    async def aget_validators(self):
+        row, versions = await asyncio.gather(self.get_validators_query().afirst(),
+                                             cache.aget_versions(cache.SIDEBAR, cache.MENU))
+        if row is None:
+            return None
+        return self.make_validators(row, versions, await self.get_overlay(row[0]))
+
+    async def get(self, request, *args, **kwargs):
+        slug = self.kwargs[self.slug_url_kwarg]
+        # Товар (с реакцией пользователя и наличием его отзыва) и первая страница
+        # отзывов не зависят друг от друга
+        self.object, reviews_page = await asyncio.gather(
+            aget_object_or_404(self.get_queryset(), slug=slug),
+            aget_reviews_page(Review.objects.filter(product__slug=slug), request.GET.get('reviews_sort'),
+                              request.GET.get('reviews_cursor')),
         )
-        
-        # Если реакция уже существовала
-        if not created:
-            # Если нажали на ту же кнопку - удаляем реакцию
-            if reaction.reaction_type == reaction_type:
-                reaction.delete()
-            # Если нажали на другую кнопку - меняем реакцию
-            else:
-                reaction.reaction_type = reaction_type
-                reaction.save()
-        
+        context = self.get_context_data(object=self.object)
+        context.update(self.get_product_context(self.object, reviews_page, self.object.user_reaction,
+                                                self.object.user_has_review,
+                                                await self.get_overlay(self.object.pk)))
+        return self.render_to_response(self.get_mixin_context(context))
+
+
+# Подгрузка отзывов товара (асинхронно)
+class AsyncReviewListView(AsyncPermissionRequiredMixin, AsyncLoginRequiredMixin, View):
+    permission_required = 'catalog.view_product'
+
+    async def get(self, request, product_slug):
+        product, page = await asyncio.gather(
+            aget_object_or_404(Product.published.only('pk', 'slug'), slug=product_slug),
+            aget_reviews_page(Review.objects.filter(product__slug=product_slug),
+                              request.GET.get('sort'), request.GET.get('cursor')),
+        )
+        if wants_json(request):
+            return JsonResponse(reviews_page_data(page))
+        return TemplateResponse(request, 'catalog/includes/review_list.html',
+                                {'product': product, 'reviews_page': page})
+
+
+# Добавление отзыва к товару (асинхронно)
+class AsyncAddReviewView(AsyncLoginRequiredMixin, CatalogContextMixin, ProductPageMixin, View):
+
+    async def post(self, request, product_slug):
+        product = await aget_object_or_404(self.get_queryset(), slug=product_slug)
+        if product.user_has_review:
+            return redirect('product', product_slug=product_slug)
+
+        form = ReviewForm(request.POST)
+        # Проверка ModelForm может обращаться к БД
+        if await sync_to_async(form.is_valid)():
+            review = form.save(commit=False)
+            review.product = product
+            review.user = request.user
+            await review.asave()
+            return redirect('product', product_slug=product_slug)
+
+        reviews_page = await aget_reviews_page(Review.objects.filter(product=product))
+        overlay = None
+        if reaction_buffer.is_enabled():
+            overlay = await sync_to_async(reaction_buffer.overlay)(product.pk, request.user.pk)
+        context = self.get_product_context(product, reviews_page, product.user_reaction, False, overlay,
+                                           review_form=form)
+        return TemplateResponse(request, self.template_name, self.get_mixin_context({'product': product, **context}))
+
+
+# Добавление/изменение реакции на товар (асинхронно)
+class AsyncProductReactionView(AsyncLoginRequiredMixin, View):
+
+    async def post(self, request, product_slug):
+        product_id = await aget_object_or_404(Product.published.values_list('pk', flat=True), slug=product_slug)
+        reaction_type = request.POST.get('reaction_type')
+
+        if reaction_type not in ['1', '-1']:
+            if wants_json(request):
+                return JsonResponse({'error': 'Некорректный тип реакции'}, status=400)
+            return redirect('product', product_slug=product_slug)
+
+        # Переключение - короткая транзакция, она выполняется в потоке
+        toggle = reaction_buffer.record if reaction_buffer.is_enabled() else toggle_reaction
+        state, likes, dislikes = await sync_to_async(toggle)(product_id, request.user.pk, int(reaction_type))
+
+        if wants_json(request):
+            return JsonResponse({
+                'reaction': state,
+                'likes_count': likes,
+                'dislikes_count': dislikes,
+            })
         return redirect('product', product_slug=product_slug)
 
 
 # Добавление товара через форму, связанную с моделью (используется в проекте)
-class AddProductView(PermissionRequiredMixin, LoginRequiredMixin, CatalogContextMixin, CreateView):
+class AddProductView(PermissionRequiredMixin, LoginRequiredMixin, CatalogContextMixin, ResumableUploadMixin,
+                     CreateView):
     model = Product
     form_class = AddProductModelForm
     template_name = 'catalog/add_product.html'
     success_url = reverse_lazy('catalog')
     page_title = 'Добавление товара'
     permission_required = 'catalog.add_product'
+    resumable_fields = {'image_upload': 'image'}
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -194,7 +471,8 @@ class AddProductView(PermissionRequiredMixin, LoginRequiredMixin, CatalogContext
 
 
 # Редактирование товара
-class UpdateProductView(PermissionRequiredMixin, LoginRequiredMixin, CatalogContextMixin, UpdateView):
+class UpdateProductView(PermissionRequiredMixin, LoginRequiredMixin, CatalogContextMixin, ResumableUploadMixin,
+                        UpdateView):
     model = Product
     form_class = AddProductModelForm
     template_name = 'catalog/add_product.html'
@@ -202,6 +480,7 @@ class UpdateProductView(PermissionRequiredMixin, LoginRequiredMixin, CatalogCont
     context_object_name = 'product'
     page_title = 'Редактирование товара'
     permission_required = 'catalog.change_product'
+    resumable_fields = {'image_upload': 'image'}
     
     def get_success_url(self):
         return reverse_lazy('product', kwargs={'product_slug': self.object.slug})
@@ -227,7 +506,7 @@ class DeleteProductView(PermissionRequiredMixin, LoginRequiredMixin, CatalogCont
 
 
 # Загрузка файла
-class UploadFileView(LoginRequiredMixin, CatalogContextMixin, FormView):
+class UploadFileView(LoginRequiredMixin, CatalogContextMixin, ResumableUploadMixin, FormView):
     form_class = UploadFileForm
     template_name = 'catalog/upload_file.html'
     success_url = reverse_lazy('catalog')
@@ -238,23 +517,20 @@ class UploadFileView(LoginRequiredMixin, CatalogContextMixin, FormView):
         return self.get_mixin_context(context)
     
     def form_valid(self, form):
-        handle_uploaded_file(form.cleaned_data['file'])
+        if form.cleaned_data['upload_session']:
+            session = self.get_upload_session(form, 'upload_session')
+            if session is None:
+                return self.form_invalid(form)
+            Upload.objects.create(file=session.file.name, original_name=session.filename, size=session.size,
+                                  user=self.request.user)
+        else:
+            handle_uploaded_file(form.cleaned_data['file'], self.request.user)
         return super().form_valid(form)
 
 
-# Сохранение загруженного файла
-def handle_uploaded_file(f):
-    name = f.name
-    ext = ''
-
-    if '.' in name: 
-        ext = name[name.rindex('.'):] 
-        name = name[:name.rindex('.')]
-
-    suffix = str(uuid.uuid4())
-    with open(f"uploads/{name}_{suffix}{ext}", "wb+") as destination:
-        for chunk in f.chunks():
-            destination.write(chunk)
+# Сохранение загруженного файла (одинаковые файлы хранятся один раз, см. mediastore)
+def handle_uploaded_file(f, user=None):
+    return Upload.objects.create(file=f, original_name=f.name, size=f.size, user=user)
 
 
 # Добавление товара через форму, несвязанную с моделью (не используется в проекте)
@@ -1,4 +1,5 @@
 from django.contrib import admin, messages
+from catalog import images, page_cache
 from .models import Collection
 from django.utils.html import mark_safe
 
@@ -23,16 +24,19 @@ class CollectionAdmin(admin.ModelAdmin):
     @admin.display(description='Изображение коллекции')
     def image_preview(self, obj):
         if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" style="max-width: 100px; max-height: 100px;" />')
+            return mark_safe(f'<img src="{images.thumbnail_url(obj.image)}" style="max-width: 100px; max-height: 100px;" />')
         return 'Нет изображения коллекции'
 
     # Методы для действий в админке
     @admin.action(description='Опубликовать выбранные коллекции')
     def set_published(self, request, queryset):
         count = queryset.update(is_published=Collection.Status.PUBLISHED)
+        # update() не вызывает сигналы сохранения, сбрасываем кэш главной страницы явно
+        page_cache.invalidate(page_cache.HOME_PAGES)
         self.message_user(request, f'Опубликовано {count} коллекции(й).')
     
     @admin.action(description='Снять с публикации выбранные коллекции')
     def set_draft(self, request, queryset):
         count = queryset.update(is_published=Collection.Status.DRAFT)
+        page_cache.invalidate(page_cache.HOME_PAGES)
         self.message_user(request, f'Снято с публикации {count} коллекции(й)!', messages.WARNING)
@@ -5,3 +5,6 @@ class HomepageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'homepage'
     verbose_name = 'Главная страница'
+
+    def ready(self):
+        from . import signals  # noqa: F401
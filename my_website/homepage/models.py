@@ -1,6 +1,8 @@
 from django.db import models
 from django.urls import reverse
 
+from mediastore.storage import media_storage
+
 # Create your models here.
 
 
@@ -18,7 +20,7 @@ class Collection(models.Model):
     slug = models.SlugField(max_length=255, unique=True, db_index=True, verbose_name="URL")
     content = models.TextField(blank=True, verbose_name="Описание")
     image = models.ImageField(upload_to='collections/%Y/%m/%d/', default=None, null=True, 
-                                blank=True, verbose_name="Изображение коллекции")
+                                blank=True, storage=media_storage, verbose_name="Изображение коллекции")
 
     is_published = models.BooleanField(
         choices=tuple(map(lambda x: (bool(x[0]), x[1]), Status.choices)),
@@ -0,0 +1,25 @@
+"""
+Обработчики сигналов приложения "homepage".
+Подключаются в HomepageConfig.ready().
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from catalog import images, page_cache
+from .models import Collection
+
+
+# Копии изображений коллекций (очередь после коммита, см. catalog/images.py)
+@receiver(post_save, sender=Collection)
+def collection_image_saved(sender, instance, **kwargs):
+    if instance.image:
+        images.schedule(instance.image)
+
+
+# Сброс полностраничного кэша главной страницы
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_home_pages(sender, **kwargs):
+    page_cache.invalidate(page_cache.HOME_PAGES)
+
@@ -1,29 +1,41 @@
+import hashlib
+
 from django import template 
+from django.conf import settings
 # import homepage.views as views
 from catalog.models import Category
+from catalog import cache
 
 register = template.Library()
 
-TOP_CATEGORIES = {
-    'Женщинам': 'zhenskaya-odezhda',
-    'Мужчинам': 'muzhskaya-odezhda',
-    'Детям': 'detskaya-odezhda',
-}
-
 # @register.simple_tag()
 # def get_categories():
 #     return views.categories_db
 
+
+def load_top_categories():
+    """Пункты главного меню категорий одним запросом"""
+    top_categories = getattr(settings, 'TOP_CATEGORIES', None)
+    if top_categories:
+        categories = Category.objects.in_bulk(top_categories.values(), field_name='slug')
+        return [
+            {
+                'name': label,                                 # Как отображается в меню
+                'url': categories[slug].get_absolute_url(),    # URL категории из БД
+            }
+            for label, slug in top_categories.items() if slug in categories
+        ]
+
+    categories = Category.objects.filter(menu_position__isnull=False).order_by('menu_position', 'pk')
+    return [
+        {'name': cat.menu_title or cat.name, 'url': cat.get_absolute_url()}
+        for cat in categories
+    ]
+
+
 @register.simple_tag()
 def get_top_categories():
-    result = []
-    for label, slug in TOP_CATEGORIES.items():
-        try:
-            cat = Category.objects.get(slug=slug)
-            result.append({
-                'name': label,             # Как отображается в меню
-                'url': cat.get_absolute_url(),  # URL категории из БД
-            })
-        except Category.DoesNotExist:
-            continue
-    return result
\ No newline at end of file
+    # Настройки входят в ключ, чтобы их изменение сразу меняло меню
+    config = repr(list((getattr(settings, 'TOP_CATEGORIES', None) or {}).items()))
+    digest = hashlib.md5(config.encode()).hexdigest()[:8]
+    return cache.get_or_set(cache.MENU, f'top_categories:{digest}', load_top_categories)
@@ -1,14 +1,21 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
-urlpatterns = [
-    path('', views.IndexView.as_view(), name='homepage'),
-    path('promotions/', views.PromotionsView.as_view(), name='promotions'),
-    path('contacts/', views.ContactsView.as_view(), name='contacts'),
-    path('about/', views.AboutView.as_view(), name='about'),
-    path('login/', views.LoginView.as_view(), name='login'),
-#     path('category/<slug:category_slug>/', views.show_category,
-#          name='category'),
-    path('collection/<slug:collection_slug>', views.CollectionView.as_view(), name='collection')
-]
+
+def get_urlpatterns(async_views):
+    """Маршруты главной; async_views - асинхронный вариант главной страницы (под ASGI)"""
+    return [
+        path('', (views.AsyncIndexView if async_views else views.IndexView).as_view(), name='homepage'),
+        path('promotions/', views.PromotionsView.as_view(), name='promotions'),
+        path('contacts/', views.ContactsView.as_view(), name='contacts'),
+        path('about/', views.AboutView.as_view(), name='about'),
+        path('login/', views.LoginView.as_view(), name='login'),
+    #     path('category/<slug:category_slug>/', views.show_category,
+    #          name='category'),
+        path('collection/<slug:collection_slug>', views.CollectionView.as_view(), name='collection')
+    ]
+
+
+urlpatterns = get_urlpatterns(settings.ASYNC_VIEWS)
@@ -4,6 +4,9 @@ from django.views.generic import TemplateView, DetailView, ListView
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from .models import Collection
+from catalog import cache
+from catalog.page_cache import HOME_PAGES, PageCacheMixin
+from catalog.utils import AsyncListView, ConditionalGetMixin
 from .utils import HomeContextMixin
 
 # Create your views here.
@@ -16,11 +19,16 @@ from .utils import HomeContextMixin
 
 
 # Главная страница сайта
-class IndexView(HomeContextMixin, ListView):
+class IndexView(PageCacheMixin, ConditionalGetMixin, HomeContextMixin, ListView):
     model = Collection
     template_name = 'homepage/index.html'
     context_object_name = 'new_collections'
     page_title = 'Главная'
+    page_cache_scopes = (HOME_PAGES, cache.MENU)
+    last_modified_field = 'time_update'
+    # Бюджет SQL-запросов представления (monitoring/metrics.py; без сессии, пользователя
+    # и заполнения кэша меню): количество и страница коллекций для валидаторов и для списка
+    query_budget = 4
     
     def get_queryset(self):
         return Collection.published.all()
@@ -30,6 +38,12 @@ class IndexView(HomeContextMixin, ListView):
         return self.get_mixin_context(context)
 
 
+# Главная страница сайта (асинхронно, под ASGI - см. настройку ASYNC_VIEWS)
+class AsyncIndexView(IndexView, AsyncListView):
+    async def aget_extra_context(self):
+        return self.get_mixin_context({})
+
+
 # Страница акций и скидок
 class PromotionsView(LoginRequiredMixin, HomeContextMixin, TemplateView):
     template_name = 'homepage/promotions.html'
@@ -71,7 +85,7 @@ class LoginView(View):
 
 
 # Отображение конкретной коллекции
-class CollectionView(LoginRequiredMixin, HomeContextMixin, DetailView):
+class CollectionView(LoginRequiredMixin, ConditionalGetMixin, HomeContextMixin, DetailView):
     model = Collection
     template_name = 'homepage/collection.html'
     context_object_name = 'collection'
@@ -79,6 +93,13 @@ class CollectionView(LoginRequiredMixin, HomeContextMixin, DetailView):
     
     def get_queryset(self):
         return Collection.published.all()
+
+    def get_validators(self):
+        row = (self.get_queryset().filter(slug=self.kwargs[self.slug_url_kwarg])
+               .values_list('pk', 'time_update').first())
+        if row is None:
+            return None
+        return (row, cache.get_versions(cache.MENU)), row[1]
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
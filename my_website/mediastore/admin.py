@@ -0,0 +1,49 @@
+from django.contrib import admin
+
+from .models import Blob, Upload, UploadSession
+
+# Register your models here.
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'refcount', 'created_at', 'touched_at')
+    list_filter = ('created_at',)
+    search_fields = ('sha256', 'name')
+    readonly_fields = ('sha256', 'name', 'size', 'refcount', 'created_at', 'touched_at')
+    ordering = ['-created_at']
+    list_per_page = 50
+
+    # Строки создаются хранилищем и удаляются сборщиком мусора
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Upload)
+class UploadAdmin(admin.ModelAdmin):
+    list_display = ('original_name', 'file', 'size', 'user', 'created_at')
+    list_filter = ('created_at',)
+    search_fields = ('original_name', 'user__username')
+    readonly_fields = ('size', 'created_at')
+    list_per_page = 30
+
+    # Файлы загружаются через форму загрузки на сайте
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'user', 'size', 'status', 'created_at', 'expires_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('filename', 'user__username')
+    readonly_fields = ('id', 'user', 'filename', 'size', 'chunk_size', 'sha256', 'status', 'file',
+                       'created_at', 'expires_at')
+    list_per_page = 30
+
+    # Сессии создаются через API загрузки по частям
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class MediastoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'mediastore'
+    verbose_name = 'Медиафайлы'
+
+    def ready(self):
+        from . import signals
+        signals.connect()
@@ -0,0 +1,122 @@
+"""
+Счётчики ссылок на файлы содержимого (Blob) и сборка мусора.
+
+Ссылки - значения полей FileField/ImageField, использующих DedupStorage
+(их находит dedup_fields()). Счётчики изменяются сигналами моделей в той же
+транзакции, что и сохранение объекта (mediastore/signals.py). Массовые
+изменения в обход save() счётчики не обновляют, поэтому перед удалением
+файла сборщик мусора проверяет ссылки по самим таблицам.
+
+Файл удаляется, только если на него нет ссылок дольше GRACE_PERIOD: за это
+время завершаются транзакции, которые загрузили файл, но ещё не сохранили
+ссылку на него.
+"""
+
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.db.models import Count, F, FileField
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Blob
+from .storage import TMP_DIR, DedupStorage, media_storage
+
+GRACE_PERIOD = timedelta(hours=24)
+BATCH_SIZE = 500
+
+
+def dedup_fields():
+    """Пары (модель, поле) для всех файловых полей с хранилищем DedupStorage"""
+    return [
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, FileField) and isinstance(field.storage, DedupStorage)
+    ]
+
+
+def acquire(name):
+    if name:
+        Blob.objects.filter(name=name).update(refcount=F('refcount') + 1, touched_at=timezone.now())
+
+
+def release(name):
+    if name:
+        Blob.objects.filter(name=name).update(refcount=Greatest(F('refcount') - 1, 0),
+                                              touched_at=timezone.now())
+
+
+def reference_counts(names=None):
+    """Фактическое количество ссылок {имя файла: количество} (для names или для всех файлов)"""
+    counts = Counter()
+    for model, field in dedup_fields():
+        queryset = model._base_manager.exclude(**{field.attname: ''}).exclude(**{f'{field.attname}__isnull': True})
+        if names is not None:
+            queryset = queryset.filter(**{f'{field.attname}__in': names})
+        for name, count in queryset.order_by().values_list(field.attname).annotate(count=Count('pk')):
+            counts[name] += count
+    return counts
+
+
+def recount():
+    """Пересчитывает счётчики ссылок всех файлов по таблицам, возвращает число исправленных"""
+    counts = reference_counts()
+    fixed = 0
+    for blob in Blob.objects.only('pk', 'name', 'refcount').iterator(chunk_size=BATCH_SIZE):
+        if blob.refcount != counts.get(blob.name, 0):
+            Blob.objects.filter(pk=blob.pk).update(refcount=counts.get(blob.name, 0))
+            fixed += 1
+    return fixed
+
+
+def collect_garbage(grace_period=GRACE_PERIOD, dry_run=False):
+    """
+    Удаляет файлы без ссылок, не использовавшиеся дольше grace_period,
+    и брошенные временные файлы. Возвращает (удалено файлов, освобождено байт).
+    """
+    storage = media_storage()
+    cutoff = timezone.now() - grace_period
+    deleted = freed = 0
+
+    last_pk = 0
+    while True:
+        batch = list(Blob.objects.filter(refcount=0, touched_at__lt=cutoff, pk__gt=last_pk)
+                     .order_by('pk').values_list('pk', 'name', 'size')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        # Ссылки, созданные в обход сигналов, исправляют счётчик вместо удаления
+        referenced = reference_counts([name for _, name, _ in batch])
+        for pk, name, size in batch:
+            if referenced.get(name):
+                if not dry_run:
+                    Blob.objects.filter(pk=pk).update(refcount=referenced[name])
+                continue
+            if not dry_run:
+                # Условие повторяется: файл могли загрузить заново после выборки
+                if not Blob.objects.filter(pk=pk, refcount=0, touched_at__lt=cutoff).delete()[0]:
+                    continue
+                storage.purge(name)
+            deleted += 1
+            freed += size
+
+    # Временные файлы прерванных загрузок
+    try:
+        _, files = storage.listdir(TMP_DIR)
+    except FileNotFoundError:
+        files = []
+    for file in files:
+        name = f'{TMP_DIR}/{file}'
+        try:
+            if storage.get_modified_time(name) < cutoff:
+                size = storage.size(name)
+                if not dry_run:
+                    os.remove(storage.path(name))
+                deleted += 1
+                freed += size
+        except FileNotFoundError:
+            continue
+    return deleted, freed
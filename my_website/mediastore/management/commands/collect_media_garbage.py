@@ -0,0 +1,30 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from mediastore import blobs
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы хранилища, на которые не ссылается ни один объект'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float,
+                            default=blobs.GRACE_PERIOD.total_seconds() / 3600,
+                            help='Сколько часов файл без ссылок хранится перед удалением')
+        parser.add_argument('--recount', action='store_true',
+                            help='Сначала пересчитать счётчики ссылок всех файлов по таблицам')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['recount'] and not options['dry_run']:
+            self.stdout.write(f'Исправлено счётчиков ссылок: {blobs.recount()}')
+        deleted, freed = blobs.collect_garbage(timedelta(hours=options['grace_hours']),
+                                               dry_run=options['dry_run'])
+        elapsed = time.monotonic() - started
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {deleted} ({freed / 1024 / 1024:.1f} МБ) за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mediastore import sessions
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие сессии загрузки по частям и их временные файлы'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        expired = sessions.expire()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Удалено сессий загрузки: {expired} за {elapsed:.1f} с'))
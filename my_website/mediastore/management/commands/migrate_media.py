@@ -0,0 +1,86 @@
+import os
+import time
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from mediastore import blobs
+from mediastore.models import Upload
+from mediastore.storage import is_blob_name, media_storage
+
+
+class Command(BaseCommand):
+    help = ('Переносит существующие медиафайлы в хранилище с дедупликацией и '
+            'обновляет ссылки на них в моделях')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-originals', action='store_true',
+                            help='Удалить исходные файлы после переноса')
+        parser.add_argument('--uploads-dir',
+                            help='Каталог с файлами, загруженными через форму загрузки до переноса '
+                                 '(для каждого файла создаётся объект Upload)')
+
+    @staticmethod
+    def batches(queryset, size=500):
+        # Выборка порциями по первичному ключу: строки изменяются во время обхода
+        last_pk = None
+        while True:
+            batch = list((queryset if last_pk is None else queryset.filter(pk__gt=last_pk))[:size])
+            if not batch:
+                return
+            yield from batch
+            last_pk = batch[-1][0]
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        storage = media_storage()
+        migrated = missing = 0
+        # Один исходный файл может использоваться несколькими объектами
+        moved = {}
+
+        for model, field in blobs.dedup_fields():
+            queryset = (model._base_manager.exclude(**{field.attname: ''})
+                        .exclude(**{f'{field.attname}__isnull': True})
+                        .exclude(**{f'{field.attname}__startswith': 'blobs/'})
+                        .order_by('pk').values_list('pk', field.attname))
+            for pk, name in self.batches(queryset):
+                if name not in moved:
+                    if not default_storage.exists(name):
+                        missing += 1
+                        self.stderr.write(f'{model._meta.label}.{field.name} #{pk}: файл {name} не найден')
+                        continue
+                    with default_storage.open(name, 'rb') as file:
+                        moved[name] = storage.save(name, file)
+                with transaction.atomic():
+                    # Обновление в обход save(): счётчик ссылок изменяется явно
+                    if model._base_manager.filter(pk=pk, **{field.attname: name}).update(
+                            **{field.attname: moved[name]}):
+                        blobs.acquire(moved[name])
+                migrated += 1
+
+        if options['delete_originals']:
+            for name in moved:
+                if not is_blob_name(name):
+                    default_storage.delete(name)
+
+        uploads = 0
+        if options['uploads_dir']:
+            if not os.path.isdir(options['uploads_dir']):
+                raise CommandError(f'Каталог {options["uploads_dir"]} не найден')
+            for entry in sorted(os.scandir(options['uploads_dir']), key=lambda entry: entry.name):
+                if entry.is_file():
+                    with open(entry.path, 'rb') as file:
+                        Upload.objects.create(file=File(file, name=entry.name), original_name=entry.name,
+                                              size=entry.stat().st_size)
+                    uploads += 1
+                    if options['delete_originals']:
+                        os.remove(entry.path)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено ссылок: {migrated}, уникальных файлов: {len(set(moved.values()))}, '
+            f'не найдено: {missing}, загрузок: {uploads} за {elapsed:.1f} с'
+        ))
+        self.stdout.write('Копии изображений для новых путей создаёт команда generate_image_derivatives --all')
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:42
+
+import django.db.models.deletion
+import mediastore.storage
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь в хранилище')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер (байт)')),
+                ('refcount', models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('touched_at', models.DateTimeField(auto_now_add=True, verbose_name='Последнее использование')),
+            ],
+            options={
+                'verbose_name': 'Файл хранилища',
+                'verbose_name_plural': 'Файлы хранилища',
+                'indexes': [models.Index(fields=['refcount', 'touched_at'], name='mediastore__refcoun_e858c6_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(max_length=255, storage=mediastore.storage.media_storage, upload_to='uploads/', verbose_name='Файл')),
+                ('original_name', models.CharField(max_length=255, verbose_name='Исходное имя файла')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер (байт)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploads', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Загруженный файл',
+                'verbose_name_plural': 'Загруженные файлы',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:46
+
+import django.db.models.deletion
+import mediastore.storage
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mediastore', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер (байт)')),
+                ('chunk_size', models.PositiveIntegerField(verbose_name='Размер части (байт)')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='Ожидаемый SHA-256')),
+                ('status', models.SmallIntegerField(choices=[(0, 'Загружается'), (1, 'Завершена')], default=0, verbose_name='Статус')),
+                ('file', models.FileField(blank=True, max_length=255, storage=mediastore.storage.media_storage, upload_to='uploads/', verbose_name='Файл')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Загрузка по частям',
+                'verbose_name_plural': 'Загрузки по частям',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField(verbose_name='Номер части')),
+                ('size', models.PositiveIntegerField(verbose_name='Размер (байт)')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='mediastore.uploadsession', verbose_name='Загрузка')),
+            ],
+            options={
+                'verbose_name': 'Часть загрузки',
+                'verbose_name_plural': 'Части загрузок',
+                'unique_together': {('session', 'index')},
+            },
+        ),
+    ]
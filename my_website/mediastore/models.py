@@ -0,0 +1,107 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+from .storage import media_storage
+
+# Create your models here.
+
+
+class Blob(models.Model):
+    """
+    Уникальное содержимое файла в хранилище DedupStorage (mediastore/storage.py).
+    refcount - количество ссылок из полей моделей; поддерживается сигналами
+    (mediastore/signals.py), файлы без ссылок удаляет команда collect_media_garbage.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="SHA-256")
+    name = models.CharField(max_length=255, unique=True, verbose_name="Путь в хранилище")
+    size = models.PositiveBigIntegerField(verbose_name="Размер (байт)")
+    refcount = models.PositiveIntegerField(default=0, verbose_name="Количество ссылок")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    # Последняя загрузка такого же содержимого или изменение количества ссылок
+    touched_at = models.DateTimeField(auto_now_add=True, verbose_name="Последнее использование")
+
+    class Meta:
+        verbose_name = "Файл хранилища"
+        verbose_name_plural = "Файлы хранилища"
+        indexes = [
+            models.Index(fields=['refcount', 'touched_at']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Upload(models.Model):
+    """Файл, загруженный через форму загрузки (UploadFileView)"""
+
+    file = models.FileField(upload_to='uploads/', max_length=255, storage=media_storage,
+                            verbose_name="Файл")
+    original_name = models.CharField(max_length=255, verbose_name="Исходное имя файла")
+    size = models.PositiveBigIntegerField(verbose_name="Размер (байт)")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='uploads', verbose_name="Пользователь")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")
+
+    class Meta:
+        verbose_name = "Загруженный файл"
+        verbose_name_plural = "Загруженные файлы"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.original_name
+
+
+class UploadSession(models.Model):
+    """
+    Загрузка файла по частям (mediastore/sessions.py). Части хранятся во
+    временном каталоге до завершения, затем собираются в файл хранилища.
+    """
+
+    class Status(models.IntegerChoices):
+        ACTIVE = 0, 'Загружается'
+        COMPLETED = 1, 'Завершена'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                             related_name='upload_sessions', verbose_name="Пользователь")
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    size = models.PositiveBigIntegerField(verbose_name="Размер (байт)")
+    chunk_size = models.PositiveIntegerField(verbose_name="Размер части (байт)")
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="Ожидаемый SHA-256")
+    status = models.SmallIntegerField(choices=Status.choices, default=Status.ACTIVE, verbose_name="Статус")
+    # Собранный файл; ссылка удерживает его в хранилище до истечения сессии
+    file = models.FileField(upload_to='uploads/', max_length=255, storage=media_storage, blank=True,
+                            verbose_name="Файл")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Действует до")
+
+    class Meta:
+        verbose_name = "Загрузка по частям"
+        verbose_name_plural = "Загрузки по частям"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.get_status_display()})"
+
+
+class UploadChunk(models.Model):
+    """Полученная часть файла загрузки"""
+
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE,
+                                related_name='chunks', verbose_name="Загрузка")
+    index = models.PositiveIntegerField(verbose_name="Номер части")
+    size = models.PositiveIntegerField(verbose_name="Размер (байт)")
+    sha256 = models.CharField(max_length=64, verbose_name="SHA-256")
+
+    class Meta:
+        verbose_name = "Часть загрузки"
+        verbose_name_plural = "Части загрузок"
+        unique_together = [['session', 'index']]
+
+    def __str__(self):
+        return f"{self.session_id} #{self.index}"
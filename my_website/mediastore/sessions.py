@@ -0,0 +1,251 @@
+"""
+Загрузка больших файлов по частям с возможностью продолжения.
+
+Протокол (JSON, mediastore/views.py):
+  1. POST   uploads/sessions/                      {filename, size, sha256?}
+     -> {id, url, chunk_size, chunks, expires_at}
+  2. PUT    uploads/sessions/<id>/chunks/<index>/  тело - байты части,
+     Content-Range: bytes <начало>-<конец>/<размер файла>, X-Chunk-SHA256: <hex>
+     Части можно отправлять параллельно и повторно (повтор заменяет часть).
+  3. GET    uploads/sessions/<id>/                 прогресс и номера недостающих частей
+     (после обрыва клиент досылает только их)
+  4. POST   uploads/sessions/<id>/complete/        сборка частей в файл хранилища
+  5. DELETE uploads/sessions/<id>/                 отмена
+
+Каждый запрос передаёт не больше одной части, поэтому воркер не занят на всё
+время передачи файла. Части пишутся во временный каталог DIRECTORY/<id>/ с
+проверкой смещения, размера и SHA-256. При завершении части читаются подряд
+и сохраняются в хранилище media (DedupStorage) - файл хэшируется при
+сохранении, и хэш сверяется с ожидаемым. ID завершённой сессии передаётся
+в форму (скрытое поле), которая использует собранный файл.
+
+Незавершённые и неиспользованные сессии удаляет команда expire_upload_sessions.
+"""
+
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Blob, UploadChunk, UploadSession
+
+DEFAULTS = {
+    'DIRECTORY': os.path.join(settings.BASE_DIR, 'var', 'upload_sessions'),
+    'CHUNK_SIZE': 5 * 1024 * 1024,
+    'MAX_SIZE': 5 * 1024 * 1024 * 1024,
+    'EXPIRES': timedelta(hours=24),
+}
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Ошибка протокола загрузки; status - HTTP-статус ответа"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def get_setting(name):
+    return getattr(settings, 'UPLOAD_SESSIONS', {}).get(name, DEFAULTS[name])
+
+
+def session_directory(session_id):
+    return os.path.join(get_setting('DIRECTORY'), str(session_id))
+
+
+def chunk_path(session, index):
+    return os.path.join(session_directory(session.pk), f'{index}.part')
+
+
+def chunk_count(session):
+    return math.ceil(session.size / session.chunk_size)
+
+
+def chunk_length(session, index):
+    return min(session.chunk_size, session.size - index * session.chunk_size)
+
+
+def create(user, filename, size, sha256=''):
+    filename = os.path.basename(str(filename or '').replace('\\', '/')).strip()
+    if not filename:
+        raise UploadError('Не указано имя файла')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('Некорректный размер файла')
+    if not 0 < size <= get_setting('MAX_SIZE'):
+        raise UploadError(f'Размер файла должен быть от 1 байта до {get_setting("MAX_SIZE")} байт')
+    sha256 = str(sha256 or '').lower()
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise UploadError('Некорректная контрольная сумма SHA-256')
+    return UploadSession.objects.create(
+        user=user, filename=filename[:255], size=size, chunk_size=get_setting('CHUNK_SIZE'),
+        sha256=sha256, expires_at=timezone.now() + get_setting('EXPIRES'),
+    )
+
+
+def _check_active(session):
+    if session.expires_at <= timezone.now():
+        raise UploadError('Срок загрузки истёк', status=410)
+    if session.status != UploadSession.Status.ACTIVE:
+        raise UploadError('Загрузка уже завершена', status=409)
+
+
+def parse_content_range(value):
+    """'bytes 0-99/1000' -> (0, 99, 1000)"""
+    try:
+        unit, _, spec = value.strip().partition(' ')
+        byte_range, _, total = spec.partition('/')
+        start, _, end = byte_range.partition('-')
+        if unit != 'bytes':
+            raise ValueError
+        return int(start), int(end), int(total)
+    except ValueError:
+        raise UploadError('Некорректный заголовок Content-Range')
+
+
+def write_chunk(session, index, stream, length, content_range=None, sha256=None):
+    """
+    Записывает часть index из потока stream (length байт) и возвращает UploadChunk.
+    content_range - (начало, конец, размер файла) для проверки смещения.
+    """
+    _check_active(session)
+    if not 0 <= index < chunk_count(session):
+        raise UploadError(f'Номер части должен быть от 0 до {chunk_count(session) - 1}')
+    expected = chunk_length(session, index)
+    if length != expected:
+        raise UploadError(f'Размер части {index} должен быть {expected} байт')
+    if content_range is not None:
+        start = index * session.chunk_size
+        if content_range != (start, start + expected - 1, session.size):
+            raise UploadError(f'Часть {index} должна занимать байты {start}-{start + expected - 1}/{session.size}')
+
+    directory = session_directory(session.pk)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    digest = hashlib.sha256()
+    received = 0
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            while received < length:
+                data = stream.read(min(READ_SIZE, length - received))
+                if not data:
+                    break
+                digest.update(data)
+                file.write(data)
+                received += len(data)
+        if received != length:
+            raise UploadError(f'Получено {received} байт из {length}, отправьте часть повторно')
+        if sha256 and sha256.lower() != digest.hexdigest():
+            raise UploadError(f'Контрольная сумма части {index} не совпадает, отправьте часть повторно')
+        # Повторная отправка части заменяет файл целиком
+        os.replace(temporary, chunk_path(session, index))
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+    chunk, _ = UploadChunk.objects.update_or_create(
+        session=session, index=index, defaults={'size': length, 'sha256': digest.hexdigest()},
+    )
+    return chunk
+
+
+def progress(session):
+    """Состояние загрузки для клиента"""
+    received = dict(session.chunks.values_list('index', 'size'))
+    total = chunk_count(session)
+    return {
+        'id': str(session.pk),
+        'status': UploadSession.Status(session.status).name.lower(),
+        'filename': session.filename,
+        'size': session.size,
+        'chunk_size': session.chunk_size,
+        'chunks': total,
+        'received_bytes': session.size if session.status == UploadSession.Status.COMPLETED else sum(received.values()),
+        'missing': [] if session.status == UploadSession.Status.COMPLETED
+        else [index for index in range(total) if index not in received],
+        'expires_at': session.expires_at.isoformat(),
+        'file': session.file.url if session.file else None,
+    }
+
+
+class _AssembledFile(File):
+    """Файл из частей загрузки, читаемый подряд без склейки на диске"""
+
+    def __init__(self, session):
+        super().__init__(None, session.filename)
+        self.paths = [chunk_path(session, index) for index in range(chunk_count(session))]
+        self.size = session.size
+
+    def chunks(self, chunk_size=None):
+        for path in self.paths:
+            with open(path, 'rb') as file:
+                while data := file.read(chunk_size or self.DEFAULT_CHUNK_SIZE):
+                    yield data
+
+
+def complete(session):
+    """Собирает части в файл хранилища и завершает сессию"""
+    _check_active(session)
+    missing = [index for index in range(chunk_count(session))
+               if not os.path.exists(chunk_path(session, index))]
+    if missing or session.chunks.count() != chunk_count(session):
+        raise UploadError(f'Получены не все части, недостаёт: {missing[:20]}', status=409)
+
+    session.file.save(session.filename, _AssembledFile(session), save=False)
+    if session.sha256 and not Blob.objects.filter(name=session.file.name, sha256=session.sha256).exists():
+        # Собранный файл без ссылок удалит сборщик мусора
+        session.file = ''
+        raise UploadError('Контрольная сумма файла не совпадает, загрузите файл заново', status=422)
+
+    with transaction.atomic():
+        session.status = UploadSession.Status.COMPLETED
+        session.save(update_fields=['file', 'status'])
+        session.chunks.all().delete()
+    shutil.rmtree(session_directory(session.pk), ignore_errors=True)
+    return session
+
+
+def abort(session):
+    session.delete()
+    shutil.rmtree(session_directory(session.pk), ignore_errors=True)
+
+
+def get_completed(session_id, user):
+    """Завершённая сессия пользователя или None (для форм, принимающих ID сессии)"""
+    return UploadSession.objects.filter(
+        pk=session_id, user=user, status=UploadSession.Status.COMPLETED, expires_at__gt=timezone.now(),
+    ).first()
+
+
+def expire():
+    """Удаляет истёкшие сессии и их временные файлы, возвращает количество сессий"""
+    expired = list(UploadSession.objects.filter(expires_at__lte=timezone.now()))
+    for session in expired:
+        abort(session)
+
+    # Каталоги частей без сессии (например, после удаления пользователя)
+    directory = get_setting('DIRECTORY')
+    if os.path.isdir(directory):
+        ids = {}
+        for entry in os.scandir(directory):
+            try:
+                ids[uuid.UUID(entry.name)] = entry.path
+            except ValueError:
+                continue
+        existing = set(UploadSession.objects.filter(pk__in=list(ids)).values_list('pk', flat=True))
+        for session_id, path in ids.items():
+            if session_id not in existing:
+                shutil.rmtree(path, ignore_errors=True)
+    return len(expired)
@@ -0,0 +1,69 @@
+"""
+Обработчики сигналов приложения "mediastore": счётчики ссылок на файлы
+содержимого. Подключаются в MediastoreConfig.ready() для всех моделей с
+полями, использующими DedupStorage.
+"""
+
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+
+from . import blobs
+
+# Неизвестное значение поля (поле не было загружено из БД)
+UNKNOWN = object()
+
+
+def _name(value):
+    return getattr(value, 'name', value) or None
+
+
+def _loaded_names(sender, instance, **kwargs):
+    # Имена файлов, сохранённые в БД (до изменения полей объекта)
+    instance._mediastore_names = {
+        field.attname: _name(instance.__dict__[field.attname]) if field.attname in instance.__dict__ else UNKNOWN
+        for field in sender._mediastore_fields
+    }
+
+
+def _fetch_unknown(sender, instance, raw=False, **kwargs):
+    names = getattr(instance, '_mediastore_names', {})
+    unknown = [attname for attname, name in names.items() if name is UNKNOWN]
+    if unknown and instance.pk is not None and not raw:
+        stored = sender._base_manager.filter(pk=instance.pk).values(*unknown).first() or {}
+        names.update((attname, stored.get(attname) or None) for attname in unknown)
+
+
+def _saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    names = getattr(instance, '_mediastore_names', {})
+    for field in sender._mediastore_fields:
+        if update_fields is not None and field.name not in update_fields:
+            continue
+        old = None if created else names.get(field.attname)
+        new = _name(getattr(instance, field.attname))
+        if old is UNKNOWN:
+            old = None
+        if old != new:
+            blobs.acquire(new)
+            blobs.release(old)
+        names[field.attname] = new
+    instance._mediastore_names = names
+
+
+def _deleted(sender, instance, **kwargs):
+    names = getattr(instance, '_mediastore_names', {})
+    for field in sender._mediastore_fields:
+        blobs.release(names.get(field.attname))
+
+
+def connect():
+    models = {}
+    for model, field in blobs.dedup_fields():
+        models.setdefault(model, []).append(field)
+    for model, fields in models.items():
+        model._mediastore_fields = fields
+        post_init.connect(_loaded_names, sender=model, dispatch_uid=f'mediastore_init_{model._meta.label}')
+        pre_save.connect(_fetch_unknown, sender=model, dispatch_uid=f'mediastore_pre_save_{model._meta.label}')
+        pre_delete.connect(_fetch_unknown, sender=model, dispatch_uid=f'mediastore_pre_delete_{model._meta.label}')
+        post_save.connect(_saved, sender=model, dispatch_uid=f'mediastore_save_{model._meta.label}')
+        post_delete.connect(_deleted, sender=model, dispatch_uid=f'mediastore_delete_{model._meta.label}')
@@ -0,0 +1,130 @@
+// Загрузка больших файлов по частям (протокол - mediastore/sessions.py).
+// Форма с атрибутом data-resumable-upload="<URL создания сессии>" перед отправкой
+// загружает файлы из полей с data-resumable-target частями, записывает ID сессии
+// в указанное скрытое поле и отправляется без самого файла. Номер сессии хранится
+// в localStorage: после обрыва связи или перезагрузки страницы досылаются только
+// недостающие части.
+(() => {
+    const PARALLEL = 3;
+    const RETRIES = 5;
+    const MIN_SIZE = 1024 * 1024;  // файлы меньше отправляются вместе с формой
+
+    const csrfToken = (form) => form.querySelector('[name=csrfmiddlewaretoken]').value;
+
+    const storageKey = (file) => `resumable-upload:${file.name}:${file.size}:${file.lastModified}`;
+
+    const hex = (buffer) => Array.from(new Uint8Array(buffer))
+        .map((byte) => byte.toString(16).padStart(2, '0')).join('');
+
+    // SHA-256 доступен только в защищённом контексте (HTTPS или localhost)
+    const sha256 = async (blob) => (window.crypto && crypto.subtle
+        ? hex(await crypto.subtle.digest('SHA-256', await blob.arrayBuffer()))
+        : null);
+
+    async function request(form, url, options = {}) {
+        const response = await fetch(url, {
+            credentials: 'same-origin',
+            ...options,
+            headers: {'X-CSRFToken': csrfToken(form), 'Accept': 'application/json', ...(options.headers || {})},
+        });
+        const data = response.status === 204 ? {} : await response.json();
+        if (!response.ok) {
+            const error = new Error(data.error || response.statusText);
+            error.status = response.status;
+            throw error;
+        }
+        return data;
+    }
+
+    async function openSession(form, file) {
+        const saved = localStorage.getItem(storageKey(file));
+        if (saved) {
+            try {
+                const session = await request(form, saved);
+                if (session.status === 'active' || session.status === 'completed') {
+                    return session;
+                }
+            } catch (error) {
+                // Сессия истекла или удалена - начинаем заново
+            }
+        }
+        const session = await request(form, form.dataset.resumableUpload, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({filename: file.name, size: file.size}),
+        });
+        localStorage.setItem(storageKey(file), session.url);
+        return session;
+    }
+
+    async function sendChunk(form, session, file, index) {
+        const start = index * session.chunk_size;
+        const end = Math.min(start + session.chunk_size, file.size);
+        const chunk = file.slice(start, end);
+        const headers = {'Content-Range': `bytes ${start}-${end - 1}/${file.size}`};
+        const checksum = await sha256(chunk);
+        if (checksum) {
+            headers['X-Chunk-SHA256'] = checksum;
+        }
+        for (let attempt = 1; ; attempt++) {
+            try {
+                return await request(form, `${session.url}chunks/${index}/`, {method: 'PUT', headers, body: chunk});
+            } catch (error) {
+                if (attempt >= RETRIES || (error.status && error.status !== 400 && error.status < 500)) {
+                    throw error;
+                }
+                await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** attempt));
+            }
+        }
+    }
+
+    async function upload(form, input, progress) {
+        const file = input.files[0];
+        let session = await openSession(form, file);
+        if (session.status !== 'completed') {
+            const queue = [...session.missing];
+            let received = session.received_bytes;
+            progress.max = file.size;
+            progress.value = received;
+            const worker = async () => {
+                while (queue.length) {
+                    const index = queue.shift();
+                    const chunk = await sendChunk(form, session, file, index);
+                    received += chunk.size;
+                    progress.value = received;
+                }
+            };
+            await Promise.all(Array.from({length: PARALLEL}, worker));
+            session = await request(form, `${session.url}complete/`, {method: 'POST'});
+        }
+        localStorage.removeItem(storageKey(file));
+        return session;
+    }
+
+    document.addEventListener('submit', async (event) => {
+        const form = event.target.closest('form[data-resumable-upload]');
+        const inputs = form ? [...form.querySelectorAll('input[type=file][data-resumable-target]')]
+            .filter((input) => input.files.length && input.files[0].size >= MIN_SIZE) : [];
+        if (!inputs.length) {
+            return;
+        }
+        event.preventDefault();
+        const button = form.querySelector('[type=submit]');
+        button.disabled = true;
+        try {
+            for (const input of inputs) {
+                const progress = document.createElement('progress');
+                input.after(progress);
+                const session = await upload(form, input, progress);
+                form.querySelector(`[name=${input.dataset.resumableTarget}]`).value = session.id;
+                // Файл уже на сервере, с формой отправляется только ID сессии
+                input.value = '';
+                progress.remove();
+            }
+            form.submit();
+        } catch (error) {
+            alert(`Не удалось загрузить файл: ${error.message}. Отправьте форму ещё раз, загрузка продолжится.`);
+            button.disabled = false;
+        }
+    });
+})();
@@ -0,0 +1,144 @@
+"""
+Хранилище файлов с адресацией по содержимому (дедупликацией).
+
+При сохранении файл читается по частям (chunks()) во временный файл с
+одновременным подсчётом SHA-256. Затем он переносится в
+    blobs/<2 символа хэша>/<следующие 2 символа>/<хэш><расширение>
+Если такое содержимое уже есть, временный файл удаляется и возвращается имя
+существующего файла, поэтому одна и та же фотография, загруженная 500 раз,
+хранится один раз. Путь upload_to поля не используется.
+
+Каждому содержимому соответствует строка Blob со счётчиком ссылок из полей
+моделей (mediastore/signals.py). Хранилище не удаляет файлы по delete():
+файл может использоваться другими объектами. Файлы без ссылок удаляет
+команда collect_media_garbage (mediastore/blobs.py).
+
+Хранилище использует тот же каталог MEDIA_ROOT, что и стандартное, поэтому
+копии изображений (catalog/images.py) создаются рядом с файлом содержимого
+и тоже не дублируются.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+BLOBS_DIR = 'blobs'
+TMP_DIR = f'{BLOBS_DIR}/tmp'
+MAX_EXTENSION_LENGTH = 10
+
+
+def media_storage():
+    """Хранилище для полей FileField/ImageField (STORAGES['media'])"""
+    return storages['media']
+
+
+def blob_name(sha256, extension=''):
+    return '/'.join((BLOBS_DIR, sha256[:2], sha256[2:4], sha256 + extension))
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(f'{BLOBS_DIR}/') and not name.startswith(f'{TMP_DIR}/')
+
+
+class DedupStorage(FileSystemStorage):
+    """Файловое хранилище, которое хранит одинаковое содержимое один раз"""
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save(), подбирать свободное имя не нужно
+        return name
+
+    def _write_temporary(self, content):
+        directory = self.path(TMP_DIR)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, path = tempfile.mkstemp(dir=directory)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, digest.hexdigest(), size
+
+    def _move(self, temporary, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(temporary, self.file_permissions_mode)
+        os.replace(temporary, path)
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        temporary, sha256, size = self._write_temporary(content)
+        try:
+            if is_blob_name(name):
+                # Копии изображений (catalog/images.py) записываются рядом с файлом
+                # содержимого под своим именем и удаляются вместе с ним в purge()
+                self._move(temporary, name)
+                temporary = None
+                return name
+
+            blob = Blob.objects.filter(sha256=sha256).first()
+            # Обновление отметки защищает файл от удаления сборщиком мусора;
+            # если строку только что удалил сборщик, файл записывается заново
+            if (blob is not None and self.exists(blob.name)
+                    and Blob.objects.filter(pk=blob.pk).update(touched_at=timezone.now())):
+                return blob.name
+
+            extension = os.path.splitext(name)[1].lower()
+            if len(extension) > MAX_EXTENSION_LENGTH:
+                extension = ''
+            name = blob.name if blob is not None else blob_name(sha256, extension)
+            self._move(temporary, name)
+            temporary = None
+            return self._register(sha256, name, size)
+        finally:
+            if temporary is not None:
+                os.remove(temporary)
+
+    def _register(self, sha256, name, size):
+        """Создаёт строку Blob для записанного файла, возвращает имя файла содержимого"""
+        from .models import Blob
+
+        if Blob.objects.filter(sha256=sha256, name=name).update(size=size, touched_at=timezone.now()):
+            return name
+        try:
+            with transaction.atomic():
+                Blob.objects.create(sha256=sha256, name=name, size=size)
+            return name
+        except IntegrityError:
+            # Такое же содержимое одновременно сохранила другая загрузка: используется
+            # её файл, а свой (с другим расширением) удаляется
+            blob = Blob.objects.get(sha256=sha256)
+            Blob.objects.filter(pk=blob.pk).update(touched_at=timezone.now())
+            if blob.name != name:
+                super().delete(name)
+            return blob.name
+
+    def delete(self, name):
+        # Файл содержимого может использоваться другими объектами
+        if not is_blob_name(name):
+            super().delete(name)
+
+    def purge(self, name):
+        """Удаляет файл содержимого и файлы рядом с ним с тем же хэшем (копии изображений)"""
+        directory, filename = os.path.split(name)
+        sha256 = os.path.splitext(filename)[0]
+        try:
+            _, files = self.listdir(directory)
+        except FileNotFoundError:
+            return
+        for file in files:
+            if file.startswith(sha256):
+                super().delete(f'{directory}/{file}')
@@ -0,0 +1,204 @@
+import hashlib
+import io
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from catalog.models import Product
+from users.models import User
+from . import blobs, sessions
+from .models import Blob, Upload, UploadChunk, UploadSession
+from .storage import DedupStorage, blob_name, media_storage
+
+# Create your tests here.
+
+
+class DedupStorageTests(TestCase):
+    """Хранилище с дедупликацией: одно содержимое - один файл и одна строка Blob"""
+
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.storage = media_storage()
+
+    def test_concurrent_first_upload(self):
+        content = b'same content'
+        sha256 = hashlib.sha256(content).hexdigest()
+        other = blob_name(sha256, '.png')
+        move = DedupStorage._move
+
+        def racing_move(storage, temporary, name):
+            # Параллельная загрузка того же содержимого успевает записать файл и строку
+            if not Blob.objects.exists():
+                Blob.objects.create(sha256=sha256, name=other, size=len(content))
+                move(storage, storage._write_temporary(ContentFile(content))[0], other)
+            move(storage, temporary, name)
+
+        with mock.patch.object(DedupStorage, '_move', racing_move):
+            name = self.storage.save('photo.jpg', ContentFile(content))
+
+        self.assertEqual(name, other)
+        self.assertEqual(Blob.objects.get().name, other)
+        self.assertTrue(self.storage.exists(other))
+        self.assertFalse(self.storage.exists(blob_name(sha256, '.jpg')))
+
+
+class BlobReferenceTests(TestCase):
+    """Счётчики ссылок на файлы содержимого и сборка мусора"""
+
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, 'JPEG')
+        self.content = buffer.getvalue()
+
+    def test_shared_blob_and_garbage_collection(self):
+        upload = Upload.objects.create(file=ContentFile(self.content, name='photo.jpg'), original_name='photo.jpg',
+                                       size=len(self.content))
+        product = Product.objects.create(name='Платье', slug='dress', description='Описание', price=1000,
+                                         image=ContentFile(self.content, name='dress.JPG'))
+        # Одно содержимое в двух моделях - один файл и одна строка Blob
+        self.assertEqual(upload.file.name, product.image.name)
+        blob = Blob.objects.get()
+        self.assertEqual((blob.name, blob.refcount), (upload.file.name, 2))
+
+        upload.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        self.assertTrue(product.image.storage.exists(blob.name))
+
+        product.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 0)
+        # Без ссылок, но в пределах GRACE_PERIOD файл не удаляется
+        self.assertEqual(blobs.collect_garbage(), (0, 0))
+        self.assertTrue(media_storage().exists(blob.name))
+
+        Blob.objects.update(touched_at=timezone.now() - blobs.GRACE_PERIOD - timedelta(minutes=1))
+        self.assertEqual(blobs.collect_garbage(), (1, len(self.content)))
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(media_storage().exists(blob.name))
+
+    def test_reference_outside_signals_not_collected(self):
+        name = media_storage().save('photo.jpg', ContentFile(self.content))
+        # Ссылка, сохранённая в обход save(), не увеличивает счётчик
+        product = Product.objects.create(name='Платье', slug='dress', description='Описание', price=1000)
+        Product.objects.filter(pk=product.pk).update(image=name)
+        Blob.objects.update(touched_at=timezone.now() - blobs.GRACE_PERIOD - timedelta(minutes=1))
+
+        self.assertEqual(blobs.collect_garbage(), (0, 0))
+        self.assertEqual(Blob.objects.get().refcount, 1)
+        self.assertTrue(media_storage().exists(name))
+
+
+class UploadSessionTests(TestCase):
+    """Загрузка по частям: порядок частей, проверки и завершение"""
+
+    content = b'0123456789'
+
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(UPLOAD_SESSIONS={'DIRECTORY': self.directory, 'CHUNK_SIZE': 4,
+                                                             'MAX_SIZE': 100}))
+        self.user = User.objects.create_user('uploader', password='password')
+        self.client.force_login(self.user)
+
+    def create_session(self, sha256=None):
+        response = self.client.post(reverse('mediastore:upload_sessions'), {
+            'filename': 'notes.txt', 'size': len(self.content),
+            'sha256': sha256 or hashlib.sha256(self.content).hexdigest(),
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['chunks'], 3)
+        return response.json()['id']
+
+    def put_chunk(self, session_id, index, data=None, content_range=None):
+        start = index * 4
+        data = self.content[start:start + 4] if data is None else data
+        headers = {'X-Chunk-SHA256': hashlib.sha256(data).hexdigest(),
+                   'Content-Range': content_range or f'bytes {start}-{start + len(data) - 1}/{len(self.content)}'}
+        return self.client.put(reverse('mediastore:upload_chunk', kwargs={'session_id': session_id, 'index': index}),
+                               data, content_type='application/octet-stream', headers=headers)
+
+    def get_progress(self, session_id):
+        return self.client.get(reverse('mediastore:upload_session', kwargs={'session_id': session_id})).json()
+
+    def complete(self, session_id):
+        return self.client.post(reverse('mediastore:upload_session_complete', kwargs={'session_id': session_id}))
+
+    def test_out_of_order_and_duplicate_chunks(self):
+        session_id = self.create_session()
+        self.assertEqual(self.put_chunk(session_id, 2).status_code, 200)
+        self.assertEqual(self.put_chunk(session_id, 0, b'xxxx').status_code, 200)
+        self.assertEqual(self.get_progress(session_id)['missing'], [1])
+        # Повторная отправка заменяет часть
+        self.assertEqual(self.put_chunk(session_id, 0).status_code, 200)
+        self.assertEqual(self.complete(session_id).status_code, 409)
+        self.assertEqual(self.put_chunk(session_id, 1).status_code, 200)
+        self.assertEqual(UploadChunk.objects.count(), 3)
+
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'completed')
+        session = UploadSession.objects.get(pk=session_id)
+        with session.file.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertFalse(UploadChunk.objects.exists())
+        self.assertFalse(os.path.exists(sessions.session_directory(session_id)))
+        self.assertEqual(sessions.get_completed(session_id, self.user), session)
+
+    def test_offset_and_chunk_checks(self):
+        session_id = self.create_session()
+        cases = [
+            (1, None, 'bytes 0-3/10', 'должна занимать байты 4-7/10'),
+            (2, b'89x', None, 'Размер части 2 должен быть 2 байт'),
+            (3, b'00', 'bytes 12-13/10', 'Номер части должен быть от 0 до 2'),
+        ]
+        for index, data, content_range, message in cases:
+            with self.subTest(index=index):
+                response = self.put_chunk(session_id, index, data, content_range)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(message, response.json()['error'])
+
+        url = reverse('mediastore:upload_chunk', kwargs={'session_id': session_id, 'index': 0})
+        response = self.client.put(url, b'0123', content_type='application/octet-stream',
+                                   headers={'X-Chunk-SHA256': hashlib.sha256(b'other').hexdigest()})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_progress(session_id)['missing'], [0, 1, 2])
+        self.assertEqual(os.listdir(sessions.session_directory(session_id)), [])
+
+    def test_completion_checks_file_hash(self):
+        session_id = self.create_session(sha256=hashlib.sha256(b'other content').hexdigest())
+        for index in range(3):
+            self.put_chunk(session_id, index)
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 422)
+        session = UploadSession.objects.get(pk=session_id)
+        self.assertEqual((session.status, session.file.name), (UploadSession.Status.ACTIVE, ''))
+        # Собранный файл остаётся без ссылок до сборки мусора
+        self.assertEqual(Blob.objects.get().refcount, 0)
+
+    def test_expire_upload_sessions(self):
+        expired_id = self.create_session()
+        self.put_chunk(expired_id, 0)
+        active_id = self.create_session()
+        self.put_chunk(active_id, 0)
+        UploadSession.objects.filter(pk=expired_id).update(expires_at=timezone.now())
+        self.assertEqual(self.put_chunk(expired_id, 1).status_code, 410)
+        orphan = os.path.join(self.directory, str(uuid.uuid4()))
+        os.makedirs(orphan)
+
+        output = io.StringIO()
+        call_command('expire_upload_sessions', stdout=output)
+        self.assertIn('Удалено сессий загрузки: 1', output.getvalue())
+        self.assertEqual(list(UploadSession.objects.values_list('pk', flat=True)), [uuid.UUID(active_id)])
+        self.assertEqual(os.listdir(self.directory), [active_id])
@@ -0,0 +1,13 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'mediastore'
+
+urlpatterns = [
+    path('sessions/', views.UploadSessionCreateView.as_view(), name='upload_sessions'),
+    path('sessions/<uuid:session_id>/', views.UploadSessionView.as_view(), name='upload_session'),
+    path('sessions/<uuid:session_id>/chunks/<int:index>/', views.UploadChunkView.as_view(), name='upload_chunk'),
+    path('sessions/<uuid:session_id>/complete/', views.UploadSessionCompleteView.as_view(),
+         name='upload_session_complete'),
+]
@@ -0,0 +1,107 @@
+import json
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views import View
+
+from . import sessions
+from .models import UploadSession
+
+# Create your views here.
+
+
+# Базовый класс API загрузки по частям: ошибки протокола - JSON с кодом ответа
+class UploadApiView(LoginRequiredMixin, View):
+    raise_exception = True
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except sessions.UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+
+    def get_session(self):
+        return get_object_or_404(UploadSession, pk=self.kwargs['session_id'], user=self.request.user)
+
+    def session_response(self, session, status=200):
+        data = sessions.progress(session)
+        data['url'] = reverse('mediastore:upload_session', kwargs={'session_id': session.pk})
+        return JsonResponse(data, status=status)
+
+
+# Создание сессии загрузки
+class UploadSessionCreateView(UploadApiView):
+    def post(self, request):
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body)
+            except ValueError:
+                raise sessions.UploadError('Некорректный JSON')
+        else:
+            data = request.POST
+        session = sessions.create(request.user, data.get('filename'), data.get('size'), data.get('sha256'))
+        return self.session_response(session, status=201)
+
+
+# Состояние и отмена загрузки
+class UploadSessionView(UploadApiView):
+    def get(self, request, session_id):
+        return self.session_response(self.get_session())
+
+    def delete(self, request, session_id):
+        sessions.abort(self.get_session())
+        return HttpResponse(status=204)
+
+
+# Приём части файла (тело запроса читается потоком, без загрузки в память)
+class UploadChunkView(UploadApiView):
+    def put(self, request, session_id, index):
+        session = self.get_session()
+        try:
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            raise sessions.UploadError('Не указан заголовок Content-Length', status=411)
+        content_range = request.headers.get('Content-Range')
+        chunk = sessions.write_chunk(
+            session, index, request, length,
+            content_range=sessions.parse_content_range(content_range) if content_range else None,
+            sha256=request.headers.get('X-Chunk-SHA256'),
+        )
+        return JsonResponse({'index': chunk.index, 'size': chunk.size, 'sha256': chunk.sha256})
+
+
+# Сборка файла из частей
+class UploadSessionCompleteView(UploadApiView):
+    def post(self, request, session_id):
+        return self.session_response(sessions.complete(self.get_session()))
+
+
+# Миксин для форм, принимающих файл, загруженный по частям
+class ResumableUploadMixin:
+    """
+    Как использовать:
+      - В форму добавить скрытое поле UUIDField (ID завершённой сессии загрузки),
+        в виджет файлового поля - атрибут data-resumable-target с именем скрытого поля
+      - Для ModelForm задать `resumable_fields` = {скрытое поле: файловое поле модели},
+        собранный файл подставляется в объект формы перед сохранением
+      - В остальных формах получить сессию методом get_upload_session()
+    """
+
+    resumable_fields = {}
+
+    def get_upload_session(self, form, field):
+        session = sessions.get_completed(form.cleaned_data[field], self.request.user)
+        if session is None:
+            form.add_error(None, 'Загруженный файл не найден или срок его хранения истёк, загрузите файл заново.')
+        return session
+
+    def form_valid(self, form):
+        for session_field, file_field in self.resumable_fields.items():
+            if form.cleaned_data.get(session_field):
+                session = self.get_upload_session(form, session_field)
+                if session is None:
+                    return self.form_invalid(form)
+                setattr(form.instance, file_field, session.file.name)
+        return super().form_valid(form)
@@ -0,0 +1,40 @@
+from django.contrib import admin
+from django.template.defaultfilters import truncatechars
+
+from . import slow_queries
+from .models import SlowQuery
+
+
+# Отчёт о медленных запросах (monitoring/slow_queries.py), только просмотр
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('fingerprint', 'short_sql', 'view', 'template', 'count', 'total', 'average', 'maximum',
+                    'full_scans', 'last_seen')
+    list_filter = ('view', 'full_scans')
+    search_fields = ('fingerprint', 'sql', 'view', 'template', 'call_site')
+    fields = ['fingerprint', 'sql', 'params', 'view', 'template', 'call_site', 'plan', 'full_scans',
+              'count', 'total_ms', 'max_ms', 'first_seen', 'last_seen']
+    ordering = ['-total_ms']
+    list_per_page = slow_queries.get_setting('TOP_N')
+
+    @admin.display(description='SQL')
+    def short_sql(self, obj):
+        return truncatechars(obj.sql, 120)
+
+    @admin.display(description='Всего, мс', ordering='total_ms')
+    def total(self, obj):
+        return f'{obj.total_ms:.1f}'
+
+    @admin.display(description='Среднее, мс')
+    def average(self, obj):
+        return f'{obj.avg_ms:.1f}'
+
+    @admin.display(description='Максимум, мс', ordering='max_ms')
+    def maximum(self, obj):
+        return f'{obj.max_ms:.1f}'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
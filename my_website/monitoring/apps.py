@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'monitoring'
+    verbose_name = 'Мониторинг'
+
+    def ready(self):
+        from django.core.signals import request_finished
+        from django.db.backends.signals import connection_created
+
+        from . import metrics, slow_queries
+        connection_created.connect(metrics.install_query_wrapper)
+        connection_created.connect(slow_queries.install_query_wrapper)
+        request_finished.connect(slow_queries.flush)
@@ -0,0 +1,412 @@
+"""
+Подбор индексов по нагрузке (команда advise_indexes).
+
+Нагрузка - набор SQL-запросов с весами (сколько раз выполнялся запрос):
+  - replay       - сценарии замеров (catalog/benchmarks.py), выполненные
+                   тестовым клиентом; запросы записываются с параметрами;
+  - slow_queries - журнал медленных запросов (модель SlowQuery);
+  - log          - строки JSON журнала monitoring.slow_queries из файла.
+В журналах хранится нормализованный SQL без значений, поэтому такие
+запросы не выполняются - для них сравниваются только планы.
+
+Работа идёт на копии БД в памяти (sqlite3 backup): рабочая база не
+меняется. Для каждого запроса снимается EXPLAIN QUERY PLAN; таблица
+модели, которую план просматривает целиком (SCAN) или после которой
+сортирует результат во временном B-дереве (USE TEMP B-TREE FOR ORDER BY),
+получает кандидата в индексы:
+    поля равенства (=, IN) + поля ORDER BY (или первое поле диапазона)
+Булевы поля, проверяемые без сравнения (WHERE "is_published"), становятся
+условием частичного индекса (WHERE is_published), а не полем.
+
+Кандидат создаётся в копии, запросы, для которых он предложен, планируются
+и (для replay) выполняются заново. Оценка выгоды:
+  - строк - сколько строк больше не просматривается и не сортируется
+    (число строк таблицы за каждый исчезнувший SCAN и TEMP B-TREE),
+    умноженное на вес запроса;
+  - мс    - разница времени выполнения до и после, умноженная на вес
+    (только replay; лучшее из repeat выполнений).
+Кандидаты, не изменившие план в лучшую сторону, отбрасываются; из
+остальных строится миграция AddIndex для каждого приложения; индексы
+нужно также добавить в Meta.indexes моделей.
+
+Только SQLite.
+"""
+
+import json
+import math
+import re
+import sqlite3
+import time
+from collections import namedtuple
+
+from django.apps import apps
+from django.db import connection, migrations, models
+from django.db.backends.utils import names_digest
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from . import slow_queries
+
+# Запрос нагрузки: SQL с параметрами ? (params is None - параметры неизвестны), вес
+Statement = namedtuple('Statement', 'fingerprint sql params weight')
+
+# Кандидат в индексы: модель, поля Index.fields ('-поле' - по убыванию),
+# булево поле условия частичного индекса или None
+Candidate = namedtuple('Candidate', 'model fields condition')
+
+SOURCES = ('replay', 'slow_queries', 'log')
+
+_PLACEHOLDER = re.compile(r'(?<!%)%s')
+_TABLE = re.compile(r'"(\w+)"(?: (T\d+))?')
+# Сравнения с параметром (не условия соединения "a"."x" = "b"."y")
+_EQUALS = re.compile(r'"(\w+)"\."(\w+)" (?:= \?|IN \()')
+_RANGE = re.compile(r'"(\w+)"\."(\w+)" (?:[<>]=? \?|BETWEEN \?)')
+_BARE = re.compile(r'(?:\(|\bAND |\bWHERE )"(\w+)"\."(\w+)"(?=\)| AND\b| ORDER BY\b| GROUP BY\b| LIMIT\b|$)')
+_ORDER = re.compile(r'"(\w+)"\."(\w+)" (ASC|DESC)')
+_SCAN = re.compile(r'^SCAN (\w+)(?: USING (?!INTEGER PRIMARY KEY)|$)')
+_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+_TEMP_SORT = 'USE TEMP B-TREE FOR'
+
+
+class AdvisorError(Exception):
+    """Подбор невозможен: не та СУБД или пустая нагрузка"""
+
+
+# Нагрузка
+def _qmark(sql):
+    return _PLACEHOLDER.sub('?', sql).replace('%%', '%')
+
+
+def _add(workload, sql, params, weight=1):
+    key = slow_queries.fingerprint(slow_queries.normalize(sql))
+    statement = workload.get(key)
+    if statement is None:
+        workload[key] = Statement(key, sql, params, weight)
+    else:
+        workload[key] = statement._replace(weight=statement.weight + weight)
+
+
+def _is_select(sql):
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+def replay_workload(scenarios=None, anonymous=False):
+    """Запросы сценариев замеров, выполненных один раз"""
+    from catalog import benchmarks, dataset
+    from users.models import User
+
+    workload = {}
+
+    def capture(execute, sql, params, many, context):
+        if not many and _is_select(sql):
+            _add(workload, _qmark(sql), tuple(params or ()))
+        return execute(sql, params, many, context)
+
+    user = User.objects.filter(username=dataset.BENCHMARK_USER).first()
+    try:
+        scenario_list = benchmarks.build_scenarios(scenarios or benchmarks.SCENARIOS, anonymous=anonymous)
+    except benchmarks.BenchmarkError as e:
+        raise AdvisorError(str(e))
+    with connection.execute_wrapper(capture):
+        for scenario in scenario_list:
+            client = benchmarks.make_client(user if scenario.authenticated else None)
+            for path in scenario.paths:
+                getattr(client, scenario.method)(path, scenario.data)
+    return list(workload.values())
+
+
+def _from_normalized(sql):
+    # Свёрнутые списки (...) - один параметр
+    return sql.replace('(...)', '(?)')
+
+
+def slow_query_workload():
+    from .models import SlowQuery
+
+    workload = {}
+    for fingerprint, sql, count in SlowQuery.objects.values_list('fingerprint', 'sql', 'count'):
+        if _is_select(sql):
+            _add(workload, _from_normalized(sql), None, count)
+    return list(workload.values())
+
+
+def log_workload(path):
+    """Строки JSON журнала monitoring.slow_queries; прочие строки пропускаются"""
+    workload = {}
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            start = line.find('{')
+            if start < 0:
+                continue
+            try:
+                entry = json.loads(line[start:])
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and 'fingerprint' in entry and _is_select(entry.get('sql', '')):
+                _add(workload, _from_normalized(entry['sql']), None)
+    return list(workload.values())
+
+
+# Копия БД
+def snapshot():
+    """Копия рабочей SQLite-базы в памяти"""
+    if connection.vendor != 'sqlite':
+        raise AdvisorError(f'Поддерживается только SQLite, текущая СУБД: {connection.vendor}')
+    connection.ensure_connection()
+    database = sqlite3.connect(':memory:')
+    connection.connection.backup(database)
+    return database
+
+
+def _bindings(statement):
+    if statement.params is not None:
+        return statement.params
+    return (None,) * statement.sql.count('?')
+
+
+def explain(database, statement):
+    rows = database.execute(f'EXPLAIN QUERY PLAN {statement.sql}', _bindings(statement)).fetchall()
+    return [row[-1] for row in rows]
+
+
+def execution_time(database, statement, repeat=3):
+    """Лучшее время выполнения в мс или None, если параметры неизвестны"""
+    if statement.params is None:
+        return None
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        database.execute(statement.sql, statement.params).fetchall()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+# Разбор запроса
+def _models_by_table():
+    return {model._meta.db_table: model for model in apps.get_models(include_auto_created=True)}
+
+
+def _order_by(sql):
+    """ORDER BY внешнего запроса"""
+    upper = sql.upper()
+    order_at = upper.rfind(' ORDER BY ')
+    if order_at < 0:
+        return ''
+    rest = sql[order_at:]
+    if rest.count(')') > rest.count('('):
+        # ORDER BY подзапроса, у внешнего запроса сортировки нет
+        return ''
+    limit_at = upper.find(' LIMIT ', order_at)
+    return sql[order_at + 10:limit_at if limit_at >= 0 else len(sql)]
+
+
+def _field(model, column):
+    for field in model._meta.concrete_fields:
+        if field.column == column:
+            return field
+    return None
+
+
+def _aliases(sql, models_by_table):
+    """{имя или псевдоним T1 в плане: таблица}"""
+    aliases = {}
+    for table, alias in _TABLE.findall(sql):
+        if table in models_by_table:
+            aliases[alias or table] = table
+    return aliases
+
+
+def _scanned(plan, aliases):
+    """Таблицы полных просмотров плана (по одной на каждый SCAN)"""
+    return [aliases.get(name, name) for line in plan for name in _SCAN.findall(line)]
+
+
+def analyze(statement, plan, models_by_table):
+    """Кандидаты в индексы для таблиц, которые план просматривает или сортирует"""
+    aliases = _aliases(statement.sql, models_by_table)
+    scanned = set(_scanned(plan, aliases))
+    sorts = any(line.startswith(_TEMP_SORT) for line in plan)
+    sql, order = statement.sql, _order_by(statement.sql)
+
+    def columns(pattern, text):
+        return [(aliases.get(owner, owner), column) for owner, column, *_ in pattern.findall(text)]
+
+    order_columns = [(aliases.get(owner, owner), column, direction)
+                     for owner, column, direction in _ORDER.findall(order)]
+    order_tables = {table for table, _, _ in order_columns}
+
+    candidates = []
+    for table in sorted(scanned | (order_tables if sorts and len(order_tables) == 1 else set())):
+        model = models_by_table.get(table)
+        if model is None:
+            continue
+        sorted_here = order_tables == {table}
+        # Сравнения со столбцами сортировки - условие курсора (keyset), а не равенство
+        order_names = {column for _, column, _ in order_columns} if sorted_here else set()
+        fields, condition = [], None
+        for owner, column in columns(_BARE, sql):
+            field = _field(model, column) if owner == table else None
+            if isinstance(field, models.BooleanField) and condition is None:
+                condition = field.name
+        for owner, column in columns(_EQUALS, sql):
+            field = _field(model, column) if owner == table and column not in order_names else None
+            if field is not None and field.name not in fields:
+                fields.append(field.name)
+        if sorted_here:
+            for _, column, direction in order_columns:
+                field = _field(model, column)
+                if field is not None and field.name not in fields:
+                    fields.append(f'-{field.name}' if direction == 'DESC' else field.name)
+        else:
+            for owner, column in columns(_RANGE, sql):
+                field = _field(model, column) if owner == table else None
+                if field is not None and field.name not in fields:
+                    fields.append(field.name)
+                    break
+        if fields:
+            candidates.append(Candidate(model, tuple(fields), condition))
+    return candidates
+
+
+# Индексы
+def make_index(candidate):
+    """models.Index кандидата с именем по правилам Django (не длиннее 30 символов)"""
+    model = candidate.model
+    table = model._meta.db_table
+    columns = [model._meta.get_field(name.lstrip('-')).column + (' DESC' if name.startswith('-') else '')
+               for name in candidate.fields]
+    digest_parts = [*columns, f'WHERE {candidate.condition}'] if candidate.condition else columns
+    name = f'{table[:11]}_{columns[0].split()[0][:7]}_{names_digest(table, *digest_parts, length=6)}_idx'
+    condition = models.Q(**{candidate.condition: True}) if candidate.condition else None
+    return models.Index(fields=list(candidate.fields), condition=condition, name=name)
+
+
+def create_index_sql(candidate, name):
+    model = candidate.model
+    columns = ', '.join(
+        f'"{model._meta.get_field(field.lstrip("-")).column}"{" DESC" if field.startswith("-") else ""}'
+        for field in candidate.fields)
+    sql = f'CREATE INDEX "{name}" ON "{model._meta.db_table}" ({columns})'
+    if candidate.condition:
+        sql += f' WHERE "{model._meta.get_field(candidate.condition).column}"'
+    return sql
+
+
+def existing_indexes(database, table):
+    """Индексы таблицы: {имя: (столбцы, частичный ли)}"""
+    indexes = {}
+    for _, name, _, _, partial in database.execute(f'PRAGMA index_list("{table}")').fetchall():
+        columns = tuple(row[2] for row in database.execute(f'PRAGMA index_xinfo("{name}")').fetchall()
+                        if row[5])
+        indexes[name] = (columns, bool(partial))
+    return indexes
+
+
+def _is_covered(database, candidate):
+    """Есть ли уже полный индекс, начинающийся с тех же столбцов"""
+    model = candidate.model
+    columns = tuple(model._meta.get_field(name.lstrip('-')).column for name in candidate.fields)
+    return any(existing[:len(columns)] == columns and not partial
+               for existing, partial in existing_indexes(database, model._meta.db_table).values())
+
+
+def _table_rows(database, table, cache):
+    if table not in cache:
+        cache[table] = database.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    return cache[table]
+
+
+def _rows_avoided(statement, plan_before, plan_after, table, rows, aliases):
+    """
+    Верхняя оценка: за каждый SCAN и TEMP B-TREE - все строки таблицы.
+    Просмотр по индексу в порядке сортировки при LIMIT останавливается
+    рано и не считается.
+    """
+    limited = ' LIMIT ' in statement.sql.upper()
+
+    def cost(plan):
+        pattern = _FULL_SCAN if limited else _SCAN
+        scans = [aliases.get(name, name) for line in plan for name in pattern.findall(line)].count(table)
+        sorts = sum(1 for line in plan if line.startswith(_TEMP_SORT))
+        return (scans + sorts) * rows
+    return max(cost(plan_before) - cost(plan_after), 0)
+
+
+def advise(workload, repeat=3, progress=None):
+    """
+    Оценивает кандидатов на копии БД. Возвращает список словарей, от
+    наибольшей выгоды: index, candidate, statements, rows_avoided,
+    saved_ms (None без времени выполнения), plans [(SQL, было, стало)].
+    """
+    if not workload:
+        raise AdvisorError('Нагрузка пуста: нет SELECT-запросов')
+    database = snapshot()
+    models_by_table = _models_by_table()
+    try:
+        baseline = {}
+        proposals = {}
+        for statement in workload:
+            try:
+                plan = explain(database, statement)
+            except sqlite3.Error:
+                # Запрос из журнала, который нельзя спланировать без значений
+                continue
+            baseline[statement.fingerprint] = (plan, execution_time(database, statement, repeat))
+            for candidate in analyze(statement, plan, models_by_table):
+                if not _is_covered(database, candidate):
+                    proposals.setdefault(candidate, []).append(statement)
+
+        results = []
+        row_counts = {}
+        for candidate, statements in proposals.items():
+            index = make_index(candidate)
+            table = candidate.model._meta.db_table
+            database.execute(create_index_sql(candidate, index.name))
+            try:
+                rows_avoided, saved_ms, plans = 0, None, []
+                for statement in statements:
+                    plan_before, time_before = baseline[statement.fingerprint]
+                    plan_after = explain(database, statement)
+                    rows_avoided += statement.weight * _rows_avoided(
+                        statement, plan_before, plan_after, table, _table_rows(database, table, row_counts),
+                        _aliases(statement.sql, models_by_table))
+                    time_after = execution_time(database, statement, repeat)
+                    if time_before is not None and time_after is not None:
+                        saved_ms = (saved_ms or 0) + statement.weight * (time_before - time_after)
+                    plans.append((statement.sql, plan_before, plan_after))
+            finally:
+                database.execute(f'DROP INDEX "{index.name}"')
+            result = {'index': index, 'candidate': candidate, 'statements': len(statements),
+                      'rows_avoided': rows_avoided, 'saved_ms': saved_ms, 'plans': plans}
+            if progress is not None:
+                progress(result)
+            # Время без изменения плана - шум замера
+            if rows_avoided > 0:
+                results.append(result)
+    finally:
+        database.close()
+    results.sort(key=lambda result: (result['saved_ms'] or 0, result['rows_avoided']), reverse=True)
+    return results
+
+
+# Миграция
+def write_migrations(results, name='advised_indexes'):
+    """{app_label: (путь файла, текст миграции)} с AddIndex для каждого приложения"""
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    by_app = {}
+    for result in results:
+        model = result['candidate'].model
+        by_app.setdefault(model._meta.app_label, []).append(
+            migrations.AddIndex(model_name=model._meta.model_name, index=result['index']))
+
+    files = {}
+    for app_label, operations in by_app.items():
+        leaves = loader.graph.leaf_nodes(app_label)
+        number = max((int(leaf[1][:4]) for leaf in leaves if leaf[1][:4].isdigit()), default=0) + 1
+        migration = type('Migration', (migrations.Migration,), {
+            'dependencies': leaves,
+            'operations': operations,
+        })(f'{number:04d}_{name}', app_label)
+        writer = MigrationWriter(migration)
+        files[app_label] = (writer.path, writer.as_string())
+    return files
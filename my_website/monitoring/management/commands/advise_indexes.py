@@ -0,0 +1,86 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.migrations.writer import MigrationWriter
+
+from monitoring import index_advisor
+
+
+class Command(BaseCommand):
+    help = ('Подбирает составные и частичные индексы по нагрузке и выводит миграцию '
+            '(monitoring/index_advisor.py, только SQLite)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=index_advisor.SOURCES, default='replay',
+                            help='Нагрузка: сценарии замеров (replay), журнал SlowQuery (slow_queries) '
+                                 'или файл журнала monitoring.slow_queries (log)')
+        parser.add_argument('--log-file', help='Файл журнала для --source log')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='replay: запрашивать списки анонимно (через кэш страниц)')
+        parser.add_argument('--repeat', type=int, default=3, help='Выполнений запроса при замере времени')
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Не предлагать индексы, экономящие меньше строк (маленькие таблицы)')
+        parser.add_argument('--plans', action='store_true', help='Вывести планы запросов до и после')
+        parser.add_argument('--write', action='store_true',
+                            help='Записать миграции в каталоги migrations приложений')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['source'] == 'log' and not options['log_file']:
+            raise CommandError('Для --source log укажите --log-file')
+        try:
+            workload = self.load(options)
+            self.stderr.write(f'Запросов в нагрузке: {len(workload)}, '
+                              f'выполнений: {sum(statement.weight for statement in workload)}')
+            results = index_advisor.advise(workload, repeat=options['repeat'])
+        except index_advisor.AdvisorError as e:
+            raise CommandError(str(e))
+        except OSError as e:
+            raise CommandError(f'Не удалось прочитать {options["log_file"]}: {e}')
+
+        results = [result for result in results if result['rows_avoided'] >= options['min_rows']]
+        if not results:
+            self.stderr.write(self.style.SUCCESS(f'Новые индексы не нужны ({time.monotonic() - started:.1f} с)'))
+            return
+
+        self.stderr.write(f'{"Индекс":<60} {"Запросов":>8} {"Строк":>10} {"мс":>9}')
+        for result in results:
+            self.print_result(result, options['plans'])
+
+        # Без индексов в Meta.indexes makemigrations предложит их удалить
+        self.stderr.write('Добавьте индексы в Meta.indexes моделей:')
+        for result in results:
+            self.stderr.write(f'    {result["candidate"].model._meta.label}: '
+                              f'{MigrationWriter.serialize(result["index"])[0]},')
+
+        for app_label, (path, text) in index_advisor.write_migrations(results).items():
+            if options['write']:
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.write(text)
+                self.stderr.write(f'Миграция {app_label} записана в {os.path.relpath(path)}')
+            else:
+                self.stdout.write(f'# {os.path.relpath(path)}\n{text}')
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(f'Предложено индексов: {len(results)} за {elapsed:.1f} с'))
+
+    def load(self, options):
+        if options['source'] == 'replay':
+            return index_advisor.replay_workload(anonymous=options['anonymous'])
+        if options['source'] == 'slow_queries':
+            return index_advisor.slow_query_workload()
+        return index_advisor.log_workload(options['log_file'])
+
+    def print_result(self, result, plans):
+        candidate = result['candidate']
+        description = f'{candidate.model._meta.label}({", ".join(candidate.fields)})'
+        if candidate.condition:
+            description += f' WHERE {candidate.condition}'
+        saved = f'{result["saved_ms"]:>9.2f}' if result['saved_ms'] is not None else f'{"-":>9}'
+        self.stderr.write(f'{description:<60} {result["statements"]:>8} {result["rows_avoided"]:>10} {saved}')
+        if plans:
+            for sql, before, after in result['plans']:
+                self.stderr.write(f'    {sql[:200]}')
+                self.stderr.write(f'      было:  {" | ".join(before)}')
+                self.stderr.write(f'      стало: {" | ".join(after)}')
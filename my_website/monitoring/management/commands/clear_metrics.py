@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from monitoring import prometheus
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы метрик рабочих процессов (выполняется перед запуском сервера)'
+
+    def handle(self, *args, **options):
+        removed = prometheus.clear()
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов метрик: {removed}'))
@@ -0,0 +1,48 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring import profiling
+
+
+class Command(BaseCommand):
+    help = ('Объединяет профили маршрута (monitoring/profiling.py) в свёрнутые стеки для flamegraph.pl '
+            'или speedscope')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', help='Имя маршрута, например catalog:product (по умолчанию все)')
+        parser.add_argument('--mode', choices=profiling.MODES, default=profiling.get_setting('MODE'),
+                            help='Какие файлы объединять: cprofile (.prof) или sampler (.folded)')
+        parser.add_argument('--output', help='Файл свёрнутых стеков (по умолчанию stdout)')
+        parser.add_argument('--pstats-output', help='Объединённый файл pstats (только для cprofile)')
+        parser.add_argument('--top', type=int, default=0,
+                            help='Вывести N функций с наибольшим накопленным временем (только для cprofile)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        files = profiling.profile_files(options['view'], profiling.MODES[options['mode']])
+        paths = [path for view_paths in files.values() for path in view_paths]
+        if not paths:
+            raise CommandError(f'Нет профилей режима {options["mode"]} в {profiling.get_setting("DIRECTORY")}')
+
+        counts, stats = profiling.merge(paths)
+        lines = ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(lines)
+        else:
+            self.stdout.write(lines, ending='')
+
+        if stats is not None:
+            if options['pstats_output']:
+                stats.dump_stats(options['pstats_output'])
+            if options['top']:
+                buffer = io.StringIO()
+                stats.stream = buffer
+                stats.sort_stats('cumulative').print_stats(options['top'])
+                self.stderr.write(buffer.getvalue())
+
+        elapsed = time.monotonic() - started
+        views = ', '.join(f'{view} ({len(view_paths)})' for view, view_paths in sorted(files.items()))
+        self.stderr.write(self.style.SUCCESS(f'Объединено файлов: {len(paths)} - {views} за {elapsed:.1f} с'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from monitoring import profiling
+
+
+class Command(BaseCommand):
+    help = 'Выводит подписанный заголовок, включающий профилирование запроса'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{profiling.get_setting("HEADER")}: {profiling.make_header_value()}')
+        minutes = profiling.get_setting('HEADER_MAX_AGE') // 60
+        self.stderr.write(self.style.SUCCESS(f'Заголовок действителен {minutes} мин'))
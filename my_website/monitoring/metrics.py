@@ -0,0 +1,133 @@
+"""
+Показатели обработки запроса: количество SQL-запросов, время в БД, время
+рендеринга шаблонов и общее время (monitoring/middleware.py).
+
+Показатели текущего запроса хранятся в contextvars: переменная видна и в
+потоках sync_to_async, где асинхронные представления обращаются к БД, и не
+смешивается между параллельными запросами. SQL-запросы считает обёртка
+выполнения (connection.execute_wrapper), которая ставится на каждое
+соединение при его открытии (сигнал connection_created, monitoring/apps.py).
+Шаблоны замеряет бэкенд monitoring.templates.DjangoTemplates.
+
+Бюджет запросов представления задаётся атрибутом класса query_budget или
+декоратором query_budget() для функций. В бюджет входят запросы самого
+представления и шаблона; не входят запросы внутри outside_budget():
+загрузка сессии и пользователя (AuthenticationMiddleware в
+monitoring/middleware.py) и заполнение кэша при промахе
+(catalog.cache.get_or_set) - они не зависят от кода представления или
+выполняются один раз на много запросов. При превышении пишется
+предупреждение в журнал и выдаётся QueryBudgetExceeded через warnings:
+в тестах его можно превратить в ошибку
+    warnings.simplefilter('error', QueryBudgetExceeded)
+или для всего прогона: python -W error::monitoring.metrics.QueryBudgetExceeded manage.py test
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('request_metrics', default=None)
+_outside_budget = ContextVar('outside_query_budget', default=False)
+
+
+class QueryBudgetExceeded(UserWarning):
+    """Представление выполнило больше SQL-запросов, чем позволяет его бюджет"""
+
+
+class RequestMetrics:
+    """Показатели одного запроса (время в секундах)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.budget_queries = 0     # запросы, входящие в бюджет представления
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.view_name = None
+        self.query_budget = None
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def is_over_budget(self):
+        return self.query_budget is not None and self.budget_queries > self.query_budget
+
+
+def current():
+    """Показатели текущего запроса или None вне запроса"""
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """Собирает показатели запроса, выполняемого внутри блока"""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def outside_budget():
+    """Запросы внутри блока считаются в показателях, но не входят в бюджет представления"""
+    token = _outside_budget.set(True)
+    try:
+        yield
+    finally:
+        _outside_budget.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка выполнения SQL: время и количество запросов текущего запроса"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        if not _outside_budget.get():
+            metrics.budget_queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    # Обёртки соединения сохраняются при переподключении, ставим один раз
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def template_timing():
+    """Время рендеринга шаблона; вложенные шаблоны не считаются повторно"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    metrics.template_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.template_depth -= 1
+        if not metrics.template_depth:
+            metrics.template_time += time.perf_counter() - started
+
+
+def query_budget(limit):
+    """Декоратор функции-представления: не больше limit SQL-запросов на запрос"""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def get_query_budget(view_func):
+    """Бюджет представления: атрибут query_budget класса или функции"""
+    view_class = getattr(view_func, 'view_class', None)
+    return getattr(view_class, 'query_budget', getattr(view_func, 'query_budget', None))
@@ -0,0 +1,202 @@
+"""
+Промежуточные слои мониторинга.
+
+RequestMetricsMiddleware - замеры каждого запроса (monitoring/metrics.py).
+
+Для каждого запроса считает SQL-запросы, время в БД, время рендеринга
+шаблонов и общее время и:
+  - добавляет заголовок Server-Timing (видно во вкладке Network браузера):
+        Server-Timing: db;dur=4.21;desc="8 queries", tpl;dur=11.70, total;dur=23.05
+  - при REQUEST_METRICS['LOG'] пишет строку JSON в журнал monitoring.requests
+    (уровень INFO):
+        {"view": "product", "method": "GET", "status": 200, "queries": 8, ...}
+  - сверяет количество запросов с бюджетом представления (query_budget)
+    и при превышении пишет WARNING и выдаёт metrics.QueryBudgetExceeded;
+  - пополняет метрики Prometheus (monitoring/prometheus.py): запросы, время,
+    размер ответа и SQL-запросы по имени маршрута.
+
+Представление определяется по имени маршрута (request.resolver_match).
+Слой стоит первым в MIDDLEWARE, поэтому общее время и число запросов
+включают остальные слои. Загрузка сессии и пользователя в бюджет
+представления не входит (AuthenticationMiddleware).
+
+AuthenticationMiddleware - стандартный слой аутентификации, загрузка
+пользователя которого выполняется вне бюджета запросов (metrics.outside_budget).
+
+ProfilingMiddleware - профилирование выборки запросов (monitoring/profiling.py).
+"""
+
+import json
+import logging
+import warnings
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.functional import SimpleLazyObject
+
+from . import metrics, profiling, prometheus
+
+logger = logging.getLogger('monitoring.requests')
+
+DEFAULTS = {
+    'SERVER_TIMING': True,
+    'LOG': False,
+}
+
+UNRESOLVED = '<unresolved>'
+
+# Остальные методы попадают в метрики как OTHER (ограничение числа рядов)
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def get_setting(name):
+    return getattr(settings, 'REQUEST_METRICS', {}).get(name, DEFAULTS[name])
+
+
+def server_timing(request_metrics, total_time):
+    return (f'db;dur={request_metrics.db_time * 1000:.2f};desc="{request_metrics.queries} queries", '
+            f'tpl;dur={request_metrics.template_time * 1000:.2f}, '
+            f'total;dur={total_time * 1000:.2f}')
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with metrics.collect() as request_metrics:
+            response = self.get_response(request)
+            self.finish(request, response, request_metrics)
+        return response
+
+    async def __acall__(self, request):
+        with metrics.collect() as request_metrics:
+            response = await self.get_response(request)
+            self.finish(request, response, request_metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request_metrics = metrics.current()
+        if request_metrics is not None:
+            request_metrics.query_budget = metrics.get_query_budget(view_func)
+            # Маршрут известен до выполнения представления (журнал медленных запросов)
+            request_metrics.view_name = request.resolver_match.view_name
+
+    def finish(self, request, response, request_metrics):
+        total_time = request_metrics.total_time
+        match = getattr(request, 'resolver_match', None)
+        request_metrics.view_name = match.view_name if match is not None else UNRESOLVED
+
+        if get_setting('SERVER_TIMING'):
+            response['Server-Timing'] = server_timing(request_metrics, total_time)
+        if get_setting('LOG'):
+            logger.info(json.dumps({
+                'view': request_metrics.view_name,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': request_metrics.queries,
+                'db_ms': round(request_metrics.db_time * 1000, 2),
+                'template_ms': round(request_metrics.template_time * 1000, 2),
+                'total_ms': round(total_time * 1000, 2),
+            }, ensure_ascii=False))
+
+        self.record(request, response, request_metrics, total_time)
+
+        if request_metrics.is_over_budget():
+            message = (f'{request_metrics.view_name}: {request_metrics.budget_queries} SQL-запросов '
+                       f'при бюджете {request_metrics.query_budget}, всего {request_metrics.queries} '
+                       f'({request.method} {request.path})')
+            logger.warning(message)
+            warnings.warn(message, metrics.QueryBudgetExceeded)
+
+    def record(self, request, response, request_metrics, total_time):
+        view = request_metrics.view_name
+        method = request.method if request.method in METHODS else 'OTHER'
+        prometheus.REQUESTS.inc(view=view, method=method, status=response.status_code)
+        prometheus.REQUEST_DURATION.observe(total_time, view=view)
+        prometheus.DB_QUERIES.inc(request_metrics.queries, view=view)
+        prometheus.DB_DURATION.inc(request_metrics.db_time, view=view)
+        if response.streaming:
+            size = response.get('Content-Length')
+            size = int(size) if size and size.isdigit() else None
+        else:
+            size = len(response.content)
+        if size is not None:
+            prometheus.RESPONSE_SIZE.observe(size, view=view)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует выборку запросов; при выключенном профилировании и под ASGI
+    не подключается (MiddlewareNotUsed) и не добавляет накладных расходов.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        # Под ASGI запросы не профилируются (см. monitoring/profiling.py)
+        if not profiling.get_setting('ENABLED') or iscoroutinefunction(get_response):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.should_profile(request):
+            return self.get_response(request)
+
+        profiler = profiling.make_profiler()
+        try:
+            profiler.start()
+        except ValueError:
+            # Уже работает другой профилировщик (например, панель отладки)
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+
+        match = getattr(request, 'resolver_match', None)
+        future = profiling.save_later(profiler, match.view_name if match is not None else None)
+        future.add_done_callback(partial(_log_profile, request.method, request.path))
+        return response
+
+
+def _log_profile(method, path, future):
+    try:
+        logger.info('Профиль %s %s сохранён в %s', method, path, future.result())
+    except Exception:
+        logger.exception('Не удалось сохранить профиль %s %s', method, path)
+
+
+def _get_user(request):
+    with metrics.outside_budget():
+        return auth_middleware.get_user(request)
+
+
+async def _auser(request):
+    with metrics.outside_budget():
+        return await auth_middleware.auser(request)
+
+
+class AuthenticationMiddleware(auth_middleware.AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware, загрузка сессии и пользователя которого не входит
+    в бюджет запросов представления: она одинакова для всех страниц.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: _get_user(request))
+        request.auser = partial(_auser, request)
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=16, unique=True, verbose_name='Отпечаток')),
+                ('sql', models.TextField(verbose_name='Нормализованный SQL')),
+                ('params', models.TextField(blank=True, verbose_name='Параметры последнего вызова')),
+                ('view', models.CharField(blank=True, max_length=255, verbose_name='Маршрут')),
+                ('template', models.CharField(blank=True, max_length=255, verbose_name='Шаблон')),
+                ('call_site', models.CharField(blank=True, max_length=255, verbose_name='Место вызова')),
+                ('plan', models.TextField(blank=True, verbose_name='План запроса')),
+                ('full_scans', models.CharField(blank=True, max_length=255, verbose_name='Полный просмотр таблиц')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Вызовов')),
+                ('total_ms', models.FloatField(default=0, verbose_name='Суммарное время, мс')),
+                ('max_ms', models.FloatField(default=0, verbose_name='Максимальное время, мс')),
+                ('first_seen', models.DateTimeField(auto_now_add=True, verbose_name='Впервые')),
+                ('last_seen', models.DateTimeField(verbose_name='Последний раз')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
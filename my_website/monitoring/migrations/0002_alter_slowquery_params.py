@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:58
+
+from django.db import migrations, models
+
+
+def clear_params(apps, schema_editor):
+    # Ранее сохранённые значения параметров удаляются
+    apps.get_model('monitoring', 'SlowQuery').objects.update(params='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='slowquery',
+            name='params',
+            field=models.TextField(blank=True, verbose_name='Типы параметров последнего вызова'),
+        ),
+        migrations.RunPython(clear_params, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import models
+
+
+class SlowQuery(models.Model):
+    """
+    Медленный SQL-запрос, накопленный по отпечатку нормализованного SQL.
+    Поддерживается в monitoring/slow_queries.py.
+    """
+
+    fingerprint = models.CharField(max_length=16, unique=True, verbose_name="Отпечаток")
+    sql = models.TextField(verbose_name="Нормализованный SQL")
+    params = models.TextField(blank=True, verbose_name="Типы параметров последнего вызова")
+    view = models.CharField(max_length=255, blank=True, verbose_name="Маршрут")
+    template = models.CharField(max_length=255, blank=True, verbose_name="Шаблон")
+    call_site = models.CharField(max_length=255, blank=True, verbose_name="Место вызова")
+    plan = models.TextField(blank=True, verbose_name="План запроса")
+    full_scans = models.CharField(max_length=255, blank=True, verbose_name="Полный просмотр таблиц")
+
+    # Накопленные показатели
+    count = models.PositiveIntegerField(default=0, verbose_name="Вызовов")
+    total_ms = models.FloatField(default=0, verbose_name="Суммарное время, мс")
+    max_ms = models.FloatField(default=0, verbose_name="Максимальное время, мс")
+    first_seen = models.DateTimeField(auto_now_add=True, verbose_name="Впервые")
+    last_seen = models.DateTimeField(verbose_name="Последний раз")
+
+    class Meta:
+        verbose_name = "Медленный запрос"
+        verbose_name_plural = "Медленные запросы"
+        ordering = ['-total_ms']
+
+    def __str__(self):
+        return self.fingerprint
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0
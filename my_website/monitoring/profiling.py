@@ -0,0 +1,278 @@
+"""
+Профилирование выборки запросов в продакшене (ProfilingMiddleware в
+monitoring/middleware.py, команды merge_profiles и profiling_header).
+
+Профилируется доля запросов SAMPLE_RATE и любой запрос с заголовком HEADER,
+подписанным SECRET_KEY (значение выдаёт команда profiling_header, срок
+действия - HEADER_MAX_AGE секунд). При ENABLED = False слой отключается при
+запуске (MiddlewareNotUsed) и не стоит на пути запроса вовсе.
+
+Режимы (MODE):
+  - cprofile - детерминированный cProfile, файл pstats (.prof);
+  - sampler  - статистический сэмплер: отдельный поток раз в INTERVAL секунд
+               снимает стек потока запроса (sys._current_frames), файл -
+               свёрнутые стеки (.folded, "a;b;c количество"), как у
+               flamegraph.pl и speedscope. Накладные расходы не зависят от
+               числа вызовов функций.
+
+Файлы пишутся в DIRECTORY/<имя маршрута>/<время>-<pid>-<номер>.<расширение>
+фоновым потоком (save_later()), чтобы запись профиля и обход каталога не
+задерживали ответ; для каждого маршрута хранятся последние MAX_FILES файлов.
+Команда merge_profiles объединяет файлы маршрута в один отчёт для flamegraph.
+
+Профилируются только запросы под WSGI. Под ASGI цепочка обработки запроса
+асинхронная даже для синхронных представлений: код выполняется в цикле
+событий вперемешку с другими запросами и в потоках sync_to_async, и профиль
+одного запроса из него не выделить, поэтому слой не подключается.
+"""
+
+import collections
+import concurrent.futures
+import cProfile
+import functools
+import itertools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MODE': 'cprofile',
+    'SAMPLE_RATE': 0.01,
+    'INTERVAL': 0.005,
+    'DIRECTORY': os.path.join(settings.BASE_DIR, 'var', 'profiles'),
+    'MAX_FILES': 100,
+    'HEADER': 'X-Profile',
+    'HEADER_MAX_AGE': 60 * 60,
+}
+
+MODES = {'cprofile': '.prof', 'sampler': '.folded'}
+SALT = 'monitoring.profiling'
+
+_numbers = itertools.count()
+_writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='profile-writer')
+
+
+def get_setting(name):
+    return getattr(settings, 'PROFILING', {}).get(name, DEFAULTS[name])
+
+
+# Выбор запросов
+def make_header_value():
+    """Значение заголовка, включающего профилирование запроса"""
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def has_valid_header(request):
+    value = request.headers.get(get_setting('HEADER'))
+    if not value:
+        return False
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(value, max_age=get_setting('HEADER_MAX_AGE'))
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def should_profile(request):
+    return random.random() < get_setting('SAMPLE_RATE') or has_valid_header(request)
+
+
+# Профилировщики
+class Profiler:
+    """cProfile на время обработки запроса"""
+
+    extension = MODES['cprofile']
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, path):
+        self.profile.dump_stats(path)
+
+
+@functools.lru_cache(maxsize=8192)
+def _frame_name(filename, name, line):
+    for prefix in (str(settings.BASE_DIR), *sys.path):
+        if prefix and filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1:]
+            break
+    return f'{name} ({filename}:{line})'.replace(';', ',')
+
+
+def folded_stack(frame):
+    """Стек кадра от корня: "внешняя;...;текущая" """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(_frame_name(code.co_filename, code.co_name, code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Снимает стек потока thread_id раз в interval секунд из отдельного потока"""
+
+    extension = MODES['sampler']
+
+    def __init__(self, interval=None, thread_id=None):
+        self.interval = interval or get_setting('INTERVAL')
+        self.thread_id = thread_id or threading.get_ident()
+        self.counts = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[folded_stack(frame)] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self.counts.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+def make_profiler():
+    return StackSampler() if get_setting('MODE') == 'sampler' else Profiler()
+
+
+# Файлы
+def view_directory(view_name):
+    name = (view_name or 'unresolved').replace(':', '.').replace(os.sep, '_').strip('<>')
+    return os.path.join(get_setting('DIRECTORY'), name)
+
+
+def save(profiler, view_name):
+    """Сохраняет профиль запроса и удаляет старые файлы маршрута; возвращает путь"""
+    directory = view_directory(view_name)
+    os.makedirs(directory, exist_ok=True)
+    filename = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{next(_numbers)}{profiler.extension}'
+    path = os.path.join(directory, filename)
+    profiler.save(path)
+    rotate(directory, get_setting('MAX_FILES'))
+    return path
+
+
+def save_later(profiler, view_name):
+    """Сохраняет остановленный профилировщик в фоновом потоке; возвращает Future с путём"""
+    return _writer.submit(save, profiler, view_name)
+
+
+def rotate(directory, max_files):
+    files = sorted((entry for entry in os.scandir(directory) if entry.is_file()),
+                   key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:max(len(files) - max_files, 0)]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def profile_files(view_name=None, extension=None):
+    """{маршрут: [пути файлов]} в DIRECTORY (только файлы с расширением extension, если указано)"""
+    root = get_setting('DIRECTORY')
+    if not os.path.isdir(root):
+        return {}
+    directories = [view_directory(view_name)] if view_name else [entry.path for entry in os.scandir(root)
+                                                                  if entry.is_dir()]
+    result = {}
+    for directory in directories:
+        if os.path.isdir(directory):
+            files = sorted(entry.path for entry in os.scandir(directory)
+                           if entry.name.endswith(extension or tuple(MODES.values())))
+            if files:
+                result[os.path.basename(directory)] = files
+    return result
+
+
+# Объединение
+def merge_folded(paths):
+    counts = collections.Counter()
+    for path in paths:
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    counts[stack] += int(count)
+    return counts
+
+
+def _pstats_name(func):
+    filename, line, name = func
+    if filename == '~':
+        # Встроенные функции: "<built-in method time.sleep>"
+        return name.replace(';', ',')
+    return _frame_name(filename, name, line)
+
+
+def folded_from_pstats(stats, min_ratio=1e-4, max_depth=200):
+    """
+    Свёрнутые стеки из pstats (значение - микросекунды собственного времени).
+    pstats хранит только пары вызывающий-вызываемый, поэтому время функции
+    делится между стеками пропорционально времени вызовов по каждому ребру.
+    """
+    entries = stats.stats
+    callees = collections.defaultdict(dict)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees[caller][func] = edge
+    roots = [func for func, entry in entries.items() if not entry[4]]
+    # Функция, вызванная первой после включения профилировщика, при рекурсии
+    # (цепочка промежуточных слоёв) имеет вызывающих, но объемлет всё время
+    entry = max(entries, key=lambda func: entries[func][3], default=None)
+    if entry is not None and entry not in roots:
+        roots.insert(0, entry)
+    counts = collections.Counter()
+
+    def walk(func, stack, ratio):
+        _, _, own_time, cumulative, _ = entries[func]
+        stack = (*stack, _pstats_name(func))
+        microseconds = int(own_time * ratio * 1_000_000)
+        if microseconds:
+            counts[';'.join(stack)] += microseconds
+        if len(stack) >= max_depth:
+            return
+        for callee, edge in callees[func].items():
+            callee_cumulative = entries[callee][3]
+            if callee == func or not callee_cumulative:
+                continue
+            child_ratio = ratio * edge[3] / callee_cumulative
+            if child_ratio >= min_ratio and _pstats_name(callee) not in stack:
+                walk(callee, stack, min(child_ratio, 1.0))
+
+    for root in roots:
+        walk(root, (), 1.0)
+    return counts
+
+
+def merge(paths):
+    """
+    Объединяет файлы профилей одного режима: возвращает (свёрнутые стеки,
+    pstats.Stats или None). Значения стеков - число сэмплов для .folded и
+    микросекунды собственного времени для .prof.
+    """
+    if all(path.endswith(MODES['sampler']) for path in paths):
+        return merge_folded(paths), None
+    stats = pstats.Stats(*paths)
+    return folded_from_pstats(stats), stats
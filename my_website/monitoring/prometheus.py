@@ -0,0 +1,319 @@
+"""
+Метрики в формате Prometheus, общие для всех рабочих процессов.
+
+Счётчики (Counter), гистограммы (Histogram) и измерители (Gauge)
+объявляются в этом модуле и пополняются промежуточным слоем
+(monitoring/middleware.py), кэшами и буфером реакций каталога. Эндпоинт /metrics (monitoring/views.py) отдаёт сумму значений
+всех процессов в текстовом формате Prometheus.
+
+Хранение (как multiprocess-режим prometheus_client, без зависимости):
+каждый поток каждого процесса пишет в свой файл DIRECTORY/<pid>-<поток>.db,
+отображённый в память (mmap). У файла ровно один писатель, поэтому
+увеличение значения - запись 8 байт в память без блокировок и системных
+вызовов. Файл:
+    заголовок: uint32 занятый размер, 4 байта выравнивания
+    записи:    uint32 длина ключа, ключ JSON [имя, имя сэмпла, метки]
+               с выравниванием до 8 байт, float64 значение
+Новая запись сначала пишется целиком, затем увеличивается занятый размер,
+поэтому читатель никогда не видит запись наполовину. /metrics читает файлы
+с диска и суммирует значения по ключам.
+
+Файлы закрываются при завершении процесса (atexit).
+
+Счётчики и гистограммы монотонны, поэтому файлы завершившихся процессов
+тоже входят в сумму. Значение измерителя в файлах не хранится (значение
+завершившегося процесса нельзя отличить от текущего): его вычисляет
+функция при выдаче /metrics по общему для процессов состоянию. Каталог нужно очищать при каждом запуске сервера (команда
+clear_metrics перед стартом gunicorn), иначе после перезапуска счётчики
+продолжат расти от старых значений.
+"""
+
+import atexit
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIRECTORY': os.path.join(settings.BASE_DIR, 'var', 'metrics'),
+    # Доступ к /metrics: заголовок Authorization: Bearer <TOKEN> или адрес из ALLOWED_IPS
+    # (REMOTE_ADDR: за обратным прокси это адрес прокси, поэтому по умолчанию только токен)
+    'TOKEN': '',
+    'ALLOWED_IPS': (),
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+INITIAL_SIZE = 64 * 1024
+_HEADER = struct.Struct('<I4x')
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+
+
+def get_setting(name):
+    return getattr(settings, 'METRICS', {}).get(name, DEFAULTS[name])
+
+
+# Хранение
+class ValueFile:
+    """Значения сэмплов одного потока в файле, отображённом в память"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.used = _HEADER.unpack_from(self.map, 0)[0] or _HEADER.size
+        self.offsets = {key: offset for key, offset, _ in _entries(self.map, self.used)}
+
+    def add(self, key, amount):
+        offset = self.offsets.get(key)
+        if offset is None:
+            offset = self._append(key)
+        _VALUE.pack_into(self.map, offset, _VALUE.unpack_from(self.map, offset)[0] + amount)
+
+    def _append(self, key):
+        encoded = key.encode()
+        padded = len(encoded) + (-(_LENGTH.size + len(encoded)) % 8)
+        size = _LENGTH.size + padded + _VALUE.size
+        if self.used + size > len(self.map):
+            capacity = len(self.map)
+            while self.used + size > capacity:
+                capacity *= 2
+            self.map.close()
+            self.file.truncate(capacity)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+
+        _LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[self.used + _LENGTH.size:self.used + _LENGTH.size + len(encoded)] = encoded
+        offset = self.used + _LENGTH.size + padded
+        _VALUE.pack_into(self.map, offset, 0.0)
+        self.used += size
+        _HEADER.pack_into(self.map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    def close(self):
+        if not self.map.closed:
+            self.map.close()
+        self.file.close()
+
+
+def _entries(data, used=None):
+    """(ключ, смещение значения, значение) записей файла"""
+    if used is None:
+        used = _HEADER.unpack_from(data, 0)[0]
+    position = _HEADER.size
+    while position < used:
+        length = _LENGTH.unpack_from(data, position)[0]
+        key = bytes(data[position + _LENGTH.size:position + _LENGTH.size + length]).decode()
+        offset = position + _LENGTH.size + length + (-(_LENGTH.size + length) % 8)
+        yield key, offset, _VALUE.unpack_from(data, offset)[0]
+        position = offset + _VALUE.size
+
+
+_local = threading.local()
+# Открытые файлы всех потоков процесса (закрываются при выходе)
+_open_files = set()
+_files_closed = False
+_open_files_lock = threading.Lock()
+
+
+def _value_file():
+    # После fork (gunicorn --preload) у процесса новый pid и свои файлы
+    pid = os.getpid()
+    values = getattr(_local, 'values', None)
+    if values is None or _local.pid != pid:
+        directory = get_setting('DIRECTORY')
+        os.makedirs(directory, exist_ok=True)
+        with _open_files_lock:
+            if values is not None:
+                # Копия файла родительского процесса
+                _open_files.discard(values)
+                values.close()
+            values = _local.values = ValueFile(os.path.join(directory, f'{pid}-{threading.get_ident()}.db'))
+            _open_files.add(values)
+        _local.pid = pid
+    return values
+
+
+@atexit.register
+def close_files():
+    # Фоновые потоки, работающие до конца процесса, после этого метрики не пишут
+    global _files_closed
+    with _open_files_lock:
+        _files_closed = True
+        for values in _open_files:
+            values.close()
+        _open_files.clear()
+
+
+def clear():
+    """Удаляет файлы значений (перед запуском сервера)"""
+    directory = get_setting('DIRECTORY')
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.db'):
+            os.remove(entry.path)
+            removed += 1
+    return removed
+
+
+# Метрики
+REGISTRY = {}
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+        REGISTRY[name] = self
+
+    def _key(self, sample, labels):
+        # Ключи кэшируются: json.dumps не выполняется на каждом запросе
+        cache_key = (sample, *(labels.get(name) for name in self.labelnames))
+        key = self._keys.get(cache_key)
+        if key is None:
+            if set(labels) != set(self.labelnames):
+                raise ValueError(f'{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}')
+            key = self._keys[cache_key] = json.dumps(
+                [self.name, sample, [[name, str(labels[name])] for name in self.labelnames]])
+        return key
+
+    def _add(self, sample, amount, labels):
+        if get_setting('ENABLED') and not _files_closed:
+            _value_file().add(self._key(sample, labels), amount)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._add(f'{self.name}_total', amount, labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = (*buckets, math.inf)
+
+    def observe(self, value, **labels):
+        # Значение попадает в одну корзину; накопленные суммы считаются при выдаче
+        for bound in self.buckets:
+            if value <= bound:
+                break
+        self._add(f'{self.name}_bucket:{bound}', 1, labels)
+        self._add(f'{self.name}_count', 1, labels)
+        self._add(f'{self.name}_sum', value, labels)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation):
+        super().__init__(name, documentation)
+        self.function = None
+
+    def set_function(self, function):
+        """Функция без аргументов, возвращающая текущее значение"""
+        self.function = function
+
+    def value(self):
+        return None if self.function is None else float(self.function())
+
+
+REQUESTS = Counter('http_requests', 'Обработанные HTTP-запросы', ('view', 'method', 'status'))
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Время обработки запроса', ('view',))
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Размер тела ответа', ('view',), buckets=SIZE_BUCKETS)
+DB_QUERIES = Counter('db_queries', 'SQL-запросы при обработке запросов', ('view',))
+DB_DURATION = Counter('db_query_duration_seconds', 'Время выполнения SQL-запросов', ('view',))
+CACHE_REQUESTS = Counter('cache_requests', 'Обращения к кэшу приложения', ('cache', 'result'))
+REACTION_BUFFER_DEPTH = Gauge('reaction_buffer_depth', 'События реакций в журналах, ещё не записанные в БД')
+REACTION_FLUSH_DURATION = Histogram('reaction_buffer_flush_duration_seconds', 'Время сброса буфера реакций в БД')
+
+
+# Выдача
+def collect():
+    """Суммы значений всех файлов: {(имя сэмпла, метки): значение}"""
+    directory = get_setting('DIRECTORY')
+    totals = {}
+    if not os.path.isdir(directory):
+        return totals
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.db'):
+            continue
+        try:
+            with open(entry.path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            continue
+        if len(data) < _HEADER.size:
+            continue
+        for key, _, value in _entries(data):
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def render():
+    """Текст в формате Prometheus (text/plain; version=0.0.4)"""
+    samples = {}
+    for key, value in collect().items():
+        name, sample, labels = json.loads(key)
+        samples.setdefault(name, {}).setdefault(tuple(map(tuple, labels)), {})[sample] = value
+
+    lines = []
+    for name, metric in REGISTRY.items():
+        # Имя семейства счётчика в текстовом формате - с суффиксом _total
+        family = f'{name}_total' if isinstance(metric, Counter) else name
+        lines.append(f'# HELP {family} {_escape(metric.documentation)}')
+        lines.append(f'# TYPE {family} {metric.type}')
+        if isinstance(metric, Gauge):
+            value = metric.value()
+            if value is not None:
+                lines.append(f'{name} {_format_value(value)}')
+            continue
+        for labels, values in sorted(samples.get(name, {}).items()):
+            if isinstance(metric, Histogram):
+                cumulative = 0.0
+                for bound in metric.buckets:
+                    cumulative += values.get(f'{name}_bucket:{bound}', 0.0)
+                    bucket_labels = (*labels, ('le', _format_value(bound)))
+                    lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {_format_value(cumulative)}')
+                for suffix in ('_count', '_sum'):
+                    lines.append(f'{name}{suffix}{_format_labels(labels)} '
+                                 f'{_format_value(values.get(name + suffix, 0.0))}')
+            else:
+                for sample, value in sorted(values.items()):
+                    lines.append(f'{sample}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,265 @@
+"""
+Журнал медленных SQL-запросов.
+
+Обёртка выполнения (connection.execute_wrapper, ставится на каждое
+соединение при открытии, monitoring/apps.py) замеряет каждый запрос. Запрос
+дольше THRESHOLD секунд:
+  - пишется в журнал monitoring.slow_queries (уровень WARNING) строкой JSON
+    с нормализованным SQL, отпечатком, описанием параметров и местом вызова
+    (маршрут, шаблон, строка кода проекта);
+  - накапливается в модели SlowQuery по отпечатку: число вызовов, суммарное
+    и максимальное время. Запись откладывается до конца обработки запроса
+    (сигнал request_finished). В таблице остаются TOP_N отпечатков с
+    наибольшим суммарным временем, отчёт - в админке (Мониторинг -
+    Медленные запросы).
+
+Отпечаток - хэш SQL без значений: параметры и литералы заменены на ?,
+списки IN (...) и VALUES свёрнуты, поэтому LIMIT 24 и LIMIT 48 или
+IN (1, 2) и IN (1, 2, 3) дают один отпечаток.
+
+Значения параметров (email, телефоны, поисковые запросы) не пишутся ни в
+журнал, ни в SlowQuery: только их количество, типы и HMAC значений на
+SECRET_KEY, по которому видно, повторяется ли один и тот же набор.
+
+План запроса (EXPLAIN QUERY PLAN в SQLite, EXPLAIN в других СУБД)
+снимается один раз на отпечаток, сразу после запроса на том же соединении,
+только для SELECT. Полные
+просмотры (SCAN, Seq Scan) таблиц WATCHED_TABLES отмечаются в записи и в
+журнале.
+
+Запросы самого журнала (EXPLAIN, запись SlowQuery) не замеряются и не
+входят в показатели запроса (monitoring/metrics.py).
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.template.base import Template
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from . import metrics
+
+logger = logging.getLogger('monitoring.slow_queries')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'THRESHOLD': 0.1,
+    'EXPLAIN': True,
+    'WATCHED_TABLES': ('catalog_product', 'catalog_review', 'catalog_productreaction'),
+    'TOP_N': 100,
+}
+
+MAX_PARAMS_LENGTH = 1000
+# Запросы, ожидающие записи в SlowQuery (вне обработки запросов их некому записать)
+MAX_PENDING = 1000
+
+_reporting = ContextVar('slow_query_reporting', default=False)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_SPACES = re.compile(r'\s+')
+_ALIASES = re.compile(r'"(\w+)" (T\d+)\b')
+_SCANS = re.compile(r'\b(?:SCAN|Seq Scan on)\s+"?(\w+)"?')
+
+
+def get_setting(name):
+    return getattr(settings, 'SLOW_QUERIES', {}).get(name, DEFAULTS[name])
+
+
+# Нормализация
+def normalize(sql):
+    """SQL без значений: параметры и литералы - ?, списки - (...)"""
+    sql = _LITERALS.sub('?', sql)
+    sql = _LISTS.sub('(...)', sql)
+    sql = _ROWS.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:16]
+
+
+def describe_params(params):
+    """Количество и типы параметров и HMAC их значений, например '3: int×2, str [5f0c…]'"""
+    values = list(params.values()) if isinstance(params, dict) else list(params)
+    groups = []
+    for value in values:
+        name = type(value).__name__
+        if groups and groups[-1][0] == name:
+            groups[-1][1] += 1
+        else:
+            groups.append([name, 1])
+    types = ', '.join(name if count == 1 else f'{name}×{count}' for name, count in groups)
+    digest = salted_hmac('monitoring.slow_queries.params', repr(values)).hexdigest()[:12]
+    return f'{len(values)}: {types} [{digest}]'[:MAX_PARAMS_LENGTH]
+
+
+# Место вызова
+def call_site():
+    """(шаблон, строка кода проекта) ближайшие к выполняемому запросу"""
+    template = code = None
+    root = str(settings.BASE_DIR) + os.sep
+    own = os.path.dirname(__file__) + os.sep
+    frame = sys._getframe(1)
+    while frame is not None and (template is None or code is None):
+        filename = frame.f_code.co_filename
+        if template is None and frame.f_code is Template.render.__code__:
+            template = frame.f_locals['self'].name
+        elif (code is None and filename.startswith(root) and not filename.startswith(own)
+              and 'site-packages' not in filename):
+            code = f'{filename[len(root):]}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+    return template, code
+
+
+# План запроса
+def explain(connection, sql, params):
+    """Строки плана запроса или пустой список, если план не снимается"""
+    if not get_setting('EXPLAIN') or not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return []
+    # Курсор драйвера в обход обёрток выполнения Django
+    with connection.cursor() as cursor:
+        cursor.cursor.execute(f'{connection.ops.explain_prefix} {sql}', params)
+        rows = cursor.cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [' '.join(str(value) for value in row) for row in rows]
+
+
+def full_scans(sql, plan):
+    """Таблицы WATCHED_TABLES, которые план просматривает целиком"""
+    aliases = {alias: table for table, alias in _ALIASES.findall(sql)}
+    watched = get_setting('WATCHED_TABLES')
+    tables = []
+    for line in plan:
+        for name in _SCANS.findall(line):
+            table = aliases.get(name, name)
+            if table in watched and table not in tables:
+                tables.append(table)
+    return tables
+
+
+# Запись
+_explained = set()
+_pending = collections.deque(maxlen=MAX_PENDING)
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка выполнения SQL: запросы дольше THRESHOLD попадают в журнал"""
+    if _reporting.get() or not get_setting('ENABLED'):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - started
+    if duration >= get_setting('THRESHOLD'):
+        token = _reporting.set(True)
+        try:
+            report(context['connection'], sql, params, many, duration)
+        except Exception:
+            logger.exception('Не удалось разобрать медленный запрос')
+        finally:
+            _reporting.reset(token)
+    return result
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def report(connection, sql, params, many, duration):
+    """Пишет запрос в журнал и откладывает запись в SlowQuery до конца запроса"""
+    request_metrics = metrics.current()
+    view = request_metrics.view_name if request_metrics is not None else None
+    normalized = normalize(sql)
+    key = fingerprint(normalized)
+    template, code = call_site()
+    example_params = (params[0] if many and params else params) or ()
+    params_text = describe_params(example_params)
+
+    # План - один раз на отпечаток в процессе; при записи в SlowQuery
+    # сохраняется, только если отпечатка ещё нет в таблице
+    plan = None
+    if key not in _explained and not many:
+        _explained.add(key)
+        plan = explain(connection, sql, example_params)
+    scans = full_scans(sql, plan or [])
+
+    _pending.append({
+        'alias': connection.alias, 'fingerprint': key, 'sql': normalized, 'params': params_text,
+        'view': view or '', 'template': template or '', 'call_site': code or '',
+        'plan': plan, 'full_scans': scans, 'duration_ms': duration * 1000, 'seen': timezone.now(),
+    })
+    logger.warning(json.dumps({
+        'fingerprint': key,
+        'duration_ms': round(duration * 1000, 2),
+        'sql': normalized,
+        'params': params_text,
+        'view': view,
+        'template': template,
+        'call_site': code,
+        'full_scans': scans,
+    }, ensure_ascii=False))
+
+
+def flush(**kwargs):
+    """
+    Записывает отложенные запросы в SlowQuery (сигнал request_finished).
+    В обёртке выполнения писать нельзя: SQLite не открывает транзакцию, пока
+    курсор исходного запроса не дочитан.
+    """
+    if not _pending:
+        return
+    token = _reporting.set(True)
+    try:
+        while _pending:
+            entry = _pending.popleft()
+            try:
+                store(entry)
+            except Exception:
+                logger.exception('Не удалось записать медленный запрос %s', entry['fingerprint'])
+    finally:
+        _reporting.reset(token)
+
+
+def store(entry):
+    from .models import SlowQuery
+
+    using = entry['alias']
+    fields = {name: entry[name] for name in ('view', 'template', 'call_site', 'params')}
+    duration_ms = entry['duration_ms']
+    with transaction.atomic(using=using):
+        updated = SlowQuery.objects.using(using).filter(fingerprint=entry['fingerprint']).update(
+            count=F('count') + 1, total_ms=F('total_ms') + duration_ms,
+            max_ms=Greatest('max_ms', duration_ms), last_seen=entry['seen'], **fields)
+        if updated:
+            return
+        SlowQuery.objects.using(using).create(
+            fingerprint=entry['fingerprint'], sql=entry['sql'], plan='\n'.join(entry['plan'] or ()),
+            full_scans=','.join(entry['full_scans']), count=1, total_ms=duration_ms, max_ms=duration_ms,
+            last_seen=entry['seen'], **fields)
+    prune(using)
+
+
+def prune(using):
+    """Оставляет TOP_N отпечатков с наибольшим суммарным временем"""
+    from .models import SlowQuery
+
+    excess = list(SlowQuery.objects.using(using).order_by('-total_ms')
+                  .values_list('pk', flat=True)[get_setting('TOP_N'):])
+    if excess:
+        SlowQuery.objects.using(using).filter(pk__in=excess).delete()
@@ -0,0 +1,32 @@
+"""
+Шаблонный бэкенд Django с замером времени рендеринга (monitoring/metrics.py).
+
+Отличается от django.template.backends.django.DjangoTemplates только тем,
+что render() шаблона выполняется внутри metrics.template_timing(). Шаблоны,
+подключаемые через {% include %} и {% extends %}, рендерятся движком внутри
+внешнего шаблона и входят в его время.
+"""
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+from django.template.backends.django import Template as BaseTemplate
+from django.template.backends.django import reraise
+
+from .metrics import template_timing
+
+
+class Template(BaseTemplate):
+    def render(self, context=None, request=None):
+        with template_timing():
+            return super().render(context, request)
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import Product
+from . import index_advisor, profiling, prometheus
+
+
+class MetricsTests(TestCase):
+    """Метрики Prometheus: хранение значений и доступ к /metrics"""
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(METRICS={**settings.METRICS, 'DIRECTORY': self.directory,
+                                                     'TOKEN': 'secret'}))
+
+    def test_disabled_in_tests(self):
+        self.client.get(reverse('homepage'))
+        self.assertFalse(prometheus.get_setting('ENABLED'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_value_file(self):
+        key = json.dumps(['test_total', 'test_total', []])
+        path = os.path.join(self.directory, '1-1.db')
+        values = prometheus.ValueFile(path)
+        values.add(key, 2)
+        values.add(key, 3)
+        values.close()
+        self.assertTrue(values.file.closed)
+
+        self.assertEqual(prometheus.collect(), {key: 5.0})
+        # Файл открывается повторно с сохранёнными значениями
+        values = prometheus.ValueFile(path)
+        values.add(key, 1)
+        values.close()
+        self.assertEqual(prometheus.collect(), {key: 6.0})
+
+    def test_access_by_token(self):
+        url = reverse('metrics')
+        # Адрес прокси не даёт доступа без явного списка ALLOWED_IPS
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        with override_settings(METRICS={'DIRECTORY': self.directory, 'ALLOWED_IPS': ['192.0.2.10']}):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='192.0.2.10').status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    """Профилирование запросов с подписанным заголовком"""
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(PROFILING={**settings.PROFILING, 'ENABLED': True, 'SAMPLE_RATE': 0,
+                                                       'DIRECTORY': self.directory}))
+
+    def test_profile_saved_in_background(self):
+        futures = []
+        original = profiling.save_later
+
+        def save_later(*args):
+            futures.append(original(*args))
+            return futures[-1]
+
+        header = {profiling.get_setting('HEADER'): profiling.make_header_value()}
+        with mock.patch.object(profiling, 'save_later', save_later):
+            self.client.get(reverse('homepage'))
+            self.client.get(reverse('homepage'), headers=header)
+        self.assertEqual(len(futures), 1)
+        path = futures[0].result(timeout=10)
+        self.assertEqual(os.path.dirname(path), os.path.join(self.directory, 'homepage'))
+        self.assertTrue(os.path.isfile(path))
+
+
+class IndexAdvisorTests(TransactionTestCase):
+    """Подбор индексов: кандидат для фильтра с сортировкой и миграция с ним"""
+
+    def setUp(self):
+        Product.objects.bulk_create(
+            Product(name=f'Товар {i}', slug=f'item-{i}', description='Описание', price=100, dislikes_count=i % 3)
+            for i in range(50)
+        )
+
+    def test_candidate_and_migration(self):
+        sql, params = Product.objects.filter(dislikes_count=1).order_by('name').query.sql_with_params()
+        statement = index_advisor.Statement('products', index_advisor._qmark(sql), tuple(params), 10)
+        results = index_advisor.advise([statement], repeat=1)
+
+        self.assertEqual(len(results), 1)
+        result = results[0]
+        self.assertEqual(result['candidate'], index_advisor.Candidate(Product, ('dislikes_count', 'name'), None))
+        # Просмотр таблицы и сортировка заменены поиском по индексу
+        _, plan_before, plan_after = result['plans'][0]
+        self.assertTrue(any(line.startswith('SCAN') for line in plan_before))
+        self.assertFalse(any(line.startswith(('SCAN', 'USE TEMP B-TREE')) for line in plan_after))
+        self.assertEqual(result['rows_avoided'], 10 * 2 * 50)
+
+        path, text = index_advisor.write_migrations(results)['catalog']
+        namespace = {}
+        exec(compile(text, path, 'exec'), namespace)
+        migration = namespace['Migration'](os.path.basename(path)[:-3], 'catalog')
+        state = MigrationLoader(connection).project_state(migration.dependencies[0])
+        table = Product._meta.db_table
+        with connection.schema_editor() as editor:
+            migration.apply(state, editor)
+        try:
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(cursor, table)
+            self.assertEqual(constraints[result['index'].name]['columns'], ['dislikes_count', 'name'])
+        finally:
+            with connection.schema_editor() as editor:
+                editor.remove_index(Product, result['index'])
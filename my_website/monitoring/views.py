@@ -0,0 +1,26 @@
+import hmac
+
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.views import View
+
+from . import prometheus
+
+
+# Метрики Prometheus всех рабочих процессов (monitoring/prometheus.py)
+class MetricsView(View):
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def has_access(self, request):
+        # Токен для сборщика метрик или адрес из списка ALLOWED_IPS (по умолчанию пуст).
+        # REMOTE_ADDR без учёта прокси: за nginx это адрес самого прокси
+        token = prometheus.get_setting('TOKEN')
+        authorization = request.headers.get('Authorization', '')
+        if token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+            return True
+        return request.META.get('REMOTE_ADDR') in prometheus.get_setting('ALLOWED_IPS')
+
+    def get(self, request):
+        if not self.has_access(request):
+            raise PermissionDenied
+        return HttpResponse(prometheus.render(), content_type=self.content_type)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -21,6 +22,23 @@ MEDIA_URL = '/media/'
 # Фотография пользователя по умолчанию
 DEFAULT_USER_PHOTO = MEDIA_URL + 'users/default_photo.png'
 
+# Хранилища файлов. Изображения товаров и коллекций, фотографии пользователей и
+# загруженные файлы хранятся в 'media' - с дедупликацией по содержимому
+# (mediastore/storage.py) в том же каталоге MEDIA_ROOT
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'media': {'BACKEND': 'mediastore.storage.DedupStorage'},
+}
+
+# Загрузка больших файлов по частям (mediastore/sessions.py): каталог для частей,
+# размер части, максимальный размер файла и срок жизни незавершённой загрузки
+UPLOAD_SESSIONS = {
+    'DIRECTORY': BASE_DIR / 'var' / 'upload_sessions',
+    'CHUNK_SIZE': 5 * 1024 * 1024,
+    'MAX_SIZE': 5 * 1024 * 1024 * 1024,
+}
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
@@ -33,6 +51,10 @@ DEBUG = True # False
 ALLOWED_HOSTS = ['127.0.0.1']
 
 # Debug Toolbar settings
+# Панель отладки тяжёлая (записывает все запросы и шаблоны), поэтому
+# подключается только при DEBUG; DJANGO_DEBUG_TOOLBAR=0 отключает её и в
+# разработке (например, для замеров производительности).
+DEBUG_TOOLBAR = DEBUG and os.environ.get('DJANGO_DEBUG_TOOLBAR', '1') == '1'
 INTERNAL_IPS = ["127.0.0.1"]
 
 
@@ -42,31 +64,39 @@ INSTALLED_APPS = [
     'homepage.apps.HomepageConfig',
     'catalog.apps.CatalogConfig',
     'users.apps.UsersConfig',
+    'mediastore.apps.MediastoreConfig',
+    'monitoring.apps.MonitoringConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    "debug_toolbar",
 ]
 
 MIDDLEWARE = [
+    'monitoring.middleware.RequestMetricsMiddleware',
+    'monitoring.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Стандартный слой аутентификации, загрузка пользователя вне бюджета запросов
+    'monitoring.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(2, "debug_toolbar.middleware.DebugToolbarMiddleware")
+
 ROOT_URLCONF = 'my_website.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга (monitoring/templates.py)
+        'BACKEND': 'monitoring.templates.DjangoTemplates',
         'DIRS': [
             BASE_DIR / 'templates',
         ],
@@ -85,6 +115,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'my_website.wsgi.application'
 
+# Асинхронные представления каталога, товара и главной страницы (catalog/views.py).
+# Включаются при запуске под ASGI (my_website/asgi.py задаёт DJANGO_ASYNC_VIEWS=1):
+# под WSGI каждое асинхронное представление выполнялось бы в отдельном цикле событий.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '0') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -93,9 +128,134 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Блокировка записи берётся в начале транзакции (BEGIN IMMEDIATE), а не при
+        # первой записи - параллельные транзакции ждут до timeout секунд вместо
+        # ошибки "database is locked". WAL позволяет читать во время записи.
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
+    }
+}
+
+
+# Категории главного меню: {название в меню: slug категории}.
+# Если словарь пуст, меню строится из категорий с заполненным полем
+# "Позиция в главном меню" (Category.menu_position).
+TOP_CATEGORIES = {
+    'Женщинам': 'zhenskaya-odezhda',
+    'Мужчинам': 'muzhskaya-odezhda',
+    'Детям': 'detskaya-odezhda',
+}
+
+
+# Кэш
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Версии кэша (catalog/cache.py) сбрасываются сигналами, поэтому в продакшене
+# с несколькими процессами нужен общий бэкенд (Redis, Memcached).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'brandstack',
     }
 }
 
+# Полностраничный кэш списков для анонимных пользователей (catalog/page_cache.py).
+# TIMEOUT - сколько страница считается свежей, STALE_TIMEOUT - сколько устаревшая
+# страница отдаётся, пока другой запрос её пересобирает.
+
+PAGE_CACHE = {
+    'ENABLED': True,
+    'TIMEOUT': 60 * 5,
+    'STALE_TIMEOUT': 60,
+}
+
+
+# Буферизованная запись лайков/дизлайков (catalog/reaction_buffer.py).
+# Реакции пишутся в журнал процесса и сбрасываются в БД пачками раз в
+# FLUSH_INTERVAL секунд; наложение для пользователя хранится в общем кэше.
+
+REACTION_BUFFER = {
+    'ENABLED': False,
+    'DIRECTORY': BASE_DIR / 'var' / 'reaction_buffer',
+    'FLUSH_INTERVAL': 2.0,
+}
+
+
+# Замеры запросов (monitoring/middleware.py): заголовок Server-Timing и строка
+# JSON с числом SQL-запросов и временем в журнале monitoring.requests
+# (DJANGO_REQUEST_LOG=1, по строке на каждый запрос - для разбора нагрузки).
+
+REQUEST_METRICS = {
+    'SERVER_TIMING': True,
+    'LOG': os.environ.get('DJANGO_REQUEST_LOG') == '1',
+}
+
+# Метрики Prometheus (monitoring/prometheus.py): значения каждого потока пишутся
+# в свой файл в DIRECTORY, /metrics суммирует их по всем процессам. Каталог
+# очищается командой clear_metrics перед запуском сервера. DJANGO_METRICS=0
+# отключает запись; под тестами (TestRunner) метрики не пишутся.
+# Доступ к /metrics - с заголовком Authorization: Bearer <TOKEN>. ALLOWED_IPS
+# сверяется с REMOTE_ADDR, поэтому за обратным прокси (nginx) все запросы
+# приходят с его адреса, например 127.0.0.1: список адресов можно задавать,
+# только если к приложению обращаются напрямую, минуя прокси.
+
+METRICS = {
+    'ENABLED': os.environ.get('DJANGO_METRICS', '1') == '1',
+    'DIRECTORY': os.environ.get('DJANGO_METRICS_DIR', BASE_DIR / 'var' / 'metrics'),
+    'TOKEN': os.environ.get('DJANGO_METRICS_TOKEN', ''),
+    'ALLOWED_IPS': [],
+}
+
+# Профилирование запросов (monitoring/profiling.py): доля SAMPLE_RATE запросов
+# и запросы с подписанным заголовком X-Profile (команда profiling_header)
+# профилируются cProfile (MODE = 'cprofile') или сэмплером стеков
+# (MODE = 'sampler'). Файлы пишутся в DIRECTORY по именам маршрутов,
+# объединяются командой merge_profiles. При ENABLED = False слой отключён.
+
+PROFILING = {
+    'ENABLED': os.environ.get('DJANGO_PROFILING') == '1',
+    'MODE': os.environ.get('DJANGO_PROFILING_MODE', 'cprofile'),
+    'SAMPLE_RATE': float(os.environ.get('DJANGO_PROFILING_SAMPLE_RATE', '0.01')),
+    'DIRECTORY': os.environ.get('DJANGO_PROFILING_DIR', BASE_DIR / 'var' / 'profiles'),
+    'MAX_FILES': 100,
+}
+
+# Журнал медленных SQL-запросов (monitoring/slow_queries.py): запросы дольше
+# THRESHOLD секунд пишутся в журнал monitoring.slow_queries и копятся в модели
+# SlowQuery (админка) - TOP_N отпечатков с наибольшим суммарным временем.
+# План снимается один раз на отпечаток, полный просмотр WATCHED_TABLES
+# отмечается.
+
+SLOW_QUERIES = {
+    'ENABLED': True,
+    'THRESHOLD': float(os.environ.get('DJANGO_SLOW_QUERY_MS', '100')) / 1000,
+    'EXPLAIN': True,
+    'WATCHED_TABLES': ['catalog_product', 'catalog_review', 'catalog_productreaction'],
+    'TOP_N': 100,
+}
+
+# Под тестами метрики Prometheus не пишутся, а журналы monitoring выводятся
+# только с уровня ERROR (TestRunner)
+TEST_RUNNER = 'my_website.test_runner.TestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'monitoring': {
+            'handlers': ['console'],
+            'level': os.environ.get('DJANGO_MONITORING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -0,0 +1,32 @@
+"""
+Запуск тестов (TEST_RUNNER): метрики Prometheus не пишутся, журналы
+мониторинга не выводятся.
+"""
+
+import logging
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Метрики Prometheus на время тестов отключены (тесты метрик включают их
+    с временным каталогом). Журнал monitoring (строки запросов, превышение
+    бюджета запросов) пишется только с уровня ERROR; тесты, проверяющие
+    журнал, используют assertLogs.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._metrics_override = override_settings(METRICS={**settings.METRICS, 'ENABLED': False})
+        self._metrics_override.enable()
+        self._monitoring_logger = logging.getLogger('monitoring')
+        self._monitoring_level = self._monitoring_logger.level
+        self._monitoring_logger.setLevel(logging.ERROR)
+
+    def teardown_test_environment(self, **kwargs):
+        self._monitoring_logger.setLevel(self._monitoring_level)
+        self._metrics_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -18,23 +18,37 @@ from django.contrib import admin
 from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
+from catalog import urls as catalog_urls
 from catalog.views import page_not_found
+from homepage import urls as homepage_urls
+from monitoring.views import MetricsView
 
 admin.site.site_header = "Панель администрирования BrandStack"
 admin.site.index_title = "Интернет-магазин BrandStack"
 admin.site.site_title = "BrandStack Admin"
 
-urlpatterns = [
-    path('__debug__/', include('debug_toolbar.urls')),
-    path('admin/', admin.site.urls),
-    path('', include('homepage.urls')),
-    path('catalog/', include('catalog.urls')),
-    path('users/', include('users.urls', namespace='users')),
-]
-
-# Добавляем обработку медиа-файлов в режиме разработки
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+def get_urlpatterns(async_views):
+    """Маршруты сайта; async_views - асинхронные представления главной и каталога (под ASGI)"""
+    patterns = [
+        path('admin/', admin.site.urls),
+        path('', include(homepage_urls.get_urlpatterns(async_views))),
+        path('catalog/', include(catalog_urls.get_urlpatterns(async_views))),
+        path('users/', include('users.urls', namespace='users')),
+        path('uploads/', include('mediastore.urls', namespace='mediastore')),
+        path('metrics', MetricsView.as_view(), name='metrics'),
+    ]
+
+    # Добавляем обработку медиа-файлов в режиме разработки
+    if settings.DEBUG:
+        patterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+    if settings.DEBUG_TOOLBAR:
+        patterns.insert(0, path('__debug__/', include('debug_toolbar.urls')))
+    return patterns
+
+
+urlpatterns = get_urlpatterns(settings.ASYNC_VIEWS)
 
 
 handler404 = page_not_found
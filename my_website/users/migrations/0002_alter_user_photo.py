@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:42
+
+import mediastore.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=mediastore.storage.media_storage, upload_to='users/%Y/%m/%d/', verbose_name='Фотография'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
+from mediastore.storage import media_storage
+
 # Create your models here.
 
 
@@ -9,6 +11,7 @@ class User(AbstractUser):
         upload_to="users/%Y/%m/%d/",
         blank=True,
         null=True,
+        storage=media_storage,
         verbose_name="Фотография"
     )
     date_birth = models.DateTimeField(
@@ -13,6 +13,7 @@ class LoginUserView(LoginView):
     form_class = LoginUserForm
     template_name = 'users/login.html'
     extra_context = {'title': 'Авторизация'}
+    query_budget = 7
     
     def get_success_url(self):
         next_url = self.request.POST.get('next') or self.request.GET.get('next')